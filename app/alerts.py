@@ -0,0 +1,214 @@
+import threading
+from collections import deque
+
+# Пороги KPI с "max_source" без своих warning/critical — доли от max (как на фронте)
+MAX_WARNING_RATIO = 0.75
+MAX_CRITICAL_RATIO = 0.9
+# Сколько последних переходов состояния хранится для /api/alerts
+ALERT_HISTORY_SIZE = 200
+
+OPERATORS = {
+    ">=": lambda value, threshold: value >= threshold,
+    ">": lambda value, threshold: value > threshold,
+    "<=": lambda value, threshold: value <= threshold,
+    "<": lambda value, threshold: value < threshold,
+}
+
+class AlertRule:
+    """Правило: значение metric (KPI или ключ серии) op threshold дольше for_seconds.
+
+    threshold_key/ratio — порог как доля другого значения (KPI "<key>_max");
+    change — окно в секундах: сравнивается не значение, а скорость его
+    изменения в секунду за окно.
+    """
+
+    def __init__(self, name, metric, severity, threshold=None, op=">=", for_seconds=0,
+                 change=None, threshold_key=None, ratio=None, description=""):
+        if op not in OPERATORS:
+            raise ValueError(f"alert {name}: unknown operator {op!r}")
+        self.name = name
+        self.metric = metric
+        self.severity = severity
+        self.threshold = threshold
+        self.op = op
+        self.compare = OPERATORS[op]
+        self.for_seconds = for_seconds
+        self.change = change
+        self.threshold_key = threshold_key
+        self.ratio = ratio
+        self.description = description
+
+    def resolve_threshold(self, values):
+        if self.threshold_key is None:
+            return self.threshold
+        base = values.get(self.threshold_key)
+        return base * self.ratio if base else None
+
+def compile_rules(prominent, extra_rules=()):
+    """Правила из warning/critical в PROMINENT_METRICS и из ALERT_RULES."""
+    rules = []
+    for key, config in prominent.items():
+        for_seconds = config.get("for", 0)
+        description = config.get("description", "")
+        for severity in ("warning", "critical"):
+            if isinstance(config.get(severity), (int, float)):
+                rules.append(AlertRule(f"{key}:{severity}", key, severity, config[severity],
+                                       for_seconds=for_seconds, description=description))
+            elif "max_source" in config:
+                ratio = MAX_WARNING_RATIO if severity == "warning" else MAX_CRITICAL_RATIO
+                rules.append(AlertRule(f"{key}:{severity}", key, severity, threshold_key=key + "_max",
+                                       ratio=ratio, for_seconds=for_seconds, description=description))
+    for rule in extra_rules:
+        rules.append(AlertRule(rule["name"], rule["metric"], rule.get("severity", "warning"),
+                               rule.get("threshold"), rule.get("op", ">="), rule.get("for", 0),
+                               rule.get("change"), description=rule.get("description", "")))
+    return rules
+
+class _ChangeWindow:
+    """Скорость изменения значения в секунду за окно seconds."""
+
+    __slots__ = ("seconds", "points")
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.points = deque()
+
+    def add(self, timestamp, value):
+        self.points.append((timestamp, value))
+        while len(self.points) > 2 and self.points[1][0] <= timestamp - self.seconds:
+            self.points.popleft()
+        (start_ts, start), (end_ts, end) = self.points[0], self.points[-1]
+        if end_ts <= start_ts:
+            return None
+        return (end - start) / (end_ts - start_ts)
+
+class AlertEngine:
+    """Состояние алертов одной цели, пересчитывается после каждого скрейпа.
+
+    Каждое правило смотрит на одно значение последнего скрейпа, поэтому
+    evaluate стоит O(правил) и не зависит от истории и числа зрителей.
+    Состояния: pending (условие выполняется меньше for) -> firing -> resolved;
+    resolved приходит и для снятого pending, поле previous — прежнее состояние.
+    """
+
+    def __init__(self, instance, rules):
+        self.instance = instance
+        self.rules = rules
+        # {rule.name: {"state", "since", "value", "threshold"}} — только активные
+        self._active = {}
+        self._windows = {}
+        self._history = deque(maxlen=ALERT_HISTORY_SIZE)
+        self._lock = threading.Lock()
+
+    def _transition(self, rule, state, now, value, threshold):
+        return {
+            "alert": rule.name,
+            "instance": self.instance,
+            "metric": rule.metric,
+            "severity": rule.severity,
+            "state": state,
+            "value": value,
+            "threshold": threshold,
+            "at": now,
+            "description": rule.description
+        }
+
+    def set_rules(self, rules, now):
+        """Подменяет правила и возвращает переходы для удалённых.
+
+        Активные алерты правил, которых больше нет (удалены или
+        переименованы), снимаются переходом resolved; окна скорости
+        удалённых правил и правил со сменившимся change сбрасываются.
+        """
+        with self._lock:
+            if rules is self.rules:
+                return []
+            current = {rule.name: rule for rule in rules}
+            previous = {rule.name: rule for rule in self.rules}
+            transitions = []
+            for name in [name for name in self._active if name not in current]:
+                active = self._active.pop(name)
+                rule = previous.get(name)
+                if rule is not None:
+                    transitions.append(dict(self._transition(rule, "resolved", now, None, None),
+                                            previous=active["state"]))
+            for name, window in list(self._windows.items()):
+                rule = current.get(name)
+                if rule is None or rule.change != window.seconds:
+                    del self._windows[name]
+            self.rules = rules
+            self._history.extend(transitions)
+        return transitions
+
+    def evaluate(self, now, values):
+        """Проверяет правила по значениям скрейпа и возвращает переходы состояний."""
+        with self._lock:
+            transitions = [transition for rule in self.rules
+                           for transition in self._evaluate_rule(rule, now, values)]
+            self._history.extend(transitions)
+        return transitions
+
+    def _evaluate_rule(self, rule, now, values):
+        value = values.get(rule.metric)
+        if value is not None and rule.change:
+            window = self._windows.get(rule.name)
+            if window is None:
+                window = self._windows[rule.name] = _ChangeWindow(rule.change)
+            value = window.add(now, value)
+        threshold = rule.resolve_threshold(values)
+        active = self._active.get(rule.name)
+        if value is None or threshold is None or not rule.compare(value, threshold):
+            if active is not None:
+                del self._active[rule.name]
+                yield dict(self._transition(rule, "resolved", now, value, threshold), previous=active["state"])
+            return
+        if active is None:
+            active = self._active[rule.name] = {"state": "pending", "since": now}
+            if rule.for_seconds > 0:
+                yield self._transition(rule, "pending", now, value, threshold)
+        active["value"], active["threshold"] = value, threshold
+        if active["state"] == "pending" and now - active["since"] >= rule.for_seconds:
+            active["state"] = "firing"
+            active["firing_since"] = now
+            yield self._transition(rule, "firing", now, value, threshold)
+
+    def active(self):
+        """Текущие pending/firing алерты."""
+        result = []
+        with self._lock:
+            for rule in self.rules:
+                state = self._active.get(rule.name)
+                if state is not None:
+                    result.append(dict(self._transition(rule, state["state"], state["since"],
+                                                        state["value"], state["threshold"]),
+                                       firing_since=state.get("firing_since")))
+        return result
+
+    def history(self):
+        with self._lock:
+            return list(self._history)
+
+    def restore(self, active, history):
+        """Реплика: состояние алертов коллектора из приветствия фида."""
+        with self._lock:
+            self._active = {}
+            self._history.clear()
+            self._replay(active)
+            self._history.extend(history)
+
+    def replay(self, transitions):
+        """Реплика: применяет переходы, посчитанные коллектором."""
+        with self._lock:
+            self._replay(transitions)
+            self._history.extend(transitions)
+
+    def _replay(self, transitions):
+        for transition in transitions:
+            name = transition["alert"]
+            if transition["state"] == "resolved":
+                self._active.pop(name, None)
+                continue
+            active = self._active.setdefault(name, {"since": transition["at"]})
+            active.update(state=transition["state"], value=transition["value"], threshold=transition["threshold"])
+            if transition["state"] == "firing":
+                active["firing_since"] = transition.get("firing_since") or transition["at"]
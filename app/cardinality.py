@@ -0,0 +1,100 @@
+from .parser import FAMILY_SUFFIXES
+
+def family_name(name):
+    """Семейство метрики: base name без суффиксов _total, _count, _sum, ..."""
+    for suffix in FAMILY_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def series_group(name, labels, sample_type):
+    """Группа серии: _count/_sum/_bucket одного набора лейблов принимаются вместе.
+
+    У histogram в группу не входит лейбл le, у summary — quantile.
+    """
+    if sample_type == "histogram":
+        labels = tuple(pair for pair in labels if pair[0] != "le")
+    elif sample_type == "summary":
+        labels = tuple(pair for pair in labels if pair[0] != "quantile")
+    return family_name(name), labels
+
+class CardinalityGuard:
+    """Бюджет серий одной цели скрейпа.
+
+    Новая серия принимается, пока не превышены общий лимит max_series и
+    лимит на семейство max_per_family; сэмплы сверх бюджета отбрасываются
+    (счётчик dropped). Серии, которых не было дольше ttl секунд, вытесняются
+    (счётчик evicted) — их место освобождается для новых комбинаций лейблов.
+    Решение принимается по группе (series_group): если группа уже принята,
+    остальные её серии принимаются сверх лимита, чтобы у summary/histogram
+    не оказалось _count без _sum.
+    """
+
+    def __init__(self, max_series, max_per_family, ttl):
+        self.max_series = max_series
+        self.max_per_family = max_per_family
+        self.ttl = ttl
+        # {key: (group, last_seen)}
+        self._series = {}
+        self._families = {}
+        # {group: число принятых серий группы}
+        self._groups = {}
+        self.dropped = 0
+        self.evicted = 0
+        self._next_check = 0.0
+
+    def __len__(self):
+        return len(self._series)
+
+    def admit(self, sample, now):
+        """True, если сэмпл укладывается в бюджет (или его группа уже принята)."""
+        entry = self._series.get(sample.key)
+        if entry is not None:
+            self._series[sample.key] = (entry[0], now)
+            return True
+        group = series_group(sample.name, sample.labels, sample.type)
+        family = group[0]
+        count = self._families.get(family, 0)
+        members = self._groups.get(group, 0)
+        if not members and (len(self._series) >= self.max_series or count >= self.max_per_family):
+            self.dropped += 1
+            return False
+        self._series[sample.key] = (group, now)
+        self._families[family] = count + 1
+        self._groups[group] = members + 1
+        return True
+
+    def expire(self, now):
+        """Вытесняет устаревшие серии и возвращает их ключи.
+
+        Полный проход делается не чаще раза в ttl / 10 секунд.
+        """
+        if now < self._next_check:
+            return []
+        self._next_check = now + self.ttl / 10
+        cutoff = now - self.ttl
+        stale = [key for key, (_, last_seen) in self._series.items() if last_seen < cutoff]
+        for key in stale:
+            group, _ = self._series.pop(key)
+            family = group[0]
+            count = self._families[family] - 1
+            if count:
+                self._families[family] = count
+            else:
+                del self._families[family]
+            members = self._groups[group] - 1
+            if members:
+                self._groups[group] = members
+            else:
+                del self._groups[group]
+        self.evicted += len(stale)
+        return stale
+
+    def stats(self):
+        return {
+            "series": len(self._series),
+            "families": len(self._families),
+            "full_families": sum(1 for count in self._families.values() if count >= self.max_per_family),
+            "dropped": self.dropped,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,16 @@
+"""Коллектор production-режима: единственный процесс, который скрейпит цели.
+
+Запуск: python -m app.collector. Веб-воркеры (gunicorn -w N wsgi:app)
+получают от него состояние через Unix-сокет COLLECTOR_SOCKET.
+"""
+import threading
+from .config import COLLECTOR_SOCKET
+from .metrics import start_collector
+
+def main():
+    start_collector(COLLECTOR_SOCKET)
+    print(f"[COLLECTOR] serving feed on {COLLECTOR_SOCKET}")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,68 @@
-DASHBOARD_DEBUG = True  # Меняйте на True для включения debug-режима
+import os
+
+# Debug-режим: вместо METRICS_TARGETS скрейпится синтетический экспортёр
+# (app/simulation.py) с настройками SIMULATION или по умолчанию
+DASHBOARD_DEBUG = True
 METRICS_URL = "http://ваш-эндпоинт/metrics"
 UPDATE_INTERVAL = 1.0
 REQUEST_TIMEOUT = 3.0
-HISTORY_LENGTH = 60
+# Цели скрейпа: name — instance (своя история и KPI), interval/timeout
+# необязательны и по умолчанию равны UPDATE_INTERVAL/REQUEST_TIMEOUT
+METRICS_TARGETS = [
+    {"name": "amity", "url": METRICS_URL}
+]
+# Верхняя граница потоков скрейпа (и соединений в пуле сессии)
+SCRAPE_WORKERS = 32
+# Глубина сырой истории (точка на скрейп)
+HISTORY_SECONDS = 3600
+# Ярусы агрегатов для длинных окон: (шаг корзины, глубина) в секундах.
+# Память на серию: сумма (глубина / шаг) * 22 байта, для значений ниже ~100 КБ
+HISTORY_TIERS = [
+    (10, 6 * 3600),
+    (60, 24 * 3600),
+    (600, 7 * 24 * 3600)
+]
+# Бюджет серий на цель (app/cardinality.py): всего и на семейство метрики;
+# серии, не появлявшиеся SERIES_TTL секунд, вытесняются из памяти
+MAX_SERIES = 20000
+MAX_SERIES_PER_FAMILY = 2000
+SERIES_TTL = 600
+# Окно (сек) для скоростей счётчиков и средних Δsum/Δcount (app/rates.py)
+RATE_WINDOW = 60
+# История на диске (app/storage.py): каталог, длина сегмента и срок хранения.
+# Журнал открытого сегмента — 16 байт на сэмпл, после уплотнения — 8 байт
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "history_data")
+HISTORY_SEGMENT_SECONDS = 600
+HISTORY_RETENTION = 7 * 24 * 3600
+# Сколько хранить сырые строки: дальше на диске остаются только агрегаты
+# ярусов HISTORY_TIERS (не меньше HISTORY_SECONDS — с них поднимается память)
+HISTORY_RAW_RETENTION = 24 * 3600
+# Как часто фоновый поток уплотняет закрытые сегменты и удаляет старые
+HISTORY_MAINTENANCE_INTERVAL = 60
+# JS-ошибки с фронта (app/jserrors.py): лог с ротацией по размеру, сколько
+# уникальных ошибок держать в памяти и лимит на клиента (ошибок/сек, всплеск)
+JS_ERROR_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "js_error.log")
+JS_ERROR_LOG_MAX_BYTES = 5 * 1024 * 1024
+JS_ERROR_LOG_BACKUPS = 3
+JS_ERROR_RING_SIZE = 100
+JS_ERROR_RATE = 1.0
+JS_ERROR_BURST = 20
+# Режим симуляции (None — выключен, если не включён DASHBOARD_DEBUG):
+# {"series": 100000, "churn": 0.01, "counter_ratio": 0.5, "targets": 1, "interval": 1.0}
+# — синтетический узел Amity на series серий, churn — доля серий, сменяющих
+# лейбл за секунду; {"replay": "capture.prom", "speed": 10} — проигрывание
+# записанных скрейпов (python -m app.simulation record ...) в speed раз быстрее
+SIMULATION = None
+# Production-режим: коллектор (python -m app.collector) раздаёт состояние
+# веб-воркерам (gunicorn wsgi:app) через этот Unix-сокет
+COLLECTOR_SOCKET = "/tmp/amity_dashboard.sock"
+
+# METRICS_CONFIG, PROMINENT_METRICS, IGNORE_METRICS и ALERT_RULES ниже —
+# значения по умолчанию: файл DASHBOARD_CONFIG_PATH (JSON с секциями
+# metrics_config, prominent_metrics, ignore_metrics, alert_rules) их
+# переопределяет и перечитывается на лету (app/dashboard_config.py)
+DASHBOARD_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dashboard_config.json")
+DASHBOARD_CONFIG_POLL_INTERVAL = 2.0
 
 METRICS_CONFIG = [
     {
@@ -60,6 +120,8 @@ METRICS_CONFIG = [
     }
 ]
 
+# Источник значения KPI — поле "source" (см. app/kpi.py); без него имя и
+# лейблы берутся из ключа, значения подходящих серий суммируются
 PROMINENT_METRICS = {
     "tx_pool_size": {
         "title": "Tx Pool Size",
@@ -79,7 +141,14 @@ PROMINENT_METRICS = {
         "priority": 9,
         "warning": 3.0,
         "critical": 5.0,
-        "description": "Среднее время ответа на POST-запросы. Рост = угроза отказа."
+        "description": "Среднее время ответа на POST-запросы. Рост = угроза отказа.",
+        "source": {
+            "agg": "ratio",
+            "numerator": {"metric": "jetty_server_requests_seconds_sum", "labels": {"method": "POST"}},
+            "denominator": {"metric": "jetty_server_requests_seconds_count", "labels": {"method": "POST"}},
+            # Среднее за последнюю минуту, а не за всё время жизни процесса
+            "window": 60
+        }
     },
     "process_cpu_usage": {
         "title": "CPU Usage",
@@ -109,7 +178,12 @@ PROMINENT_METRICS = {
         "priority": 6,
         "warning": 1.0,
         "critical": 3.0,
-        "description": "Общее время пауз GC. Рост → лаги, сбои, паузы JVM."
+        "description": "Общее время пауз GC. Рост → лаги, сбои, паузы JVM.",
+        "source": {
+            "metric": "jvm_gc_pause_seconds_sum",
+            "labels": {"action": ["end of minor GC", "end of major GC"]},
+            "agg": "sum"
+        }
     },
     "postgres_connections{database=\"db01\"}": {
         "title": "Postgres Connections",
@@ -127,8 +201,9 @@ PROMINENT_METRICS = {
         "color": "#9b59b6",
         "format": "fixed0",
         "priority": 4,
-        "description": "Использование памяти JVM heap (долгоживущие объекты). При росте → давление на GC / OOM."
-        # warning/critical вычисляются на фронте по max
+        "description": "Использование памяти JVM heap (долгоживущие объекты). При росте → давление на GC / OOM.",
+        # warning/critical вычисляются на фронте по max (KPI "<ключ>_max")
+        "max_source": {"metric": "jvm_memory_max_bytes", "labels": {"area": "heap", "id": "Tenured Gen"}}
     },
     "system_load_average_1m": {
         "title": "System Load 1m",
@@ -182,6 +257,38 @@ PROMINENT_METRICS = {
     }
 }
 
+# Карточка KPI с длительностью последнего скрейпа (из самоинструментирования,
+# полные метрики дашборда — на /self/metrics)
+SELF_METRICS_KPI = False
+if SELF_METRICS_KPI:
+    PROMINENT_METRICS["self_scrape_duration_seconds"] = {
+        "title": "Scrape Duration",
+        "unit": "сек",
+        "color": "#95a5a6",
+        "format": "fixed2",
+        "priority": 0,
+        "warning": 0.5,
+        "critical": 2.0,
+        "description": "Длительность последнего скрейпа дашбордом. Рост → медленный экспортёр или сеть."
+    }
+
+# Дополнительные алерты сервера (app/alerts.py) к warning/critical из
+# PROMINENT_METRICS. metric — KPI или ключ серии; change — окно (сек), за
+# которое сравнивается скорость изменения в секунду; for — сколько секунд
+# условие должно держаться до firing (поле "for" есть и у PROMINENT_METRICS)
+ALERT_RULES = [
+    {
+        "name": "tx_pool_growth",
+        "metric": "tx_pool_size",
+        "change": 60,
+        "op": ">",
+        "threshold": 10,
+        "for": 30,
+        "severity": "warning",
+        "description": "Пул транзакций растёт быстрее 10 в секунду дольше 30 секунд."
+    }
+]
+
 IGNORE_METRICS = [
     # PostgreSQL
     "postgres_buffers_clean_total",
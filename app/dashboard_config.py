@@ -0,0 +1,233 @@
+"""Конфигурация дашборда из файла с горячей перезагрузкой.
+
+Файл DASHBOARD_CONFIG_PATH (JSON) может задавать секции metrics_config,
+prominent_metrics, ignore_metrics и alert_rules; отсутствующие берутся из
+app/config.py. Фоновый поток следит за файлом, проверяет и компилирует
+новую версию (фильтр метрик, план KPI, правила алертов) и подменяет ссылку
+на неё целиком — скрейп не останавливается. Ошибочный файл не применяется,
+остаётся прежняя конфигурация.
+
+    python -m app.dashboard_config > dashboard_config.json   # текущие значения
+    python -m app.dashboard_config dashboard_config.json     # проверить файл
+"""
+import json
+import numbers
+import os
+import re
+import sys
+import threading
+import time
+from .parser import MetricFilter, parse_series
+from .kpi import KpiPlan
+from .alerts import OPERATORS, compile_rules
+from .config import (METRICS_CONFIG, PROMINENT_METRICS, IGNORE_METRICS, ALERT_RULES, DASHBOARD_CONFIG_PATH,
+                     DASHBOARD_CONFIG_POLL_INTERVAL)
+
+# Секции файла и их значения по умолчанию
+DEFAULTS = {
+    "metrics_config": METRICS_CONFIG,
+    "prominent_metrics": PROMINENT_METRICS,
+    "ignore_metrics": IGNORE_METRICS,
+    "alert_rules": ALERT_RULES
+}
+
+def _number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+def _check_source(errors, where, source):
+    if not isinstance(source, dict):
+        errors.append(f"{where}: must be an object")
+    elif source.get("agg") == "ratio":
+        for part in ("numerator", "denominator"):
+            _check_source(errors, f"{where}.{part}", source.get(part))
+        if "window" in source and not (_number(source["window"]) and source["window"] > 0):
+            errors.append(f"{where}.window: must be a positive number")
+    elif not isinstance(source.get("metric"), str):
+        errors.append(f"{where}.metric: must be a string")
+
+def validate(sections):
+    """Список ошибок в секциях конфигурации (пустой — всё в порядке)."""
+    errors = []
+    metrics_config = sections["metrics_config"]
+    if not isinstance(metrics_config, list):
+        errors.append("metrics_config: must be a list")
+        metrics_config = []
+    seen = set()
+    for i, category in enumerate(metrics_config):
+        where = f"metrics_config[{i}]"
+        if not isinstance(category, dict) or not isinstance(category.get("category"), str):
+            errors.append(f"{where}: must be an object with a 'category' string")
+            continue
+        if category["category"] in seen:
+            errors.append(f"{where}: duplicate category {category['category']!r}")
+        seen.add(category["category"])
+        patterns = category.get("metrics")
+        if not isinstance(patterns, list) or not all(isinstance(pattern, str) for pattern in patterns):
+            errors.append(f"{where}.metrics: must be a list of regex strings")
+            continue
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                errors.append(f"{where}.metrics: bad regex {pattern!r}: {e}")
+
+    prominent = sections["prominent_metrics"]
+    if not isinstance(prominent, dict):
+        errors.append("prominent_metrics: must be an object")
+        prominent = {}
+    for key, kpi in prominent.items():
+        where = f"prominent_metrics[{key!r}]"
+        if not isinstance(kpi, dict):
+            errors.append(f"{where}: must be an object")
+            continue
+        try:
+            parse_series(key)
+        except ValueError as e:
+            errors.append(f"{where}: {e}")
+        for field in ("warning", "critical", "for"):
+            if field in kpi and not _number(kpi[field]):
+                errors.append(f"{where}.{field}: must be a number")
+        for field in ("source", "max_source"):
+            if field in kpi:
+                _check_source(errors, f"{where}.{field}", kpi[field])
+
+    ignore = sections["ignore_metrics"]
+    if not isinstance(ignore, list) or not all(isinstance(name, str) for name in ignore):
+        errors.append("ignore_metrics: must be a list of metric names")
+
+    rules = sections["alert_rules"]
+    if not isinstance(rules, list):
+        errors.append("alert_rules: must be a list")
+        rules = []
+    for i, rule in enumerate(rules):
+        where = f"alert_rules[{i}]"
+        if not isinstance(rule, dict) or not isinstance(rule.get("name"), str) \
+                or not isinstance(rule.get("metric"), str):
+            errors.append(f"{where}: must be an object with 'name' and 'metric' strings")
+            continue
+        if not _number(rule.get("threshold")):
+            errors.append(f"{where}.threshold: must be a number")
+        if rule.get("op", ">=") not in OPERATORS:
+            errors.append(f"{where}.op: expected one of {', '.join(OPERATORS)}")
+        for field in ("for", "change"):
+            if field in rule and not (_number(rule[field]) and rule[field] >= 0):
+                errors.append(f"{where}.{field}: must be a non-negative number")
+    return errors
+
+class DashboardConfig:
+    """Проверенная и скомпилированная конфигурация; после создания не меняется.
+
+    Рядом с исходными секциями лежат производные структуры, которые
+    коллектор и обработчики запросов берут готовыми.
+    """
+
+    def __init__(self, sections, version=1, source=None):
+        errors = validate(sections)
+        if errors:
+            raise ValueError("; ".join(errors))
+        self.metrics_config = sections["metrics_config"]
+        self.prominent = sections["prominent_metrics"]
+        self.ignore = sections["ignore_metrics"]
+        self.version = version
+        # source — файл, из которого загружена конфигурация (None — app/config.py)
+        self.source = source
+        self.loaded_at = time.time()
+        try:
+            self.metric_filter = MetricFilter(self.metrics_config, self.ignore)
+            self.kpi_plan = KpiPlan(self.prominent)
+            self.alert_rules = compile_rules(self.prominent, sections["alert_rules"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"cannot compile config: {e}")
+
+def read_sections(path):
+    """Секции из файла path поверх значений по умолчанию."""
+    with open(path, encoding="utf-8") as f:
+        loaded = json.load(f)
+    if not isinstance(loaded, dict):
+        raise ValueError("config file must contain a JSON object")
+    unknown = set(loaded) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown sections: {', '.join(sorted(unknown))}")
+    return dict(DEFAULTS, **loaded)
+
+def _initial():
+    if os.path.exists(DASHBOARD_CONFIG_PATH):
+        try:
+            return DashboardConfig(read_sections(DASHBOARD_CONFIG_PATH), source=DASHBOARD_CONFIG_PATH)
+        except (OSError, ValueError) as e:
+            print(f"[CONFIG] {DASHBOARD_CONFIG_PATH}: {e}; using app/config.py")
+    return DashboardConfig(dict(DEFAULTS))
+
+_current = _initial()
+# Ошибка последней попытки перезагрузки (None — применилась)
+last_error = None
+_listeners = []
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def current_config():
+    """Действующая конфигурация; вызывающий держит ссылку на одну версию."""
+    return _current
+
+def on_config_change(callback):
+    """callback(old, new) вызывается после подмены конфигурации."""
+    _listeners.append(callback)
+
+def reload_config(path=DASHBOARD_CONFIG_PATH):
+    """Перечитывает path; True — новая конфигурация применена."""
+    global _current, last_error
+    try:
+        sections = read_sections(path) if os.path.exists(path) else dict(DEFAULTS)
+        new = DashboardConfig(sections, _current.version + 1, path if os.path.exists(path) else None)
+    except (OSError, ValueError) as e:
+        last_error = str(e)
+        print(f"[CONFIG] {path}: {e}; keeping version {_current.version}")
+        return False
+    old, _current = _current, new
+    last_error = None
+    for callback in _listeners:
+        try:
+            callback(old, new)
+        except Exception as e:
+            print(f"[CONFIG] listener failed: {e}")
+    return True
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+def _watch(path, interval):
+    seen = _stat(path)
+    while True:
+        time.sleep(interval)
+        stat = _stat(path)
+        if stat != seen:
+            seen = stat
+            reload_config(path)
+
+def start_config_watcher(path=DASHBOARD_CONFIG_PATH, interval=DASHBOARD_CONFIG_POLL_INTERVAL):
+    """Запускает слежение за файлом конфигурации (один раз на процесс)."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, args=(path, interval), daemon=True)
+            _watcher.start()
+
+def main(argv):
+    if len(argv) > 1:
+        try:
+            DashboardConfig(read_sections(argv[1]), source=argv[1])
+        except (OSError, ValueError) as e:
+            print(f"{argv[1]}: {e}")
+            return 1
+        print(f"{argv[1]}: OK")
+        return 0
+    json.dump(DEFAULTS, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
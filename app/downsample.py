@@ -0,0 +1,99 @@
+import math
+import numpy as np
+
+# agg для /api/metrics/history: lttb сохраняет форму кривой, остальные —
+# агрегаты по равным корзинам (minmax — две точки на корзину)
+AGGREGATIONS = ("lttb", "avg", "min", "max", "minmax")
+# Наименьший max_points для agg: lttb всегда берёт первую и последнюю точку,
+# minmax — две точки на корзину; меньшее значение не выполнить
+MIN_POINTS = {"lttb": 3, "minmax": 2}
+
+def check_max_points(max_points, agg):
+    """Текст ошибки, если max_points нельзя выдержать для agg (None — всё в порядке)."""
+    if max_points is None or max_points == 0:
+        return None
+    minimum = MIN_POINTS.get(agg, 1)
+    if max_points < minimum:
+        return f"max_points must be 0 (no downsampling) or at least {minimum} for agg '{agg}'"
+    return None
+
+def to_numpy(timestamps, values):
+    """Массивы NumPy поверх array('d') без копирования, пропуски (NaN) убраны."""
+    timestamps = np.frombuffer(timestamps, dtype=np.float64)
+    values = np.frombuffer(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    return timestamps[present], values[present]
+
+def lttb(timestamps, values, max_points):
+    """Largest-Triangle-Three-Buckets: max_points точек, сохраняющих форму ряда.
+
+    Цикл идёт по корзинам (max_points итераций), внутри корзины всё векторно.
+    """
+    n = len(values)
+    if max_points >= n or max_points < 3:
+        return timestamps, values
+    every = (n - 2) / (max_points - 2)
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_ts = timestamps[end:next_end].mean()
+        avg_value = values[end:next_end].mean()
+        bucket_ts = timestamps[start:end]
+        bucket_values = values[start:end]
+        area = np.abs((timestamps[anchor] - avg_ts) * (bucket_values - values[anchor])
+                      - (timestamps[anchor] - bucket_ts) * (avg_value - values[anchor]))
+        anchor = start + int(area.argmax())
+        selected[i + 1] = anchor
+    return timestamps[selected], values[selected]
+
+def _buckets(array_, size, fill):
+    """(корзины, size) с дополнением хвоста значением fill."""
+    buckets = math.ceil(len(array_) / size)
+    padded = np.full(buckets * size, fill)
+    padded[:len(array_)] = array_
+    return padded.reshape(buckets, size)
+
+def bucket_aggregate(timestamps, values, max_points, agg):
+    """Агрегация по равным корзинам: avg/min/max или пара min+max на корзину."""
+    n = len(values)
+    if max_points >= n or max_points < 1:
+        return timestamps, values
+    if agg == "minmax":
+        size = math.ceil(n / max(1, max_points // 2))
+    else:
+        size = math.ceil(n / max_points)
+    ts = _buckets(timestamps, size, np.nan)
+    vals = _buckets(values, size, np.nan)
+    if agg == "avg":
+        return np.nanmean(ts, axis=1), np.nanmean(vals, axis=1)
+    if agg in ("min", "max"):
+        index = np.nanargmin(vals, axis=1) if agg == "min" else np.nanargmax(vals, axis=1)
+        rows = np.arange(len(vals))
+        return ts[rows, index], vals[rows, index]
+    # minmax: обе экстремальные точки корзины в порядке времени
+    rows = np.arange(len(vals))
+    low, high = np.nanargmin(vals, axis=1), np.nanargmax(vals, axis=1)
+    first, second = np.minimum(low, high), np.maximum(low, high)
+    order = np.column_stack((first, second))
+    keep = np.ones(order.shape, dtype=bool)
+    keep[:, 1] = first != second
+    return ts[rows[:, None], order][keep], vals[rows[:, None], order][keep]
+
+def downsample(timestamps, values, max_points, agg="lttb"):
+    """Сжимает ряд (array('d') с NaN-пропусками) до max_points точек [ts, value]."""
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"unknown agg {agg!r}, expected one of {', '.join(AGGREGATIONS)}")
+    error = check_max_points(max_points, agg)
+    if error:
+        raise ValueError(error)
+    timestamps, values = to_numpy(timestamps, values)
+    if max_points:
+        if agg == "lttb":
+            timestamps, values = lttb(timestamps, values, max_points)
+        else:
+            timestamps, values = bucket_aggregate(timestamps, values, max_points, agg)
+    return np.column_stack((timestamps, values)).tolist()
@@ -0,0 +1,138 @@
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from .snapshot import encode_json
+
+# Кадр фида: длина (4 байта, big-endian) и JSON-сообщение
+HEADER = struct.Struct("!I")
+# Сколько сообщений ждёт отправки одному воркеру; отставший воркер
+# отключается и при переподключении получает состояние заново
+FEED_QUEUE_SIZE = 1024
+RECONNECT_INTERVAL = 1.0
+
+def encode_frame(message):
+    body = encode_json(message)
+    return HEADER.pack(len(body)) + body
+
+def _read_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("feed closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+class _Subscriber:
+    __slots__ = ("conn", "queue", "ready", "closed")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = deque()
+        self.ready = threading.Event()
+        self.closed = False
+
+class FeedServer:
+    """Сторона коллектора: раздаёт воркерам состояние через Unix-сокет.
+
+    Подключившийся воркер сначала получает приветствия on_connect()
+    (полное состояние целей), затем — сообщения publish() по мере скрейпов.
+    Сообщение сериализуется один раз на всех; у каждого воркера своя очередь
+    и поток отправки, так что медленный воркер не тормозит коллектор.
+    """
+
+    def __init__(self, path, on_connect):
+        self.path = path
+        self.on_connect = on_connect
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _accept(self):
+        while True:
+            conn, _ = self._sock.accept()
+            subscriber = _Subscriber(conn)
+            # Подписка раньше приветствия: сообщения, опубликованные пока оно
+            # собирается, встанут в очередь после него (дубликаты реплика отбросит)
+            with self._lock:
+                self._subscribers.append(subscriber)
+            try:
+                hello = [encode_frame(message) for message in self.on_connect()]
+            except Exception as e:
+                print(f"[FEED] hello failed: {e}")
+                self._drop(subscriber)
+                continue
+            subscriber.queue.extendleft(reversed(hello))
+            subscriber.ready.set()
+            threading.Thread(target=self._send, args=(subscriber,), daemon=True).start()
+
+    def publish(self, message):
+        frame = encode_frame(message)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if len(subscriber.queue) >= FEED_QUEUE_SIZE:
+                self._drop(subscriber)
+                continue
+            subscriber.queue.append(frame)
+            subscriber.ready.set()
+
+    def _send(self, subscriber):
+        try:
+            while not subscriber.closed:
+                subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.queue:
+                    subscriber.conn.sendall(subscriber.queue.popleft())
+        except OSError:
+            pass
+        finally:
+            self._drop(subscriber)
+
+    def _drop(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        subscriber.closed = True
+        subscriber.ready.set()
+        try:
+            subscriber.conn.close()
+        except OSError:
+            pass
+
+def subscribe(path, on_message):
+    """Сторона воркера: читает фид коллектора, переподключаясь при обрыве.
+
+    on_message вызывается для каждого сообщения по порядку; после
+    переподключения первыми снова идут приветствия.
+    """
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            while True:
+                size, = HEADER.unpack(_read_exact(sock, HEADER.size))
+                on_message(json.loads(_read_exact(sock, size)))
+        except (OSError, ConnectionError) as e:
+            print(f"[FEED] {path}: {e}")
+        finally:
+            sock.close()
+        time.sleep(RECONNECT_INTERVAL)
@@ -0,0 +1,363 @@
+from array import array
+from bisect import bisect_left
+
+NAN = float("nan")
+
+def _segments(capacity, first_seq, last_seq):
+    """Физические диапазоны слотов [lo, hi) для строк first_seq..last_seq."""
+    if first_seq > last_seq:
+        return []
+    lo = (first_seq - 1) % capacity
+    hi = (last_seq - 1) % capacity + 1
+    if lo < hi:
+        return [(lo, hi)]
+    return [(lo, capacity), (0, hi)]
+
+class _HistoryReader:
+    """Общие операции чтения над timestamps/columns кольцевого буфера."""
+
+    def first_seq(self):
+        """Номер самой старой строки в буфере."""
+        return self.seq - min(self.seq, self.capacity) + 1
+
+    def segments(self, first_seq, last_seq):
+        return _segments(self.capacity, max(first_seq, self.first_seq()), min(last_seq, self.seq))
+
+    def seq_at(self, timestamp):
+        """Номер первой строки с меткой времени >= timestamp (бинарный поиск)."""
+        first = self.first_seq()
+        passed = 0
+        for lo, hi in self.segments(first, self.seq):
+            if self.timestamps[hi - 1] >= timestamp:
+                return first + passed + bisect_left(self.timestamps, timestamp, lo, hi) - lo
+            passed += hi - lo
+        return self.seq + 1
+
+    def view(self, key, first_seq=1, last_seq=None):
+        """Срезы memoryview (timestamps, values) без копирования данных."""
+        column = self.columns.get(key)
+        if column is None:
+            return []
+        if last_seq is None:
+            last_seq = self.seq
+        timestamps = memoryview(self.timestamps)
+        values = memoryview(column)
+        return [(timestamps[lo:hi], values[lo:hi]) for lo, hi in self.segments(first_seq, last_seq)]
+
+    def arrays(self, key, first_seq=1, last_seq=None):
+        """Копии (timestamps, values) строк first_seq..last_seq одним куском.
+
+        Пропуски остаются NaN, строки выровнены между сериями.
+        """
+        timestamps, values = array('d'), array('d')
+        for ts_view, value_view in self.view(key, first_seq, last_seq):
+            timestamps.frombytes(ts_view.cast('B'))
+            values.frombytes(value_view.cast('B'))
+        return timestamps, values
+
+    def points(self, key, first_seq=1, last_seq=None):
+        """Точки [timestamp, value] серии, пропуски (NaN) отбрасываются."""
+        result = []
+        for timestamps, values in self.view(key, first_seq, last_seq):
+            result.extend([ts, value] for ts, value in zip(timestamps, values) if value == value)
+        return result
+
+class HistoryStore(_HistoryReader):
+    """Кольцевой буфер истории в колоночном виде.
+
+    Одна общая колонка timestamps и по колонке array('d') на серию,
+    пропущенный сэмпл хранится как NaN. Строки нумеруются по порядку
+    (seq = 1, 2, ...), строка seq лежит в слоте (seq - 1) % capacity.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', [NAN]) * capacity
+        self.columns = {}
+        self.seq = 0
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def clear(self):
+        self.timestamps = array('d', [NAN]) * self.capacity
+        self.columns = {}
+        self.seq = 0
+
+    def append(self, timestamp, values):
+        """Добавляет строку {key: value}; серии без значения получают NaN.
+
+        Строка с той же меткой времени, что и последняя, не добавляется,
+        а дописывается в последнюю (дедупликация по timestamp).
+        """
+        if self.seq and self.timestamps[(self.seq - 1) % self.capacity] == timestamp:
+            for key, value in values.items():
+                self.set_latest(key, value)
+            return
+        slot = self.seq % self.capacity
+        get = values.get
+        for key, column in self.columns.items():
+            column[slot] = get(key, NAN)
+        for key, value in values.items():
+            if key not in self.columns:
+                column = self.columns[key] = array('d', [NAN]) * self.capacity
+                column[slot] = value
+        self.timestamps[slot] = timestamp
+        self.seq += 1
+
+    def load(self, timestamps, columns, seq=None, missing_timestamp=None):
+        """Заполняет пустой буфер готовыми колонками (array('d') одной длины).
+
+        Берутся последние capacity строк; используется при старте для
+        загрузки истории с диска. seq — номер последней строки (реплика
+        берёт его у коллектора, чтобы курсоры совпадали), по умолчанию — их число.
+        missing_timestamp — метка строк, которых нет на диске, если не
+        загружено ни одной.
+        """
+        n = min(len(timestamps), self.capacity)
+        self.clear()
+        seq = n if seq is None else seq
+        self.seq = seq
+        skip = len(timestamps) - n
+        if n:
+            # Строки seq-n+1..seq ложатся в свои слоты кольца, возможно с переносом
+            first = (seq - n) % self.capacity
+            head = min(n, self.capacity - first)
+            self.timestamps[first:first + head] = timestamps[skip:skip + head]
+            self.timestamps[:n - head] = timestamps[skip + head:]
+            for key, values in columns.items():
+                column = self.columns[key] = array('d', [NAN]) * self.capacity
+                column[first:first + head] = values[skip:skip + head]
+                column[:n - head] = values[skip + head:]
+        # Строки, которых нет на диске, остаются пустыми; метки времени —
+        # как у первой загруженной, чтобы бинарный поиск видел монотонный ряд
+        fill = timestamps[skip] if n else missing_timestamp
+        if fill is not None:
+            for missing in range(self.first_seq(), seq - n + 1):
+                self.timestamps[(missing - 1) % self.capacity] = fill
+
+    def rows(self, first_seq=1):
+        """Строки (timestamp, {key: value}) начиная с first_seq, без пропусков."""
+        for seq in range(max(first_seq, self.first_seq()), self.seq + 1):
+            slot = (seq - 1) % self.capacity
+            values = {key: column[slot] for key, column in self.columns.items() if column[slot] == column[slot]}
+            yield self.timestamps[slot], values
+
+    def nbytes(self):
+        return 8 * self.capacity * (len(self.columns) + 1)
+
+    def drop(self, keys):
+        """Удаляет колонки серий keys (опубликованные срезы их сохраняют)."""
+        for key in keys:
+            self.columns.pop(key, None)
+
+    def set_latest(self, key, value):
+        """Записывает значение серии в последнюю строку."""
+        if not self.seq:
+            return
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = array('d', [NAN]) * self.capacity
+        column[(self.seq - 1) % self.capacity] = value
+
+    def snapshot(self):
+        return HistoryView(self)
+
+class HistoryView(_HistoryReader):
+    """Срез истории на момент публикации снапшота, читается без lock.
+
+    Колонка timestamps копируется (capacity * 8 байт), колонки значений
+    читаются из живого буфера. Единственный писатель — коллектор — за время
+    чтения может перезаписать только самые старые слоты, поэтому после
+    чтения такие строки отбрасываются. Писатель заполняет слот раньше, чем
+    увеличивает seq, поэтому отбрасывается и одна строка сверх видимых по
+    seq перезаписей — слот, который append пишет прямо сейчас.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.capacity = store.capacity
+        self.seq = store.seq
+        self.timestamps = array('d', store.timestamps)
+        self.columns = dict(store.columns)
+
+    def _valid_seq(self):
+        """Номер самой старой строки, которую коллектор точно не перезаписал."""
+        return self.store.seq - self.capacity + 2
+
+    def _overwritten(self, first_seq):
+        """Сколько строк начиная с first_seq коллектор уже мог перезаписать."""
+        return max(0, self._valid_seq() - max(first_seq, self.first_seq()))
+
+    def arrays(self, key, first_seq=1, last_seq=None):
+        timestamps, values = super().arrays(key, first_seq, last_seq)
+        skip = self._overwritten(first_seq)
+        if skip:
+            del timestamps[:skip]
+            del values[:skip]
+        return timestamps, values
+
+    def points(self, key, first_seq=1, last_seq=None):
+        result = super().points(key, first_seq, last_seq)
+        valid_seq = self._valid_seq()
+        if result and valid_seq > max(first_seq, self.first_seq()):
+            if valid_seq > self.seq:
+                return []
+            cutoff = self.timestamps[(valid_seq - 1) % self.capacity]
+            skip = 0
+            while skip < len(result) and result[skip][0] < cutoff:
+                skip += 1
+            del result[:skip]
+        return result
+
+class _RollupColumn:
+    """Агрегаты одной серии по корзинам яруса."""
+
+    __slots__ = ("min", "max", "sum", "count", "last")
+
+    def __init__(self, capacity):
+        # min/max/last — float32: для графиков точности хватает, памяти вдвое меньше
+        self.min = array('f', [NAN]) * capacity
+        self.max = array('f', [NAN]) * capacity
+        self.sum = array('d', [0.0]) * capacity
+        self.count = array('H', [0]) * capacity
+        self.last = array('f', [NAN]) * capacity
+
+    def reset(self, slot):
+        self.min[slot] = self.max[slot] = self.last[slot] = NAN
+        self.sum[slot] = 0.0
+        self.count[slot] = 0
+
+    def add(self, slot, value):
+        count = self.count[slot]
+        if count:
+            if value < self.min[slot]:
+                self.min[slot] = value
+            elif value > self.max[slot]:
+                self.max[slot] = value
+        else:
+            self.min[slot] = self.max[slot] = value
+        self.sum[slot] += value
+        if count < 0xFFFF:
+            self.count[slot] = count + 1
+        self.last[slot] = value
+
+    def merge(self, slot, minimum, maximum, total, count, last):
+        """Вливает в корзину уже посчитанные агрегаты (восстановление с диска)."""
+        if self.count[slot]:
+            self.min[slot] = min(self.min[slot], minimum)
+            self.max[slot] = max(self.max[slot], maximum)
+        else:
+            self.min[slot], self.max[slot] = minimum, maximum
+        self.sum[slot] += total
+        self.count[slot] = min(0xFFFF, self.count[slot] + count)
+        self.last[slot] = last
+
+class RollupTier(_HistoryReader):
+    """Ярус истории: корзина на step секунд, хранит min/max/avg/last по серии.
+
+    Корзины нумеруются как строки HistoryStore, поэтому seq_at/segments
+    работают так же. Память на серию: capacity * 22 байта.
+    """
+
+    FIELDS = ("avg", "min", "max", "last")
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.timestamps = array('d', [NAN]) * capacity
+        self.columns = {}
+        self.seq = 0
+
+    def _bucket(self, bucket_ts):
+        """Слот корзины bucket_ts; новая корзина занимает самый старый слот."""
+        if not self.seq or bucket_ts > self.timestamps[(self.seq - 1) % self.capacity]:
+            slot = self.seq % self.capacity
+            for column in self.columns.values():
+                column.reset(slot)
+            self.timestamps[slot] = bucket_ts
+            self.seq += 1
+        return (self.seq - 1) % self.capacity
+
+    def _column(self, key):
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = _RollupColumn(self.capacity)
+        return column
+
+    def add(self, timestamp, values):
+        """Добавляет значения скрейпа в корзину, куда попадает timestamp."""
+        slot = self._bucket(timestamp - timestamp % self.step)
+        for key, value in values.items():
+            self._column(key).add(slot, value)
+
+    def merge(self, bucket_ts, aggregates):
+        """Вливает агрегаты корзины {key: (min, max, sum, count, last)}."""
+        slot = self._bucket(bucket_ts)
+        for key, aggregate in aggregates.items():
+            self._column(key).merge(slot, *aggregate)
+
+    def arrays(self, key, first_seq=1, field="avg"):
+        """(timestamps, values) корзин начиная с first_seq; пустые корзины — NaN."""
+        timestamps, values = array('d'), array('d')
+        column = self.columns.get(key)
+        if column is None:
+            return timestamps, values
+        for lo, hi in self.segments(first_seq, self.seq):
+            timestamps.frombytes(memoryview(self.timestamps)[lo:hi].cast('B'))
+            if field == "avg":
+                values.fromlist([total / count if count else NAN
+                                 for total, count in zip(column.sum[lo:hi], column.count[lo:hi])])
+            else:
+                values.fromlist(getattr(column, field)[lo:hi].tolist())
+        # Читаем без lock: корзины, перезаписанные коллектором за время чтения, отбрасываем
+        # (и ещё одну — _bucket очищает слот раньше, чем увеличивает seq)
+        skip = max(0, self.seq - self.capacity + 2 - max(first_seq, self.first_seq()))
+        if skip:
+            del timestamps[:skip]
+            del values[:skip]
+        return timestamps, values
+
+class Rollups:
+    """Набор ярусов от мелкого к крупному, обновляется на каждом скрейпе."""
+
+    def __init__(self, tiers):
+        # tiers: [(step, retention_seconds), ...] от мелкого к крупному
+        self.tiers = [RollupTier(step, int(retention // step)) for step, retention in tiers]
+
+    def add(self, timestamp, values):
+        for tier in self.tiers:
+            tier.add(timestamp, values)
+
+    def nbytes(self):
+        return sum(tier.capacity * (8 + 22 * len(tier.columns)) for tier in self.tiers)
+
+    def drop(self, keys):
+        for tier in self.tiers:
+            for key in keys:
+                tier.columns.pop(key, None)
+
+    def retention(self):
+        """Глубина самого длинного яруса в секундах."""
+        return max((tier.step * tier.capacity for tier in self.tiers), default=0)
+
+    def choose(self, window, max_points, raw_step, raw_retention):
+        """Ярус для окна window секунд или None, если хватает сырой истории.
+
+        Берётся самый грубый источник, который покрывает окно и даёт не
+        меньше max_points точек; без max_points — самый детальный из покрывающих.
+        Источник покрывает окно с допуском в один свой шаг.
+        """
+        sources = [(raw_step, raw_retention, None)]
+        sources += [(tier.step, tier.step * tier.capacity, tier) for tier in self.tiers]
+        covering = [source for source in sources if source[1] + source[0] >= window]
+        if not covering:
+            return max(sources, key=lambda source: source[1])[2]
+        if max_points:
+            fine_enough = [source for source in covering if source[0] <= window / max_points]
+            if fine_enough:
+                return max(fine_enough, key=lambda source: source[0])[2]
+        return min(covering, key=lambda source: source[0])[2]
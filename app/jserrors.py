@@ -0,0 +1,216 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import deque
+from .selfmetrics import registry
+from .config import (JS_ERROR_LOG_PATH, JS_ERROR_LOG_MAX_BYTES, JS_ERROR_LOG_BACKUPS, JS_ERROR_RING_SIZE,
+                     JS_ERROR_RATE, JS_ERROR_BURST)
+
+# Очередь между обработчиком запроса и писателем; при переполнении ошибки отбрасываются
+JS_ERROR_QUEUE_SIZE = 1000
+# Писатель копит пачку не дольше стольких секунд
+FLUSH_INTERVAL = 1.0
+# Стек длиннее обрезается: одна ошибка не должна раздувать память и лог
+MAX_ERROR_LENGTH = 8192
+# Клиенты без ошибок дольше этого (сек) забываются ограничителем
+CLIENT_IDLE_SECONDS = 600
+# Как часто коллектор проверяет размер лога в production-режиме
+ROTATE_CHECK_INTERVAL = 30
+
+def fingerprint(context, error):
+    """Ключ дедупликации: контекст плюс хэш текста ошибки."""
+    return context + ":" + hashlib.sha1(error.encode("utf-8", "replace")).hexdigest()[:16]
+
+class RateLimiter:
+    """Token bucket на клиента: rate ошибок в секунду, всплеск до burst."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        # {client: [токены, время последнего пополнения]}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0
+
+    def allow(self, client, now):
+        with self._lock:
+            if now >= self._next_prune:
+                self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                                 if now - bucket[1] < CLIENT_IDLE_SECONDS}
+                self._next_prune = now + CLIENT_IDLE_SECONDS
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+class JsErrorLog:
+    """Приём JS-ошибок с фронта: запрос только кладёт ошибку в очередь.
+
+    Фоновый писатель забирает пачку, схлопывает одинаковые ошибки (контекст
+    плюс хэш текста) в одну запись со счётчиком и дописывает лог одним
+    write; файл ротируется по размеру. Последние уникальные ошибки — в
+    кольце deque для GET /log-js-error и /debug.
+
+    В production-режиме лог пишут несколько воркеров: каждый только
+    дописывает (O_APPEND, пачка — один write), а ротирует единственный
+    коллектор (start_rotation), так что бэкапы .1..N никто не затирает.
+    """
+
+    def __init__(self, path, max_bytes, backups, ring_size, rate, burst):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.limiter = RateLimiter(rate, burst)
+        self.queue = queue.Queue(JS_ERROR_QUEUE_SIZE)
+        self._ring = deque()
+        self._ring_size = ring_size
+        # {fingerprint: запись в кольце} — повтор увеличивает count у записи
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._writer = None
+        # False — процесс только дописывает лог, ротацией занимается коллектор
+        self.rotate = True
+        self._rotator = None
+        self.received = 0
+        self.limited = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    def submit(self, client, context, error):
+        """Ставит ошибку в очередь; False — отброшена (лимит клиента или очередь полна)."""
+        now = time.time()
+        if not self.limiter.allow(client, now):
+            self.limited += 1
+            return False
+        try:
+            self.queue.put_nowait((now, str(context)[:200], str(error)[:MAX_ERROR_LENGTH]))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.received += 1
+        if self._writer is None:
+            self._start()
+        return True
+
+    def _start(self):
+        # Писатель поднимается при первой ошибке, а не при импорте
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < JS_ERROR_QUEUE_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(self._merge(batch))
+            except OSError as e:
+                self.write_errors += 1
+                print(f"[JS ERROR] не удалось записать {self.path}: {e}")
+
+    def _merge(self, batch):
+        """Схлопывает пачку и обновляет кольцо; возвращает строки для лога."""
+        groups = {}
+        for timestamp, context, error in batch:
+            key = fingerprint(context, error)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [timestamp, context, error, 1]
+            else:
+                group[3] += 1
+        lines = []
+        with self._lock:
+            for key, (timestamp, context, error, count) in groups.items():
+                entry = self._entries.get(key)
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+                if entry is not None:
+                    entry["count"] += count
+                    entry["last_seen"] = timestamp
+                    # Повтор известной ошибки — одна строка без стека
+                    lines.append(f"[{stamp}] [JS ERROR] {context} #{key[-16:]} повтор x{count} (всего {entry['count']})\n")
+                    continue
+                if len(self._ring) >= self._ring_size:
+                    del self._entries[self._ring.popleft()["fingerprint"]]
+                entry = {"context": context, "error": error, "count": count, "fingerprint": key,
+                         "first_seen": timestamp, "last_seen": timestamp}
+                self._ring.append(entry)
+                self._entries[key] = entry
+                lines.append(f"[{stamp}] [JS ERROR] {context} #{key[-16:]} x{count}\n{error}\n\n")
+        return lines
+
+    def _write(self, lines):
+        data = "".join(lines).encode("utf-8", "replace")
+        if self.rotate:
+            self._rotate_if_full(len(data))
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _rotate_if_full(self, incoming=0):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + incoming > self.max_bytes:
+            self._rotate()
+
+    def _rotation_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self._rotate_if_full()
+            except OSError as e:
+                print(f"[JS ERROR] не удалось ротировать {self.path}: {e}")
+
+    def start_rotation(self, interval=ROTATE_CHECK_INTERVAL):
+        """Production: ротация лога по таймеру в коллекторе (воркеры только дописывают)."""
+        with self._lock:
+            if self._rotator is None:
+                self._rotator = threading.Thread(target=self._rotation_loop, args=(interval,), daemon=True)
+                self._rotator.start()
+
+    def _rotate(self):
+        """js_error.log -> .1 -> .2 ...; старше backups удаляется."""
+        for index in range(self.backups, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if not self.backups:
+            os.remove(self.path)
+
+    def recent(self, limit=None):
+        """Последние уникальные ошибки, от старых к новым (копии записей)."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._ring]
+        return entries[-limit:] if limit else entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ring)
+
+js_errors = JsErrorLog(JS_ERROR_LOG_PATH, JS_ERROR_LOG_MAX_BYTES, JS_ERROR_LOG_BACKUPS, JS_ERROR_RING_SIZE,
+                       JS_ERROR_RATE, JS_ERROR_BURST)
+
+registry.gauge("amity_dashboard_js_errors_total", "JS errors reported by browsers, by outcome.", ("outcome",),
+               lambda: [(("accepted",), js_errors.received), (("rate_limited",), js_errors.limited),
+                        (("dropped",), js_errors.dropped)], "counter")
+registry.gauge("amity_dashboard_js_error_queue", "JS errors waiting for the background writer.", (),
+               lambda: [((), js_errors.queue.qsize())])
@@ -0,0 +1,138 @@
+from .parser import parse_series
+from .rates import CounterWindow
+
+# Предел кэша маршрутов серий (по key); при переполнении кэш сбрасывается
+ROUTE_CACHE_SIZE = 100000
+
+# Поддерживаемые агрегации источника KPI
+AGGREGATIONS = ("sum", "last", "min", "max")
+
+class KpiPlan:
+    """План вычисления KPI, скомпилированный из PROMINENT_METRICS.
+
+    Источник KPI задаётся в конфиге полем "source":
+        {"metric": base_name, "labels": {label: value | [values]}, "agg": "sum"}
+    или, для отношения двух сумм,
+        {"agg": "ratio", "numerator": {...}, "denominator": {...}, "window": 60}.
+    С "window" (секунды) отношение считается по приращениям за окно
+    (Δnumerator/Δdenominator — текущее среднее, а не за всё время жизни).
+    Приращение берётся по каждой серии отдельно и затем суммируется, так
+    что появление, пропажа или вытеснение серии не выглядит скачком суммы;
+    состояние окон хранит вызывающий (по словарю на цель скрейпа).
+    Без "source" имя и лейблы берутся из ключа KPI, агрегация — sum.
+    "max_source" добавляет KPI "<key>_max" (порог для фронта).
+
+    Каждая серия один раз маршрутизируется в набор слотов-аккумуляторов
+    (таблица дополняется по мере появления новых серий), дальше на скрейп
+    приходится по одному обращению к словарю на сэмпл.
+    """
+
+    def __init__(self, prominent):
+        self.prominent = prominent
+        # слоты: (base_name, {label: frozenset(values)}, agg)
+        self._slots = []
+        # KPI: (name, agg, (slot, ...), window)
+        self._kpis = []
+        self._matchers = {}
+        self._routes = {}
+        # {слот оконного отношения: (KPI, 0 — числитель / 1 — знаменатель, окно)}
+        self._windowed = {}
+        for name, config in prominent.items():
+            self._compile(name, config.get("source"))
+            if "max_source" in config:
+                self._compile(name + "_max", config["max_source"])
+        self.base_names = frozenset(self._matchers)
+
+    def _compile(self, name, source):
+        if source is None:
+            _, base_name, labels = parse_series(name)
+            source = {"metric": base_name, "labels": dict(labels)}
+        agg = source.get("agg", "sum")
+        if agg == "ratio":
+            slots = (self._add_slot(source["numerator"]), self._add_slot(source["denominator"]))
+            if source.get("window"):
+                for part, index in enumerate(slots):
+                    self._windowed[index] = (name, part, source["window"])
+        elif agg in AGGREGATIONS:
+            slots = (self._add_slot(dict(source, agg=agg)),)
+        else:
+            raise ValueError(f"KPI {name}: unknown aggregation {agg!r}")
+        self._kpis.append((name, agg, slots, source.get("window")))
+
+    def _add_slot(self, source):
+        labels = {}
+        for label, values in source.get("labels", {}).items():
+            labels[label] = frozenset([values] if isinstance(values, str) else values)
+        index = len(self._slots)
+        self._slots.append((source["metric"], labels, source.get("agg", "sum")))
+        self._matchers.setdefault(source["metric"], []).append(index)
+        return index
+
+    def route(self, key, name, labels):
+        """Слоты, в которые попадает серия (результат кэшируется по key)."""
+        slots = self._routes.get(key)
+        if slots is None:
+            if name not in self._matchers:
+                return ()
+            if len(self._routes) >= ROUTE_CACHE_SIZE:
+                self._routes.clear()
+            label_map = dict(labels)
+            slots = tuple(
+                index for index in self._matchers.get(name, ())
+                if all(label_map.get(label) in values for label, values in self._slots[index][1].items())
+            )
+            self._routes[key] = slots
+        return slots
+
+    def compute(self, samples, timestamp=None, windows=None):
+        """Значения KPI по сэмплам одного скрейпа.
+
+        windows — словарь состояний оконных KPI одной цели
+        ({(KPI, часть, окно): {key: CounterWindow}}); без него оконные
+        отношения считаются за всё время, как обычные.
+        """
+        acc = [None] * len(self._slots)
+        windowed = self._windowed if windows is not None else {}
+        # Окна серий, пришедших в этом скрейпе; пропавшие серии забываются
+        seen = {index: {} for index in windowed}
+        for sample in samples:
+            for index in self.route(sample.key, sample.name, sample.labels):
+                if index in windowed:
+                    window_key = windowed[index]
+                    counter = windows.get(window_key, {}).get(sample.key)
+                    if counter is None:
+                        counter = CounterWindow(window_key[2])
+                    counter.add(timestamp, sample.value)
+                    seen[index][sample.key] = counter
+                    delta = counter.delta()
+                    if delta is not None:
+                        acc[index] = (acc[index] or 0.0) + delta[0]
+                    continue
+                current = acc[index]
+                if current is None:
+                    acc[index] = sample.value
+                    continue
+                agg = self._slots[index][2]
+                if agg == "sum":
+                    acc[index] = current + sample.value
+                elif agg == "last":
+                    acc[index] = sample.value
+                elif agg == "min":
+                    acc[index] = min(current, sample.value)
+                else:
+                    acc[index] = max(current, sample.value)
+        if windows is not None:
+            windows.clear()
+            windows.update((windowed[index], counters) for index, counters in seen.items())
+        kpi = {}
+        for name, agg, slots, _ in self._kpis:
+            if agg == "ratio":
+                # Для оконных отношений в слотах уже суммы приращений
+                numerator, denominator = acc[slots[0]], acc[slots[1]]
+                if numerator is None or denominator is None:
+                    continue
+                if denominator:
+                    kpi[name] = numerator / denominator
+            elif acc[slots[0]] is not None:
+                kpi[name] = acc[slots[0]]
+        return kpi
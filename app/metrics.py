@@ -1,142 +1,560 @@
-import requests
+import os
 import threading
 import time
-from collections import defaultdict, deque
-from .parser import parse_metrics, should_display_metric
-from .config import METRICS_URL, REQUEST_TIMEOUT, UPDATE_INTERVAL, HISTORY_LENGTH, METRICS_CONFIG, PROMINENT_METRICS
+from collections import ChainMap
+from .parser import iter_response_samples
+from .history import HistoryStore, Rollups
+from .downsample import downsample
+from .rates import RateEngine
+from .cardinality import CardinalityGuard
+from .alerts import AlertEngine
+from .query import QueryCache
+from .scraper import ScrapeEngine, Target
+from .storage import SegmentStore
+from . import snapshot as snapshot_module
+from .snapshot import Snapshot, encode_json
+from .stream import Broadcaster, encode_event
+from .feed import FeedServer, subscribe
+from .jserrors import js_errors
+from .selfmetrics import registry, SCRAPE_STAGE_SECONDS
+from .dashboard_config import current_config, on_config_change, start_config_watcher
+from .simulation import SIMULATION_DEFAULTS, simulation_targets, start_simulation
+from .config import (DASHBOARD_DEBUG, SIMULATION, METRICS_TARGETS, SCRAPE_WORKERS, REQUEST_TIMEOUT, UPDATE_INTERVAL,
+                     HISTORY_SECONDS, HISTORY_TIERS, HISTORY_DIR, HISTORY_SEGMENT_SECONDS,
+                     HISTORY_RETENTION, HISTORY_RAW_RETENTION, HISTORY_MAINTENANCE_INTERVAL, RATE_WINDOW,
+                     SELF_METRICS_KPI, MAX_SERIES, MAX_SERIES_PER_FAMILY, SERIES_TTL)
 import math
 
-HISTORY_SECONDS = 3600  # 1 час
-HISTORY_POINTS = int(HISTORY_SECONDS / UPDATE_INTERVAL)
+class TargetState:
+    """Всё состояние одной цели скрейпа (instance): данные, история, снапшот, SSE."""
 
-metrics_data = {
-    "metrics": {},
-    # history: {metric_name: deque([(timestamp, value), ...], maxlen=HISTORY_POINTS)}
-    "history": defaultdict(lambda: deque(maxlen=HISTORY_POINTS)),
-    "last_updated": 0,
-    "last_error": None
-}
+    def __init__(self, target):
+        self.target = target
+        self.name = target.name
+        history_points = int(HISTORY_SECONDS / target.interval)
+        self.data = {
+            "metrics": {},
+            # kpi: {kpi_name: value} — считается коллектором один раз на скрейп
+            "kpi": {},
+            # history: колоночный кольцевой буфер на HISTORY_SECONDS (по строке на скрейп)
+            "history": HistoryStore(history_points),
+            # kpi_history: отдельный поток KPI, пишется коллектором один раз на скрейп
+            "kpi_history": HistoryStore(history_points),
+            # rollups: ярусы min/max/avg/last для окон длиннее HISTORY_SECONDS
+            "rollups": Rollups(HISTORY_TIERS),
+            # categories: {metric_name: category} — категория из METRICS_CONFIG для фронта
+            "categories": {},
+            # types: {base_name: тип из "# TYPE" (counter, gauge, summary, ...)}
+            "types": {},
+            "last_updated": 0,
+            "last_error": None
+        }
+        # lock защищает data от конкурентной записи; читатели работают
+        # с опубликованным снапшотом и lock не берут
+        self.lock = threading.Lock()
+        # Сегменты на диске: сырая история и поток KPI
+        self.storage = SegmentStore(os.path.join(HISTORY_DIR, self.name, "metrics"), HISTORY_SEGMENT_SECONDS,
+                                    [step for step, _ in HISTORY_TIERS])
+        self.kpi_storage = SegmentStore(os.path.join(HISTORY_DIR, self.name, "kpi"), HISTORY_SEGMENT_SECONDS)
+        # Последний час поднимается с диска сразу; ярусы rollups — в фоне (rebuild_rollups)
+        since = time.time() - HISTORY_SECONDS
+        self.storage.load_history(self.data["history"], since)
+        self.kpi_storage.load_history(self.data["kpi_history"], since)
+        # Скорости счётчиков и окна оконных KPI — состояние этой цели
+        self.rates = RateEngine(RATE_WINDOW)
+        self.kpi_windows = {}
+        # Бюджет серий: держит память цели ограниченной при смене лейблов
+        self.guard = CardinalityGuard(MAX_SERIES, MAX_SERIES_PER_FAMILY, SERIES_TTL)
+        # Алерты считаются после каждого скрейпа, независимо от открытых вкладок
+        self.alerts = AlertEngine(self.name, current_config().alert_rules)
+        self.broadcaster = Broadcaster()
+        # Результаты /api/query по текущему снапшоту (пересчёт раз на скрейп)
+        self.queries = QueryCache()
+        self.snapshot = None
+        self._snapshot_version = 0
+        # Сэмплы последнего ответа: при 304 Not Modified скрейп повторяет их
+        self._last_samples = []
+        # Ожидание lock коллектором в последнем скрейпе (секунды)
+        self.last_lock_wait = None
+        # feed — куда коллектор отдаёт изменения для веб-воркеров (FeedServer.publish);
+        # replica — состояние приходит из фида коллектора, а не из скрейпа
+        self.feed = None
+        self.replica = False
+        self._remote_stats = {}
+        self.publish()
 
-lock = threading.Lock()
+    def publish(self, row=None, version=None):
+        """Собирает снапшот из data и публикует его (вызывается под lock).
 
-def update_metrics():
-    while True:
-        try:
-            start_time = time.time()
-            response = requests.get(METRICS_URL, timeout=REQUEST_TIMEOUT)
-            parsed = parse_metrics(response.text)
-
-            now = time.time()
-            with lock:
-                for name, value in parsed.items():
-                    if should_display_metric(name, METRICS_CONFIG):
-                        if isinstance(value, (int, float)) and not math.isnan(value):
-                            metrics_data["metrics"][name] = value
-                            metrics_data["history"][name].append((now, value))
-                metrics_data["last_updated"] = now
-                metrics_data["last_error"] = None
-        except Exception as e:
-            with lock:
-                metrics_data["last_error"] = str(e)
-        time.sleep(max(0, UPDATE_INTERVAL - (time.time() - start_time)))
-
-def get_kpi_metrics(parsed):
-    kpi = {}
-    # 1. tx_pool_size
-    if 'tx_pool_size' in parsed:
-        kpi['tx_pool_size'] = parsed['tx_pool_size']
-    # 2. jetty_post_avg_time (sum/count)
-    post_sum = None
-    post_count = None
-    for k, v in parsed.items():
-        if k.startswith('jetty_server_requests_seconds_sum') and 'method="POST"' in k:
-            post_sum = v
-        if k.startswith('jetty_server_requests_seconds_count') and 'method="POST"' in k:
-            post_count = v
-    if post_sum is not None and post_count:
-        kpi['jetty_post_avg_time'] = post_sum / post_count if post_count else 0.0
-    # 3. process_cpu_usage
-    if 'process_cpu_usage' in parsed:
-        kpi['process_cpu_usage'] = parsed['process_cpu_usage']
-    # 4. postgres_locks{database="db01"}
-    for k, v in parsed.items():
-        if k.startswith('postgres_locks{') and 'database="db01"' in k:
-            kpi['postgres_locks{database="db01"}'] = v
-    # 5. jvm_gc_pause_seconds_sum (minor+major)
-    gc_sum = 0.0
-    found_gc = False
-    for k, v in parsed.items():
-        if k.startswith('jvm_gc_pause_seconds_sum{') and (
-            'action="end of minor GC"' in k or 'action="end of major GC"' in k):
-            gc_sum += v
-            found_gc = True
-    if found_gc:
-        kpi['jvm_gc_pause_seconds_sum'] = gc_sum
-    # 6. postgres_connections{database="db01"}
-    for k, v in parsed.items():
-        if k.startswith('postgres_connections{') and 'database="db01"' in k:
-            kpi['postgres_connections{database="db01"}'] = v
-    # 7. jvm_memory_used_bytes{area="heap",id="Tenured Gen"} и max
-    heap_used = None
-    heap_max = None
-    for k, v in parsed.items():
-        if k.startswith('jvm_memory_used_bytes{') and 'area="heap"' in k and 'id="Tenured Gen"' in k:
-            heap_used = v
-        if k.startswith('jvm_memory_max_bytes{') and 'area="heap"' in k and 'id="Tenured Gen"' in k:
-            heap_max = v
-    if heap_used is not None:
-        kpi['jvm_memory_used_bytes{area="heap",id="Tenured Gen"}'] = heap_used
-        if heap_max:
-            kpi['jvm_memory_used_bytes{area="heap",id="Tenured Gen"}_max'] = heap_max
-    # 8. system_load_average_1m
-    if 'system_load_average_1m' in parsed:
-        kpi['system_load_average_1m'] = parsed['system_load_average_1m']
-    # 9. jetty_server_requests_seconds_count{method="POST",outcome="SUCCESS",status="200",}
-    for k, v in parsed.items():
-        if k.startswith('jetty_server_requests_seconds_count{') and 'method="POST"' in k and 'outcome="SUCCESS"' in k and 'status="200"' in k:
-            kpi['jetty_server_requests_seconds_count{method="POST",outcome="SUCCESS",status="200",}'] = v
-    # 10. postgres_rows_inserted_total{database="db01"}
-    for k, v in parsed.items():
-        if k.startswith('postgres_rows_inserted_total{') and 'database="db01"' in k:
-            kpi['postgres_rows_inserted_total{database="db01"}'] = v
-    # 11. postgres_blocks_reads_total{database="db01"}
-    for k, v in parsed.items():
-        if k.startswith('postgres_blocks_reads_total{') and 'database="db01"' in k:
-            kpi['postgres_blocks_reads_total{database="db01"}'] = v
-    # 12. jvm_threads_live_threads
-    if 'jvm_threads_live_threads' in parsed:
-        kpi['jvm_threads_live_threads'] = parsed['jvm_threads_live_threads']
-    # 13. jvm_classes_loaded_classes
-    if 'jvm_classes_loaded_classes' in parsed:
-        kpi['jvm_classes_loaded_classes'] = parsed['jvm_classes_loaded_classes']
-    return kpi
+        row — строка истории последнего скрейпа; из неё строится кадр SSE.
+        version — номер снапшота коллектора (у реплики), иначе следующий.
+        """
+        data = self.data
+        settings = current_config()
+        metric_filter = settings.metric_filter
+        history = data["history"]
+        previous = self.snapshot
+        self._snapshot_version = self._snapshot_version + 1 if version is None else version
+        # Присваивание ссылки атомарно: читатель видит либо старый, либо новый снапшот
+        snapshot = self.snapshot = Snapshot(
+            version=self._snapshot_version,
+            instance=self.name,
+            metrics=dict(data["metrics"]),
+            kpi=data["kpi"],
+            categories=dict(data["categories"]),
+            history=history.snapshot(),
+            history_keys=[name for name in history.columns if metric_filter(name)],
+            kpi_history=data["kpi_history"].snapshot(),
+            last_updated=data["last_updated"],
+            error=data["last_error"],
+            prominent=settings.prominent,
+            config=settings.metrics_config,
+            types=data["types"]
+        )
+        if previous is not None:
+            # Кадр сериализуется один раз и раздаётся всем SSE-клиентам цели
+            self.broadcaster.publish(snapshot.stream_delta_event(previous, row))
 
-def get_metrics_data():
-    with lock:
-        parsed = metrics_data["metrics"]
-        kpi = get_kpi_metrics(parsed)
-        # Обновляем history для KPI-метрик
-        for k, v in kpi.items():
-            metrics_data["history"][k].append((metrics_data["last_updated"], v))
-        # Фильтруем history по should_display_metric
-        from .parser import should_display_metric
-        filtered_history = {name: list(history) for name, history in metrics_data["history"].items() if should_display_metric(name, METRICS_CONFIG)}
+    def _stage(self, stage, started):
+        """Записывает длительность этапа скрейпа и возвращает начало следующего."""
+        now = time.perf_counter()
+        SCRAPE_STAGE_SECONDS.observe(now - started, self.name, stage)
+        return now
+
+    def collect(self, response):
+        """Записывает скрейп из потокового ответа (None — ответ 304 Not Modified)."""
+        mark = time.perf_counter()
+        # Одна версия конфигурации на весь скрейп, даже если её подменят посередине
+        settings = current_config()
+        metric_filter = settings.metric_filter
+        kpi_plan = settings.kpi_plan
+        accept = lambda name: metric_filter(name) or name in kpi_plan.base_names
+        if response is None:
+            samples = self._last_samples
+        else:
+            # Разбираем ответ потоково и вне lock: держим только принятые сэмплы
+            samples = [sample for sample in iter_response_samples(response, accept)
+                       if not math.isnan(sample.value)]
+            self._last_samples = samples
+        mark = self._stage("parse", mark)
+        now = time.time()
+        # KPI — по всем сэмплам скрейпа: бюджет ограничивает хранимые серии,
+        # а не слагаемые KPI (иначе числитель и знаменатель суммируют разное)
+        kpi = kpi_plan.compute(samples, now, self.kpi_windows)
+        samples = [sample for sample in samples if self.guard.admit(sample, now)]
+        stale = self.guard.expire(now)
+        if stale:
+            stale += self.rates.forget(stale)
+        mark = self._stage("admit", mark)
+        if SELF_METRICS_KPI and self.target.last_duration is not None:
+            kpi["self_scrape_duration_seconds"] = self.target.last_duration
+        mark = self._stage("kpi", mark)
+        # Производные (скорости, средние за окно) — только для отображаемых серий
+        derived = self.rates.update(now, [sample for sample in samples if metric_filter(sample.name)])
+        mark = self._stage("rates", mark)
+
+        # Строка истории собирается вне lock: она зависит только от сэмплов и конфига
+        row, types, known_types = {}, {}, self.data["types"]
+        for sample in samples:
+            if known_types.get(sample.name) != sample.type:
+                types[sample.name] = sample.type
+            # Сэмплы, принятые только ради KPI, в metrics/history не попадают
+            if metric_filter.category(sample.name) is not None:
+                row[sample.key] = sample.value
+        # Производные серии хранятся рядом с исходными
+        row.update(derived)
+        update = {"timestamp": now, "row": row, "kpi": kpi, "types": types, "stale": stale}
+        mark = self.apply(update, mark)
+        # Смена правил: алерты удалённых правил снимаются вместе с переходами скрейпа
+        transitions = self.alerts.set_rules(settings.alert_rules, now)
+        transitions += self.alerts.evaluate(now, ChainMap(kpi, row))
+        for transition in transitions:
+            self.broadcaster.publish(encode_event("alert", encode_json(transition)))
+        mark = self._stage("alerts", mark)
+        if self.feed is not None:
+            update.update(type="scrape", instance=self.name, alerts=transitions, stats=self.stats())
+            self.feed(update)
+            self._stage("feed", mark)
+
+    def apply(self, update, mark=None):
+        """Записывает строку скрейпа в data, историю и на диск и публикует снапшот.
+
+        update — {"timestamp", "row", "kpi", "types", "stale"}; коллектор
+        дописывает в него "version" опубликованного снапшота.
+        Реплика вызывает apply с сообщением фида и на диск не пишет.
+        """
+        if mark is None:
+            mark = time.perf_counter()
+        metric_filter = current_config().metric_filter
+        now, row, kpi, stale = update["timestamp"], update["row"], update["kpi"], update["stale"]
+        data = self.data
+        with self.lock:
+            self.last_lock_wait = time.perf_counter() - mark
+            locked = mark = self._stage("lock_wait", mark)
+            if update["types"]:
+                # Новый словарь, а не update: опубликованные снапшоты держат ссылку на старый
+                data["types"] = {**data["types"], **update["types"]}
+            for key, value in row.items():
+                data["metrics"][key] = value
+                data["categories"][key] = metric_filter.category(key)
+            if stale:
+                self.evict(stale)
+            data["history"].append(now, row)
+            data["rollups"].add(now, row)
+            data["kpi_history"].append(now, kpi)
+            mark = self._stage("history", mark)
+            if not self.replica:
+                # На диск пишем под lock: rebuild_rollups полагается, что строки до
+                # последней в памяти уже записаны
+                self.storage.append(now, row)
+                self.kpi_storage.append(now, kpi)
+                mark = self._stage("storage", mark)
+            data["kpi"] = kpi
+            data["last_updated"] = now
+            data["last_error"] = None
+            self.publish(row, update.get("version"))
+            update["version"] = self._snapshot_version
+            mark = self._stage("publish", mark)
+            self._stage("lock_hold", locked)
+        return mark
+
+    def evict(self, keys):
+        """Убирает серии keys из памяти (вызывается под lock); на диске они остаются."""
+        data = self.data
+        for key in keys:
+            data["metrics"].pop(key, None)
+            data["categories"].pop(key, None)
+        data["history"].drop(keys)
+        data["rollups"].drop(keys)
+
+    def fail(self, error, version=None):
+        with self.lock:
+            self.data["last_error"] = str(error)
+            self.publish(version=version)
+            version = self._snapshot_version
+        if self.feed is not None:
+            self.feed({"type": "error", "instance": self.name, "version": version, "error": str(error)})
+
+    def reconfigure(self, settings):
+        """Применяет новую конфигурацию без остановки скрейпа; история сохраняется.
+
+        Перефильтровываются только серии, у которых сменилась категория
+        (вердикты фильтра кэшируются по имени метрики, так что это проход по
+        именам, а не по сэмплам). Скрытые серии остаются в истории и на
+        диске и снова появятся, если их вернуть в конфигурацию.
+        """
+        metric_filter = settings.metric_filter
+        changed = 0
+        with self.lock:
+            data = self.data
+            for key in list(data["metrics"]):
+                category = metric_filter.category(key)
+                if category == data["categories"].get(key):
+                    continue
+                changed += 1
+                if category is None:
+                    del data["metrics"][key]
+                    data["categories"].pop(key, None)
+                else:
+                    data["categories"][key] = category
+            # Коллектор подменяет правила в следующем скрейпе (AlertEngine.set_rules),
+            # чтобы resolved для удалённых правил ушли в SSE и фид вместе с
+            # остальными переходами; реплике их пришлёт фид
+            if self.replica:
+                self.alerts.rules = settings.alert_rules
+            # 304 от экспортёра повторил бы сэмплы, отобранные старым фильтром
+            self._last_samples = []
+            self.target.etag = self.target.last_modified = None
+            if not self.replica:
+                # Реплика публикует новую конфигурацию со следующим кадром коллектора
+                self.publish()
+        return changed
+
+    def stats(self):
+        """Состояние скрейпа цели для /api/targets и /self/metrics.
+
+        Считается в коллекторе; реплика отдаёт последнее полученное из фида.
+        """
+        if self.replica:
+            return self._remote_stats
         return {
-            "metrics": parsed,
-            "kpi": kpi,
-            "history": filtered_history,
-            "last_updated": metrics_data["last_updated"],
-            "error": metrics_data["last_error"]
+            "cardinality": self.guard.stats(),
+            "scrape_duration": self.target.last_duration,
+            "drift": self.target.last_drift,
+            "lock_wait": self.last_lock_wait
         }
 
+    def hello(self):
+        """Приветствие фида: всё, чего реплике не хватает помимо истории на диске."""
+        data = self.data
+        with self.lock:
+            history = data["history"]
+            return {
+                "type": "hello",
+                "instance": self.name,
+                "epoch": snapshot_module.BOOT_ID,
+                "version": self._snapshot_version,
+                "seq": history.seq,
+                "kpi_seq": data["kpi_history"].seq,
+                "until": history.timestamps[(history.seq - 1) % history.capacity] if history.seq else None,
+                "history_keys": list(history.columns),
+                # Копии: сериализуется приветствие уже вне lock
+                "metrics": dict(data["metrics"]),
+                "kpi": data["kpi"],
+                "types": dict(data["types"]),
+                "last_updated": data["last_updated"],
+                "last_error": data["last_error"],
+                "alerts": {"active": self.alerts.active(), "history": self.alerts.history()},
+                "stats": self.stats()
+            }
+
+    def restore(self, hello):
+        """Реплика: поднимает состояние из приветствия коллектора и истории на диске.
+
+        Строки до hello["until"] коллектор уже записал на диск; номера строк
+        (курсоры клиентов) и версии снапшотов совпадают с коллекторскими.
+        """
+        metric_filter = current_config().metric_filter
+        history = HistoryStore(self.data["history"].capacity)
+        kpi_history = HistoryStore(self.data["kpi_history"].capacity)
+        if hello["until"] is not None:
+            since = time.time() - HISTORY_SECONDS
+            self.storage.load_history(history, since, hello["until"], hello["seq"])
+            self.kpi_storage.load_history(kpi_history, since, hello["until"], hello["kpi_seq"])
+            # Вытесненные коллектором серии на диске остались — в памяти их быть не должно
+            keys = set(hello["history_keys"])
+            history.drop([key for key in history.columns if key not in keys])
+        with self.lock:
+            # Эпоха коллектора: курсоры клиентов переносятся между воркерами
+            snapshot_module.BOOT_ID = hello["epoch"]
+            data = self.data
+            data["history"] = history
+            data["kpi_history"] = kpi_history
+            data["metrics"] = hello["metrics"]
+            data["categories"] = {key: metric_filter.category(key) for key in hello["metrics"]}
+            data["kpi"] = hello["kpi"]
+            data["types"] = hello["types"]
+            data["last_updated"] = hello["last_updated"]
+            data["last_error"] = hello["last_error"]
+            self._remote_stats = hello["stats"]
+            self.publish(version=hello["version"])
+        self.alerts.restore(hello["alerts"]["active"], hello["alerts"]["history"])
+        threading.Thread(target=self.rebuild_rollups, daemon=True).start()
+
+    def replay(self, message):
+        """Реплика: применяет сообщение фида коллектора."""
+        if message["version"] <= self._snapshot_version:
+            # Уже учтено в приветствии
+            return
+        if message["type"] == "error":
+            self.fail(message["error"], message["version"])
+            return
+        self.apply(message)
+        self._remote_stats = message["stats"]
+        self.alerts.replay(message["alerts"])
+        for transition in message["alerts"]:
+            self.broadcaster.publish(encode_event("alert", encode_json(transition)))
+
+    def rebuild_rollups(self):
+        """Восстанавливает ярусы rollups с диска и подменяет ими текущие.
+
+        Ярусы собираются по строкам до последней записанной; строки,
+        пришедшие за время сборки, доливаются из сырой истории под lock.
+        """
+        history = self.data["history"]
+        with self.lock:
+            until = history.timestamps[(history.seq - 1) % history.capacity] if history.seq else time.time()
+        rollups = Rollups(HISTORY_TIERS)
+        self.storage.load_rollups(rollups, until)
+        with self.lock:
+            for timestamp, row in history.rows(history.seq_at(until)):
+                if timestamp > until:
+                    rollups.add(timestamp, row)
+            self.data["rollups"] = rollups
+
+    def maintain_storage(self):
+        now = time.time()
+        for storage in (self.storage, self.kpi_storage):
+            storage.compact(now)
+            storage.expire(now, HISTORY_RETENTION, max(HISTORY_RAW_RETENTION, HISTORY_SECONDS))
+
+    def history_range(self, names, start_time, since=None, max_points=None, agg="lttb", window=None):
+        """История выбранных метрик начиная с start_time (поиск строки — бинарный).
+
+        since — курсор из предыдущего ответа: отдаются только более новые строки.
+        max_points/agg — прореживание на сервере (см. app/downsample.py).
+        Для окон длиннее сырой истории (или при малом max_points) данные берутся
+        из самого грубого подходящего яруса rollups.
+        window — запрошенная длина окна в секундах (по умолчанию от start_time
+        до текущего момента), по ней выбирается источник.
+        Возвращает (history, cursor, resolution) — resolution: шаг точек в секундах.
+        """
+        history = self.snapshot.history
+        metric_filter = current_config().metric_filter
+        tier = None
+        if since is None:
+            if window is None:
+                window = time.time() - start_time
+            tier = self.data["rollups"].choose(window, max_points,
+                                               self.target.interval, HISTORY_SECONDS)
+        result = {}
+        if tier is not None:
+            first_seq = tier.seq_at(start_time - tier.step)
+            field = agg if agg in tier.FIELDS else "avg"
+            for name in names:
+                result[name] = downsample(*tier.arrays(name, first_seq, field), max_points, agg) if metric_filter(name) else []
+            return result, history.seq, tier.step
+        first_seq = history.seq_at(start_time)
+        if since is not None:
+            first_seq = max(first_seq, since + 1)
+        for name in names:
+            if not metric_filter(name):
+                result[name] = []
+            elif max_points:
+                result[name] = downsample(*history.arrays(name, first_seq), max_points, agg)
+            else:
+                result[name] = history.points(name, first_seq)
+        return result, history.seq, self.target.interval
+
+# Режим симуляции (app/simulation.py): SIMULATION или, в debug-режиме,
+# настройки по умолчанию; цели скрейпа — локальный экспортёр
+_simulation = SIMULATION or (SIMULATION_DEFAULTS if DASHBOARD_DEBUG else None)
+
+# targets: {instance: TargetState} в порядке METRICS_TARGETS
+targets = {}
+for _target_config in simulation_targets(_simulation, UPDATE_INTERVAL) if _simulation else METRICS_TARGETS:
+    _target = Target(
+        _target_config["name"],
+        _target_config["url"],
+        _target_config.get("interval", UPDATE_INTERVAL),
+        _target_config.get("timeout", REQUEST_TIMEOUT)
+    )
+    targets[_target.name] = TargetState(_target)
+
+# Первая цель отвечает на запросы без ?instance=
+default_target = next(iter(targets.values()))
+metrics_data = default_target.data
+lock = default_target.lock
+
+def _per_target(value):
+    return lambda: [((name,), value(state)) for name, state in targets.items()]
+
+def _stat(*path):
+    """Поле TargetState.stats() (у реплики до приветствия коллектора — None)."""
+    def value(state):
+        result = state.stats()
+        for key in path:
+            result = result.get(key) if result else None
+        return result
+    return _per_target(value)
+
+registry.gauge("amity_dashboard_series", "Series currently held in memory.", ("instance",),
+               _stat("cardinality", "series"))
+registry.gauge("amity_dashboard_series_dropped_total", "Samples dropped by the series budget.", ("instance",),
+               _stat("cardinality", "dropped"), "counter")
+registry.gauge("amity_dashboard_series_evicted_total", "Series evicted after SERIES_TTL.", ("instance",),
+               _stat("cardinality", "evicted"), "counter")
+registry.gauge("amity_dashboard_history_bytes", "Memory held by raw history, KPI history and rollups.", ("instance",),
+               _per_target(lambda state: state.data["history"].nbytes() + state.data["kpi_history"].nbytes()
+                           + state.data["rollups"].nbytes()))
+registry.gauge("amity_dashboard_lock_wait_seconds", "Collector wait for the target lock in the last scrape.",
+               ("instance",), _stat("lock_wait"))
+registry.gauge("amity_dashboard_scrape_lag_seconds", "Seconds since the last successful scrape.", ("instance",),
+               _per_target(lambda state: time.time() - state.data["last_updated"] if state.data["last_updated"] else None))
+registry.gauge("amity_dashboard_scrape_drift_seconds", "How late the last scrape started against its schedule.",
+               ("instance",), _stat("drift"))
+registry.gauge("amity_dashboard_query_cache_total", "Query API lookups by cache outcome.", ("instance", "result"),
+               lambda: [((name, result), getattr(state.queries, result)) for name, state in targets.items()
+                        for result in ("hits", "misses")], "counter")
+registry.gauge("amity_dashboard_stream_clients", "Connected Server-Sent Events clients.", ("instance",),
+               _per_target(lambda state: len(state.broadcaster)))
+registry.gauge("amity_dashboard_stream_dropped_frames_total", "SSE frames dropped for slow clients.", ("instance",),
+               _per_target(lambda state: state.broadcaster.dropped), "counter")
+
+def get_target(instance=None):
+    """TargetState по имени instance (None — цель по умолчанию, неизвестное имя — None)."""
+    if instance is None:
+        return default_target
+    return targets.get(instance)
+
+def get_snapshot(instance=None):
+    return get_target(instance).snapshot
+
+def update_metrics():
+    """Скрейпит все цели параллельно, каждую по своему расписанию."""
+    engine = ScrapeEngine(
+        [state.target for state in targets.values()],
+        on_response=lambda target, response: targets[target.name].collect(response),
+        on_error=lambda target, error: targets[target.name].fail(error),
+        workers=min(SCRAPE_WORKERS, len(targets))
+    )
+    engine.run()
+
+def get_metrics_data():
+    return get_snapshot().data_dict()
+
 def get_metrics_history():
-    with lock:
-        from .parser import should_display_metric
-        return {name: list(history) for name, history in metrics_data["history"].items() if should_display_metric(name, METRICS_CONFIG)}
+    return get_snapshot().history_dict()
+
+def get_metrics_history_range(names, start_time, since=None, max_points=None, agg="lttb", instance=None):
+    return get_target(instance).history_range(names, start_time, since, max_points, agg)
+
+def maintain_storage():
+    """Фон: восстановление rollups с диска, затем уплотнение и срок хранения."""
+    for state in targets.values():
+        state.rebuild_rollups()
+    while True:
+        for state in targets.values():
+            try:
+                state.maintain_storage()
+            except Exception as e:
+                print(f"[STORAGE] {state.name}: {e}")
+        time.sleep(HISTORY_MAINTENANCE_INTERVAL)
+
+def _reconfigure(old, new):
+    changed = sum(state.reconfigure(new) for state in targets.values())
+    print(f"[CONFIG] version {new.version} applied, {changed} series re-filtered")
+
+on_config_change(_reconfigure)
 
 def start_metrics_thread():
+    """Запускает скрейп и обслуживание истории в этом процессе (вызывается явно)."""
+    if _simulation:
+        start_simulation(_simulation)
+    start_config_watcher()
     thread = threading.Thread(target=update_metrics, daemon=True)
     thread.start()
+    threading.Thread(target=maintain_storage, daemon=True).start()
+
+def start_collector(socket_path):
+    """Production: единственный коллектор, раздающий состояние воркерам через Unix-сокет."""
+    server = FeedServer(socket_path, on_connect=lambda: [state.hello() for state in targets.values()])
+    for state in targets.values():
+        state.feed = server.publish
+    server.start()
+    registry.gauge("amity_dashboard_feed_workers", "Web workers subscribed to the collector feed.", (),
+                   lambda: [((), len(server))])
+    js_errors.start_rotation()
+    start_metrics_thread()
+    return server
+
+def _on_feed(message):
+    state = targets.get(message["instance"])
+    if state is None:
+        return
+    try:
+        if message["type"] == "hello":
+            state.restore(message)
+        else:
+            state.replay(message)
+    except Exception as e:
+        print(f"[FEED] {state.name}: {e}")
 
-# Очищаем историю при старте, чтобы убрать старые игнорируемые метрики
-metrics_data["history"].clear()
+def start_replica(socket_path):
+    """Production: веб-воркер без скрейпа, состояние приходит из фида коллектора."""
+    for state in targets.values():
+        state.replica = True
+    # Лог JS-ошибок общий для воркеров: ротирует только коллектор
+    js_errors.rotate = False
+    start_config_watcher()
+    threading.Thread(target=subscribe, args=(socket_path, _on_feed), daemon=True).start()
@@ -1,36 +1,172 @@
 import re
+import sys
+from collections import namedtuple
 
-def parse_metrics(text):
-    metrics = {}
-    current_metric = None
-    for line in text.splitlines():
-        line = line.strip()
-        if not line or line.startswith("# HELP"):
+# Предел размера кэша вердиктов фильтра (по base name)
+FILTER_CACHE_SIZE = 65536
+
+# Сэмпл экспозиции: key — исходная строка серии (имя + лейблы), используется
+# как ключ в metrics/history; labels — кортеж пар (имя, значение)
+Sample = namedtuple("Sample", "key name labels value timestamp type")
+
+# Суффиксы сэмплов, которые принадлежат семейству из "# TYPE"
+FAMILY_SUFFIXES = ("_total", "_count", "_sum", "_bucket", "_created", "_max")
+
+# Суффиксы производных серий коллектора (см. app/rates.py): фильтр
+# отображения относит их к категории исходной метрики
+DERIVED_SUFFIXES = (":rate", ":avg")
+
+# Предел размера кэша разобранных серий
+SERIES_CACHE_SIZE = 200000
+
+_LABEL_RE = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"\s*,?')
+_ESCAPE_RE = re.compile(r'\\(.)')
+
+# {исходная строка серии: (key, name, labels)} — между скрейпами набор серий
+# почти не меняется, поэтому лейблы разбираются один раз
+_series_cache = {}
+
+def _unescape(value):
+    if '\\' not in value:
+        return value
+    return _ESCAPE_RE.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+def parse_labels(text):
+    """Разбирает лейблы без фигурных скобок в кортеж пар (имя, значение)."""
+    labels = []
+    pos = 0
+    while pos < len(text):
+        match = _LABEL_RE.match(text, pos)
+        if not match:
+            if text[pos:].strip():
+                raise ValueError(f"bad labels: {text!r}")
+            break
+        labels.append((sys.intern(match.group(1)), _unescape(match.group(2))))
+        pos = match.end()
+    return tuple(labels)
+
+def parse_series(series):
+    """Разбирает строку серии 'name{labels}' в (key, name, labels), с кэшем."""
+    entry = _series_cache.get(series)
+    if entry is None:
+        brace = series.find('{')
+        if brace == -1:
+            name, labels = series, ()
+        else:
+            if not series.endswith('}'):
+                raise ValueError(f"bad series: {series!r}")
+            name, labels = series[:brace], parse_labels(series[brace + 1:-1])
+        entry = (sys.intern(series), sys.intern(name), labels)
+        if len(_series_cache) >= SERIES_CACHE_SIZE:
+            _series_cache.clear()
+        _series_cache[series] = entry
+    return entry
+
+def iter_samples(lines, accept=None):
+    """Потоково разбирает текстовую экспозицию Prometheus в Sample.
+
+    lines — любой итерируемый источник строк (например, response.iter_lines()).
+    accept — необязательный предикат по base name: отвергнутые им семейства
+    пропускаются без разбора лейблов и значений.
+    """
+    types = {}
+    verdicts = {}
+    family = None
+    family_type = None
+    skip_family = False
+    for line in lines:
+        if not line:
             continue
-        if line.startswith("# TYPE"):
-            current_metric = line.split()[2]
+        if line[0] in ' \t':
+            line = line.strip()
+            if not line:
+                continue
+        if line[0] == '#':
+            parts = line.split(None, 3)
+            if len(parts) == 4 and parts[1] == 'TYPE':
+                family, family_type = parts[2], parts[3].strip()
+                types[family] = family_type
+                skip_family = accept is not None and not any(
+                    accept(family + suffix) for suffix in ("",) + FAMILY_SUFFIXES)
+            continue
+        if skip_family and line.startswith(family) and line[len(family):len(family) + 1] in (' ', '{'):
+            continue
+        brace = line.find('{')
+        space = line.find(' ')
+        if brace != -1 and (space == -1 or brace < space):
+            # '}' не встречается в значении и timestamp, поэтому ищем справа:
+            # это корректно и для значений лейблов, содержащих '}'
+            close = line.rfind('}')
+            name, series, rest = line[:brace], line[:close + 1], line[close + 1:]
+        elif space != -1:
+            name = series = line[:space]
+            rest = line[space:]
+        else:
             continue
-        if current_metric:
-            try:
-                if '{' in line:
-                    name_part, value_part = line.split('}', 1)
-                    name = name_part + '}'
-                    value = float(value_part.strip())
-                else:
-                    name, value = line.rsplit(' ', 1)
-                    value = float(value)
-                metrics[name] = value
-            except ValueError:
+        if accept is not None:
+            verdict = verdicts.get(name)
+            if verdict is None:
+                verdict = verdicts[name] = bool(accept(name))
+            if not verdict:
                 continue
-    return metrics
-
-def should_display_metric(metric_name, config):
-    from .config import IGNORE_METRICS
-    base_name = metric_name.split('{')[0]
-    if base_name in IGNORE_METRICS:
-        return False
-    for category in config:
-        for pattern in category["metrics"]:
-            if re.fullmatch(pattern, base_name):
-                return True
-    return False
+        try:
+            key, name, labels = parse_series(series)
+            fields = rest.split()
+            value = float(fields[0])
+            timestamp = float(fields[1]) / 1000.0 if len(fields) > 1 else None
+        except (ValueError, IndexError):
+            continue
+        sample_type = types.get(name)
+        if sample_type is None:
+            sample_type = family_type if family is not None and name.startswith(family) else "untyped"
+        yield Sample(key, name, labels, value, timestamp, sample_type)
+
+def iter_response_samples(response, accept=None, chunk_size=65536):
+    """Разбирает ответ requests (stream=True) по кускам, не копируя тело целиком."""
+    if 'charset' not in response.headers.get('Content-Type', ''):
+        response.encoding = 'utf-8'
+    return iter_samples(response.iter_lines(chunk_size=chunk_size, decode_unicode=True), accept)
+
+def parse_metrics(text):
+    return {sample.key: sample.value for sample in iter_samples(text.splitlines())}
+
+class MetricFilter:
+    """Предкомпилированный фильтр метрик по METRICS_CONFIG и IGNORE_METRICS.
+
+    Паттерны всех категорий собраны в одну регулярку (именованная группа
+    на категорию), вердикты кэшируются по base name.
+    """
+
+    def __init__(self, config, ignore=()):
+        self.config = config
+        self.ignore = frozenset(ignore)
+        self.categories = [category["category"] for category in config]
+        groups = []
+        for index, category in enumerate(config):
+            alternation = "|".join(f"(?:{pattern})" for pattern in category["metrics"])
+            if alternation:
+                groups.append(f"(?P<c{index}>{alternation})")
+        self._regex = re.compile("|".join(groups)) if groups else None
+        self._verdicts = {}
+
+    def category(self, metric_name):
+        """Категория метрики или None, если метрика не отображается."""
+        base_name = metric_name.split('{', 1)[0]
+        if base_name.endswith(DERIVED_SUFFIXES):
+            base_name = base_name.rsplit(':', 1)[0]
+        try:
+            return self._verdicts[base_name]
+        except KeyError:
+            pass
+        category = None
+        if base_name not in self.ignore and self._regex is not None:
+            match = self._regex.fullmatch(base_name)
+            if match:
+                category = self.categories[int(match.lastgroup[1:])]
+        if len(self._verdicts) >= FILTER_CACHE_SIZE:
+            self._verdicts.clear()
+        self._verdicts[base_name] = category
+        return category
+
+    def __call__(self, metric_name):
+        return self.category(metric_name) is not None
@@ -0,0 +1,458 @@
+import re
+import threading
+import warnings
+from contextlib import contextmanager
+import numpy as np
+from .parser import parse_series
+from .downsample import downsample
+
+# Запросы к истории для /api/query — небольшое подмножество PromQL:
+#   jvm_memory_used_bytes{area="heap"}            выбор серий по лейблам (=, !=, =~, !~)
+#   sum by (area) (jvm_memory_used_bytes)         sum/avg/max/min/count по лейблам
+#   rate(postgres_rows_inserted_total[1m])        скорость счётчика с учётом сбросов
+#   quantile_over_time(0.95, jetty_post_avg_time[5m]), avg/max/min_over_time
+#   process_cpu_usage * 100, a / b                арифметика между сериями и числами
+# Всё считается векторно над матрицей [строка истории, серия]: строки
+# истории у всех серий общие, поэтому выравнивать по времени не нужно.
+
+MAX_QUERY_LENGTH = 1000
+AGGREGATIONS = ("sum", "avg", "max", "min", "count")
+OVER_TIME = {
+    "avg_over_time": np.nanmean,
+    "max_over_time": np.nanmax,
+    "min_over_time": np.nanmin,
+}
+# Скользящие окна считаются кусками не больше стольких элементов
+WINDOW_CHUNK_ELEMENTS = 1 << 21
+# Сколько разных запросов кэшируется на один снапшот
+QUERY_CACHE_SIZE = 64
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+  | (?P<duration>\[\s*\d+(?:\.\d*)?[smhd]?\s*\])
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+  | (?P<op>=~|!=|!~|[-+*/(){},=])
+)""", re.VERBOSE)
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_MATCHERS = {
+    "=": lambda value, expected: value == expected,
+    "!=": lambda value, expected: value != expected,
+    "=~": lambda value, pattern: pattern.fullmatch(value) is not None,
+    "!~": lambda value, pattern: pattern.fullmatch(value) is None,
+}
+_BINARY = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.true_divide}
+# Позиции дочерних выражений в узлах дерева; остальные поля (матчеры, лейблы
+# by, числа) выражениями не являются
+_CHILDREN = {"range": (1,), "rate": (1,), "over_time": (2,), "quantile": (2,),
+             "aggregate": (3,), "binary": (2, 3)}
+
+class QueryError(ValueError):
+    pass
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise QueryError(f"unexpected input at {pos}: {text[pos:pos + 20]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+def _duration(token):
+    body = token.strip("[] ")
+    unit = body[-1] if body[-1] in _DURATION_UNITS else "s"
+    return float(body.rstrip("smhd")) * _DURATION_UNITS[unit]
+
+class _Parser:
+    """Рекурсивный спуск; результат — дерево из кортежей (вид, ...)."""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def describe(self):
+        kind, value = self.peek()
+        return "end of query" if kind is None else repr(value)
+
+    def take(self, value=None, kind=None):
+        token = self.peek()
+        if (value is not None and token[1] != value) or (kind is not None and token[0] != kind):
+            raise QueryError(f"expected {value or kind}, got {self.describe()}")
+        self.pos += 1
+        return token[1]
+
+    def parse(self):
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"unexpected {self.describe()}")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek()[1] in ("+", "-"):
+            node = ("binary", self.take(), node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek()[1] in ("*", "/"):
+            node = ("binary", self.take(), node, self.unary())
+        return node
+
+    def unary(self):
+        kind, value = self.peek()
+        if value == "-":
+            self.take()
+            return ("binary", "*", ("number", -1.0), self.unary())
+        if kind == "number":
+            self.take()
+            node = ("number", float(value))
+        elif value == "(":
+            self.take()
+            node = self.expr()
+            self.take(")")
+        elif kind == "ident" and value in AGGREGATIONS:
+            node = self.aggregation()
+        elif kind == "ident" and self.tokens[self.pos + 1:self.pos + 2] == [("op", "(")]:
+            node = self.call()
+        elif kind == "ident":
+            node = self.selector()
+        else:
+            raise QueryError(f"unexpected {self.describe()}")
+        if self.peek()[0] == "duration":
+            node = ("range", node, _duration(self.take()))
+        return node
+
+    def labels(self):
+        self.take("(")
+        names = []
+        while self.peek()[1] != ")":
+            names.append(self.take(kind="ident"))
+            if self.peek()[1] == ",":
+                self.take()
+        self.take(")")
+        return tuple(names)
+
+    def aggregation(self):
+        op = self.take()
+        by = None
+        if self.peek()[1] == "by":
+            self.take()
+            by = self.labels()
+        self.take("(")
+        node = self.expr()
+        self.take(")")
+        if by is None and self.peek()[1] == "by":
+            self.take()
+            by = self.labels()
+        return ("aggregate", op, by or (), node)
+
+    def call(self):
+        name = self.take()
+        self.take("(")
+        args = [self.expr()]
+        while self.peek()[1] == ",":
+            self.take()
+            args.append(self.expr())
+        self.take(")")
+        if name == "rate" and len(args) == 1:
+            return ("rate", _range_arg(name, args[0]))
+        if name in OVER_TIME and len(args) == 1:
+            return ("over_time", name, _range_arg(name, args[0]))
+        if name == "quantile_over_time" and len(args) == 2 and args[0][0] == "number":
+            return ("quantile", args[0][1], _range_arg(name, args[1]))
+        raise QueryError(f"unknown function or arguments: {name}")
+
+    def selector(self):
+        name = self.take()
+        matchers = []
+        if self.peek()[1] == "{":
+            self.take()
+            while self.peek()[1] != "}":
+                label = self.take(kind="ident")
+                op = self.take(kind="op")
+                if op not in _MATCHERS:
+                    raise QueryError(f"bad matcher operator {op!r}")
+                value = self.take(kind="string")[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+                if op in ("=~", "!~"):
+                    try:
+                        value = re.compile(value)
+                    except re.error as e:
+                        raise QueryError(f"bad regex {value!r}: {e}")
+                matchers.append((label, _MATCHERS[op], value))
+                if self.peek()[1] == ",":
+                    self.take()
+            self.take("}")
+        return ("select", name, tuple(matchers))
+
+def _range_arg(name, node):
+    if node[0] != "range":
+        raise QueryError(f"{name} expects a range, e.g. metric[1m]")
+    return node
+
+def parse_query(text):
+    if len(text) > MAX_QUERY_LENGTH:
+        raise QueryError(f"query longer than {MAX_QUERY_LENGTH} characters")
+    return _Parser(text).parse()
+
+def _lookback(node):
+    """Сколько секунд истории до начала окна нужно окнам в запросе."""
+    lookback = max((_lookback(node[i]) for i in _CHILDREN.get(node[0], ())), default=0)
+    return lookback + node[2] if node[0] == "range" else lookback
+
+class Series:
+    """Результат выражения: общие timestamps, лейблы серий и матрица [строка, серия]."""
+
+    __slots__ = ("timestamps", "labels", "values")
+
+    def __init__(self, timestamps, labels, values):
+        self.timestamps = timestamps
+        self.labels = labels
+        self.values = values
+
+@contextmanager
+def _quiet():
+    # NaN-функции по окну или группе из одних пропусков предупреждают — это ожидаемо
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        yield
+
+def _tail(series, n):
+    """Последние n строк: все выборки кончаются последней строкой снапшота."""
+    skip = len(series.timestamps) - n
+    if not skip:
+        return series
+    return Series(series.timestamps[skip:], series.labels, series.values[skip:])
+
+def _identity(labels):
+    return tuple(sorted((name, value) for name, value in labels.items() if name != "__name__"))
+
+def _ffill(values):
+    """Пропуски (NaN) заполняются предыдущим значением по каждой серии."""
+    rows = np.arange(len(values))[:, None]
+    index = np.where(np.isnan(values), 0, rows)
+    np.maximum.accumulate(index, axis=0, out=index)
+    return values[index, np.arange(values.shape[1])]
+
+def _window_starts(timestamps, seconds):
+    return np.searchsorted(timestamps, timestamps - seconds, side="left")
+
+def _rate(series, seconds):
+    """Скорость счётчика в секунду за окно: сброс счётчика — новый отсчёт от нуля.
+
+    Как в PromQL, у результата нет __name__: это уже не исходная метрика.
+    """
+    values = _ffill(series.values)
+    increase = np.diff(values, axis=0)
+    increase = np.where(increase < 0, values[1:], increase)
+    cumulative = np.vstack([np.zeros((1, values.shape[1])), np.nancumsum(increase, axis=0)])
+    starts = _window_starts(series.timestamps, seconds)
+    elapsed = series.timestamps - series.timestamps[starts]
+    with _quiet():
+        result = (cumulative - cumulative[starts]) / elapsed[:, None]
+    result[elapsed == 0] = np.nan
+    result[np.isnan(series.values)] = np.nan
+    return Series(series.timestamps, [_without_name(labels) for labels in series.labels], result)
+
+def _over_time(series, seconds, reduce):
+    """Скользящая функция по окну seconds; окно в строках — по медианному шагу.
+
+    __name__ у результата, как и у rate, отбрасывается.
+    """
+    timestamps, values = series.timestamps, series.values
+    labels = [_without_name(labels) for labels in series.labels]
+    if len(timestamps) < 2:
+        return Series(timestamps, labels, values)
+    step = float(np.median(np.diff(timestamps))) or 1.0
+    width = max(1, min(len(timestamps), int(round(seconds / step)) + 1))
+    result = np.full(values.shape, np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(values, width, axis=0)
+    chunk = max(1, WINDOW_CHUNK_ELEMENTS // max(1, width * values.shape[1]))
+    with _quiet():
+        for start in range(0, len(windows), chunk):
+            part = windows[start:start + chunk]
+            result[width - 1 + start:width - 1 + start + len(part)] = reduce(part, axis=-1)
+    return Series(timestamps, labels, result)
+
+def _aggregate(series, op, by):
+    groups = {}
+    for column, labels in enumerate(series.labels):
+        key = tuple((name, labels.get(name, "")) for name in by)
+        groups.setdefault(key, []).append(column)
+    present = ~np.isnan(series.values)
+    labels, columns = [], []
+    for key, indexes in groups.items():
+        values = series.values[:, indexes]
+        count = present[:, indexes].sum(axis=1)
+        if op == "count":
+            column = count.astype(np.float64)
+        else:
+            with _quiet():
+                column = {"sum": np.nansum, "avg": np.nanmean, "max": np.nanmax, "min": np.nanmin}[op](values, axis=1)
+            column[count == 0] = np.nan
+        labels.append(dict(key))
+        columns.append(column)
+    values = np.column_stack(columns) if columns else np.empty((len(series.timestamps), 0))
+    return Series(series.timestamps, labels, values)
+
+def _binary(op, left, right):
+    func = _BINARY[op]
+    with _quiet():
+        if not isinstance(left, Series) and not isinstance(right, Series):
+            return float(func(left, right))
+        if not isinstance(left, Series):
+            return Series(right.timestamps, [_without_name(labels) for labels in right.labels],
+                          func(left, right.values))
+        if not isinstance(right, Series):
+            return Series(left.timestamps, [_without_name(labels) for labels in left.labels],
+                          func(left.values, right))
+        n = min(len(left.timestamps), len(right.timestamps))
+        left, right = _tail(left, n), _tail(right, n)
+        if len(right.labels) == 1:
+            return Series(left.timestamps, [_without_name(labels) for labels in left.labels],
+                          func(left.values, right.values))
+        if len(left.labels) == 1:
+            return Series(right.timestamps, [_without_name(labels) for labels in right.labels],
+                          func(left.values, right.values))
+        # Один к одному: пары серий с одинаковыми лейблами (без имени метрики)
+        positions = {_identity(labels): i for i, labels in enumerate(right.labels)}
+        pairs = [(i, positions[_identity(labels)]) for i, labels in enumerate(left.labels)
+                 if _identity(labels) in positions]
+        left_index = [i for i, _ in pairs]
+        right_index = [j for _, j in pairs]
+        return Series(left.timestamps, [_without_name(left.labels[i]) for i in left_index],
+                      func(left.values[:, left_index], right.values[:, right_index]))
+
+def _without_name(labels):
+    return {name: value for name, value in labels.items() if name != "__name__"}
+
+class _Evaluator:
+    def __init__(self, history, index, first_seq):
+        self.history = history
+        self.index = index
+        self.first_seq = first_seq
+        self.labels = {key: labels for entries in index.values() for key, labels in entries}
+
+    def eval(self, node):
+        kind = node[0]
+        if kind == "number":
+            return node[1]
+        if kind == "select":
+            return self.select(node[1], node[2])
+        if kind == "range":
+            # Окно само по себе ничего не меняет — его читают rate/*_over_time
+            return self.eval(node[1])
+        if kind == "rate":
+            return _rate(self.series(node[1][1]), node[1][2])
+        if kind == "over_time":
+            return _over_time(self.series(node[2][1]), node[2][2], OVER_TIME[node[1]])
+        if kind == "quantile":
+            quantile = node[1]
+            if not 0 <= quantile <= 1:
+                raise QueryError("quantile must be between 0 and 1")
+            reduce = lambda values, axis: np.nanquantile(values, quantile, axis=axis)
+            return _over_time(self.series(node[2][1]), node[2][2], reduce)
+        if kind == "aggregate":
+            return _aggregate(self.series(node[3]), node[1], node[2])
+        if kind == "binary":
+            return _binary(node[1], self.eval(node[2]), self.eval(node[3]))
+        raise QueryError(f"unsupported expression {kind}")
+
+    def series(self, node):
+        result = self.eval(node)
+        if not isinstance(result, Series):
+            raise QueryError("expected series, got a number")
+        return result
+
+    def select(self, name, matchers):
+        keys = [key for key, labels in self.index.get(name, ())
+                if all(match(labels.get(label, ""), expected) for label, match, expected in matchers)]
+        columns = [self.history.arrays(key, self.first_seq) for key in keys]
+        if not columns:
+            return Series(np.empty(0), [], np.empty((0, 0)))
+        # Писатель мог вытеснить старые строки между чтениями: выравниваем по хвосту
+        n = min(len(timestamps) for timestamps, _ in columns)
+        timestamps = np.frombuffer(columns[0][0], dtype=np.float64)[-n:]
+        values = np.column_stack([np.frombuffer(values, dtype=np.float64)[len(values) - n:]
+                                  for _, values in columns]) if n else np.empty((0, len(keys)))
+        labels = [dict(self.labels[key], __name__=name) for key in keys]
+        return Series(timestamps, labels, values)
+
+def build_index(columns):
+    """{имя метрики: [(ключ серии, {лейбл: значение})]} по колонкам истории."""
+    index = {}
+    for key in columns:
+        try:
+            _, name, labels = parse_series(key)
+        except ValueError:
+            continue
+        index.setdefault(name, []).append((key, dict(labels)))
+    return index
+
+def run_query(history, text, start_time, max_points=None, agg="avg", index=None):
+    """Выполняет запрос над HistoryView с start_time; [{"metric", "values"}] как у /api/metrics/history."""
+    tree = parse_query(text)
+    if index is None:
+        index = build_index(history.columns)
+    evaluator = _Evaluator(history, index, history.seq_at(start_time - _lookback(tree)))
+    result = evaluator.eval(tree)
+    if not isinstance(result, Series):
+        return [{"metric": {}, "value": result}]
+    keep = result.timestamps >= start_time
+    timestamps = np.ascontiguousarray(result.timestamps[keep])
+    output = []
+    for column, labels in enumerate(result.labels):
+        values = np.ascontiguousarray(result.values[keep, column])
+        output.append({"metric": labels, "values": downsample(timestamps, values, max_points, agg)})
+    return output
+
+class QueryCache:
+    """Результаты запросов по снапшоту: каждый запрос считается не чаще раза на скрейп.
+
+    При смене снапшота кэш сбрасывается; за один снапшот хранится не больше
+    size разных запросов, остальные считаются без кэша.
+    """
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self._snapshot = None
+        self._results = {}
+        self._index = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _current(self, snapshot):
+        if self._snapshot is not snapshot:
+            self._snapshot = snapshot
+            self._results = {}
+            self._index = None
+        return self._results
+
+    def get(self, snapshot, key, build):
+        """build(index) — функция от индекса серий снапшота."""
+        with self._lock:
+            result = self._current(snapshot).get(key)
+            index = self._index
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        if index is None:
+            index = build_index(snapshot.history.columns)
+        result = build(index)
+        with self._lock:
+            results = self._current(snapshot)
+            if self._index is None:
+                self._index = index
+            if len(results) < self.size:
+                results[key] = result
+        return result
@@ -0,0 +1,119 @@
+from collections import deque
+
+# Типы "# TYPE", у которых _count/_sum — монотонные счётчики
+SUMMARY_TYPES = ("summary", "histogram")
+
+class CounterWindow:
+    """Скользящее окно монотонного счётчика с учётом сбросов.
+
+    Сброс (значение меньше предыдущего — рестарт процесса) компенсируется
+    смещением, поэтому приращение за окно не уходит в минус.
+    """
+
+    __slots__ = ("seconds", "offset", "last", "points")
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.offset = 0.0
+        self.last = None
+        self.points = deque()
+
+    def add(self, timestamp, value):
+        if self.last is not None and value < self.last:
+            self.offset += self.last
+        self.last = value
+        self.points.append((timestamp, value + self.offset))
+        # Оставляем одну точку на границе окна или раньше — от неё считается приращение
+        while len(self.points) > 2 and self.points[1][0] <= timestamp - self.seconds:
+            self.points.popleft()
+
+    def delta(self):
+        """(приращение, секунды) за окно или None, пока точек меньше двух."""
+        if len(self.points) < 2:
+            return None
+        (start_ts, start), (end_ts, end) = self.points[0], self.points[-1]
+        return end - start, end_ts - start_ts
+
+def derived_key(key, name, suffix):
+    """'name{labels}' -> 'name<suffix>{labels}'."""
+    return name + suffix + key[len(name):]
+
+class RateEngine:
+    """Производные серии коллектора, считаются на каждом скрейпе.
+
+    Для counter — скорость в секунду за окно ("<name>:rate{labels}"), для
+    summary/histogram — скорость по _count и среднее за окно
+    Δ_sum/Δ_count ("<family>:avg{labels}"). Состояние — окно на серию,
+    поэтому стоимость скрейпа не зависит от глубины истории.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        # {key: (rate_key, CounterWindow) | None} — None: серия не счётчик
+        self._rates = {}
+        # {avg_key: (CounterWindow по _sum, CounterWindow по _count)}
+        self._averages = {}
+        # {key: (avg_key, 0 для _sum / 1 для _count) | None}
+        self._avg_routes = {}
+
+    def _route_rate(self, sample):
+        if sample.type == "counter" and not sample.name.endswith("_created"):
+            return derived_key(sample.key, sample.name, ":rate"), CounterWindow(self.window)
+        if sample.type in SUMMARY_TYPES and sample.name.endswith("_count"):
+            return derived_key(sample.key, sample.name, ":rate"), CounterWindow(self.window)
+        return None
+
+    def _route_avg(self, sample):
+        if sample.type not in SUMMARY_TYPES:
+            return None
+        for suffix, position in (("_sum", 0), ("_count", 1)):
+            if sample.name.endswith(suffix):
+                family = sample.name[:-len(suffix)]
+                return family + ":avg" + sample.key[len(sample.name):], position
+        return None
+
+    def update(self, timestamp, samples):
+        """Производные значения {derived_key: value} для сэмплов одного скрейпа."""
+        derived = {}
+        pairs = {}
+        for sample in samples:
+            route = self._rates.get(sample.key, False)
+            if route is False:
+                route = self._rates[sample.key] = self._route_rate(sample)
+            if route is not None:
+                rate_key, window = route
+                window.add(timestamp, sample.value)
+                delta = window.delta()
+                if delta is not None and delta[1] > 0:
+                    derived[rate_key] = delta[0] / delta[1]
+            avg_route = self._avg_routes.get(sample.key, False)
+            if avg_route is False:
+                avg_route = self._avg_routes[sample.key] = self._route_avg(sample)
+            if avg_route is not None:
+                avg_key, position = avg_route
+                pairs.setdefault(avg_key, [None, None])[position] = sample.value
+        for avg_key, (total, count) in pairs.items():
+            if total is None or count is None:
+                continue
+            windows = self._averages.get(avg_key)
+            if windows is None:
+                windows = self._averages[avg_key] = (CounterWindow(self.window), CounterWindow(self.window))
+            windows[0].add(timestamp, total)
+            windows[1].add(timestamp, count)
+            total_delta, count_delta = windows[0].delta(), windows[1].delta()
+            # Без запросов за окно среднее не определено — точку не пишем
+            if total_delta is not None and count_delta is not None and count_delta[0] > 0:
+                derived[avg_key] = total_delta[0] / count_delta[0]
+        return derived
+
+    def forget(self, keys):
+        """Забывает состояние исходных серий keys; возвращает их производные ключи."""
+        derived = []
+        for key in keys:
+            route = self._rates.pop(key, None)
+            if route is not None:
+                derived.append(route[0])
+            avg_route = self._avg_routes.pop(key, None)
+            if avg_route is not None and self._averages.pop(avg_route[0], None) is not None:
+                derived.append(avg_route[0])
+        return derived
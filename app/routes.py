@@ -1,7 +1,14 @@
-from flask import Blueprint, render_template, jsonify, request
-from .metrics import get_metrics_data, get_metrics_history, start_metrics_thread
+from flask import Blueprint, Response, render_template, jsonify, request, abort, g
+from .metrics import targets, get_target
+from .downsample import AGGREGATIONS, check_max_points
+from .selfmetrics import registry, ROUTE_SECONDS
+from .snapshot import ENCODINGS, COMPRESS_MIN_BYTES, DATA_FIELDS, encode_json
+from .stream import encode_event
+from .jserrors import js_errors
+from .query import run_query, QueryError
 import time
-from .config import METRICS_CONFIG, PROMINENT_METRICS
+from .config import JS_ERROR_LOG_PATH
+from . import dashboard_config
 import os
 
 dashboard_bp = Blueprint("dashboard", __name__)
@@ -10,18 +17,182 @@ dashboard_bp = Blueprint("dashboard", __name__)
 def dashboard():
     return render_template("dashboard.html")
 
+@dashboard_bp.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@dashboard_bp.after_request
+def _observe_request(response):
+    # Лейбл — шаблон маршрута, а не путь: число серий не растёт от параметров
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    ROUTE_SECONDS.observe(time.perf_counter() - g.request_started, route, request.method, str(response.status_code))
+    return response
+
+@dashboard_bp.route("/self/metrics")
+def self_metrics():
+    """Метрики самого дашборда в текстовом формате Prometheus."""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def _target():
+    """Цель из ?instance= (без параметра — цель по умолчанию), 404 для неизвестной."""
+    target = get_target(request.args.get("instance"))
+    if target is None:
+        abort(404)
+    return target
+
+def _snapshot_response(snapshot, body):
+    """Отдаёт заранее сериализованное тело снапшота с ETag (304 при совпадении).
+
+    Сжатое тело (br/gzip по Accept-Encoding) тоже готовится один раз на снапшот,
+    так что запрос сводится к копированию готовых байтов.
+    """
+    encoding = None
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+    response = Response(snapshot.encoded(body, encoding), mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    # Данные меняются каждый скрейп: браузер всегда перепроверяет ETag
+    response.headers["Cache-Control"] = "no-cache"
+    # У разных кодировок — разные ETag (у каждой свои байты)
+    response.set_etag(f"{snapshot.etag}-{encoding}" if encoding else snapshot.etag)
+    return response.make_conditional(request)
+
 @dashboard_bp.route("/data")
 def data():
-    return jsonify(get_metrics_data())
+    snapshot = _target().snapshot
+    # ?fields=metrics,kpi,... — только нужные поля (например, без history)
+    fields = request.args.get("fields")
+    if fields is None:
+        return _snapshot_response(snapshot, snapshot.data_json())
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in DATA_FIELDS]
+    if unknown:
+        return jsonify({
+            "status": "error",
+            "error": f"Unknown fields: {', '.join(unknown)}; expected: {', '.join(DATA_FIELDS)}"
+        }), 400
+    return _snapshot_response(snapshot, snapshot.data_json(fields))
 
 @dashboard_bp.route("/history")
 def history():
-    return jsonify(get_metrics_history())
+    snapshot = _target().snapshot
+    # ?kpi=1 — только история KPI (для карточек KPI), без всех серий
+    kpi = bool(request.args.get("kpi"))
+    # ?since=<cursor> — только точки, добавленные после курсора
+    since = request.args.get("since", type=int)
+    if since is not None:
+        return _snapshot_response(snapshot, snapshot.history_delta_json(since, kpi))
+    if kpi:
+        return _snapshot_response(snapshot, snapshot.kpi_history_json())
+    return _snapshot_response(snapshot, snapshot.history_json())
+
+@dashboard_bp.route("/stream")
+def stream():
+    """Server-Sent Events: кадр на каждый завершённый скрейп."""
+    target = _target()
+    broadcaster = target.broadcaster
+    # Сначала подписка, потом снимок: кадры не теряются, устаревшие клиент отбросит по version
+    client = broadcaster.subscribe()
+    snapshot = target.snapshot
+    alerts = target.alerts.active()
+    def events():
+        yield snapshot.stream_init_event()
+        # Текущие алерты целиком; дальше приходят только переходы (event: alert)
+        yield encode_event("alerts", encode_json(alerts))
+        yield from broadcaster.frames(client)
+    response = Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(lambda: broadcaster.unsubscribe(client))
+    return response
+
+@dashboard_bp.route("/api/targets")
+def list_targets():
+    """Цели скрейпа и их состояние."""
+    result = []
+    for name, state in targets.items():
+        snapshot = state.snapshot
+        stats = state.stats()
+        result.append({
+            "instance": name,
+            "url": state.target.url,
+            "interval": state.target.interval,
+            "timeout": state.target.timeout,
+            "last_updated": snapshot.last_updated,
+            "scrape_duration": stats.get("scrape_duration"),
+            # series/dropped/evicted — бюджет серий цели (app/cardinality.py)
+            "cardinality": stats.get("cardinality"),
+            "error": snapshot.error
+        })
+    return jsonify({"status": "success", "data": result})
+
+@dashboard_bp.route("/api/config")
+def config_status():
+    """Действующая версия конфигурации и ошибка последней перезагрузки файла."""
+    settings = dashboard_config.current_config()
+    return jsonify({"status": "success", "data": {
+        "version": settings.version,
+        "source": settings.source,
+        "loaded_at": settings.loaded_at,
+        "categories": [category["category"] for category in settings.metrics_config],
+        "kpi": list(settings.prominent),
+        "alert_rules": [rule.name for rule in settings.alert_rules],
+        "last_error": dashboard_config.last_error
+    }})
+
+@dashboard_bp.route("/api/alerts")
+def list_alerts():
+    """Активные алерты и последние переходы; без ?instance= — по всем целям."""
+    states = [_target()] if "instance" in request.args else list(targets.values())
+    active, history = [], []
+    for state in states:
+        active.extend(state.alerts.active())
+        history.extend(state.alerts.history())
+    history.sort(key=lambda transition: transition["at"])
+    return jsonify({"status": "success", "data": {"active": active, "history": history}})
+
+@dashboard_bp.route("/api/query")
+def query():
+    """Векторный запрос к истории цели: выборка по лейблам, sum/avg/... by,
+    rate, quantile_over_time, арифметика между сериями (синтаксис — app/query.py).
+
+    Окно отсчитывается от последнего скрейпа, так что одинаковые запросы
+    считаются один раз на снапшот и дальше отдаются из кэша.
+    """
+    target = _target()
+    text = request.args.get("query", "").strip()
+    interval_minutes = request.args.get("interval", 30, type=int)
+    max_points = request.args.get("max_points", type=int)
+    agg = request.args.get("agg", "avg")
+    if not text:
+        return jsonify({"status": "error", "error": "Missing 'query' parameter"}), 400
+    if agg not in AGGREGATIONS:
+        return jsonify({
+            "status": "error",
+            "error": f"Unknown agg '{agg}', expected one of: {', '.join(AGGREGATIONS)}"
+        }), 400
+    error = check_max_points(max_points, agg)
+    if error:
+        return jsonify({"status": "error", "error": error}), 400
+    snapshot = target.snapshot
+    start_time = (snapshot.last_updated or time.time()) - interval_minutes * 60
+    def build(index):
+        result = run_query(snapshot.history, text, start_time, max_points, agg, index)
+        return encode_json({"status": "success", "data": {"result": result, "instance": target.name}})
+    try:
+        body = target.queries.get(snapshot, (text, interval_minutes, max_points, agg), build)
+    except QueryError as e:
+        return jsonify({"status": "error", "error": f"Bad query: {e}"}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "error": f"Failed to run query: {str(e)}"}), 500
+    return _snapshot_response(snapshot, body)
 
 # Новая точка: возвращает историю сразу по нескольким метрикам
 @dashboard_bp.route("/api/metrics/history")
 def metrics_history():
     """Return history for multiple metrics at once."""
+    target = _target()
     try:
         metrics_param = request.args.get("metrics", "")
         interval = request.args.get("interval", "30")
@@ -29,21 +200,32 @@ def metrics_history():
             interval_minutes = int(interval)
         except ValueError:
             interval_minutes = 30
+        since = request.args.get("since", type=int)
+        # max_points/agg — прореживание на сервере (lttb, avg, min, max, minmax)
+        max_points = request.args.get("max_points", type=int)
+        agg = request.args.get("agg", "lttb")
+        if agg not in AGGREGATIONS:
+            return jsonify({
+                "status": "error",
+                "error": f"Unknown agg '{agg}', expected one of: {', '.join(AGGREGATIONS)}"
+            }), 400
+        error = check_max_points(max_points, agg)
+        if error:
+            return jsonify({"status": "error", "error": error}), 400
         metric_ids = [m.strip() for m in metrics_param.split(',') if m.strip()]
         now = int(time.time())
         start_time = now - interval_minutes * 60
-        history = get_metrics_history()
+        history, cursor, resolution = target.history_range(metric_ids, start_time, since, max_points, agg,
+                                                           interval_minutes * 60)
         results = []
         for metric_id in metric_ids:
-            values = history.get(metric_id, [])
-            filtered = [v for v in values if v[0] >= start_time]
             results.append({
-                "metric": {"__name__": metric_id},
-                "values": [[ts, val] for ts, val in filtered]
+                "metric": {"__name__": metric_id, "instance": target.name},
+                "values": history[metric_id]
             })
         return jsonify({
             "status": "success",
-            "data": {"result": results}
+            "data": {"result": results, "cursor": cursor, "resolution": resolution}
         })
     except Exception as e:
         return jsonify({
@@ -51,37 +233,18 @@ def metrics_history():
             "error": f"Failed to get metrics history: {str(e)}"
         }), 500
 
-js_error_log = []
-JS_ERROR_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'js_error.log')
-
 @dashboard_bp.route('/log-js-error', methods=['POST'])
 def log_js_error():
-    data = request.get_json(force=True)
-    context = data.get('context', 'unknown')
-    error = data.get('error', 'unknown')
-    entry = {'context': context, 'error': error}
-    js_error_log.append(entry)
-    print(f"[JS ERROR] Context: {context}\nError: {error}")
-    print(f"[JS ERROR] Путь к файлу: {JS_ERROR_LOG_PATH}")
-    # Оставляем только последние 100 ошибок
-    if len(js_error_log) > 100:
-        js_error_log.pop(0)
-    # Записываем ошибку в файл
-    try:
-        print(f"[JS ERROR] Пытаемся записать в файл: {JS_ERROR_LOG_PATH}")
-        with open(JS_ERROR_LOG_PATH, 'a', encoding='utf-8') as f:
-            f.write(f"[JS ERROR] Context: {context}\nError: {error}\n\n")
-        print(f"[JS ERROR] Успешно записано в файл")
-    except Exception as e:
-        print(f"[JS ERROR] Не удалось записать в файл: {e}")
-        print(f"[JS ERROR] Тип ошибки: {type(e)}")
-        import traceback
-        print(f"[JS ERROR] Traceback: {traceback.format_exc()}")
-    return '', 204
+    """Принимает JS-ошибку с фронта; запись на диск — в фоне (app/jserrors.py)."""
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return '', 400
+    accepted = js_errors.submit(request.remote_addr, data.get('context', 'unknown'), data.get('error', 'unknown'))
+    return ('', 204) if accepted else ('', 429)
 
 @dashboard_bp.route('/log-js-error', methods=['GET'])
 def get_js_error_log():
-    return jsonify(js_error_log)
+    return jsonify(js_errors.recent())
 
 @dashboard_bp.route('/debug-log-path')
 def debug_log_path():
@@ -127,12 +290,10 @@ def debug_info():
             'log_file_info': log_file_info
         },
         'app': {
-            'js_errors_count': len(js_error_log),
+            'js_errors_count': len(js_errors),
             'metrics_count': len(metrics_data.get('metrics', {})) if metrics_data else 0,
             'history_count': len(history_data) if history_data else 0,
-            'prominent_metrics': list(PROMINENT_METRICS.keys())
+            'prominent_metrics': list(dashboard_config.current_config().prominent.keys())
         },
-        'js_errors': js_error_log[-5:] if js_error_log else []  # Последние 5 ошибок
+        'js_errors': js_errors.recent(5)  # Последние 5 ошибок
     })
-
-start_metrics_thread()
@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from .selfmetrics import SCRAPE_STAGE_SECONDS, SCRAPE_SECONDS
+
+class Target:
+    """Цель скрейпа: адрес, расписание и состояние условных запросов."""
+
+    def __init__(self, name, url, interval, timeout):
+        self.name = name
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        # ETag/Last-Modified последнего ответа — для If-None-Match/If-Modified-Since
+        self.etag = None
+        self.last_modified = None
+        self.next_due = 0.0
+        self.scheduled = None
+        self.busy = False
+        self.last_duration = None
+        # Опоздание старта скрейпа относительно расписания (секунды)
+        self.last_drift = None
+
+class ScrapeEngine:
+    """Параллельный скрейп списка целей.
+
+    Ограниченный пул потоков и общая requests.Session (keep-alive, gzip).
+    У каждой цели своё расписание и таймаут: медленная цель занимает только
+    свой поток и не задерживает остальные. on_response(target, response)
+    вызывается с открытым потоковым ответом (None — ответ 304 Not Modified),
+    on_error(target, exc) — при любой ошибке.
+    """
+
+    def __init__(self, targets, on_response, on_error, workers):
+        self.targets = targets
+        self.on_response = on_response
+        self.on_error = on_error
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip"
+        adapter = HTTPAdapter(pool_connections=max(1, len(targets)), pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrape")
+        self._wakeup = threading.Event()
+
+    def scrape(self, target):
+        headers = {}
+        if target.etag:
+            headers["If-None-Match"] = target.etag
+        if target.last_modified:
+            headers["If-Modified-Since"] = target.last_modified
+        started = time.monotonic()
+        target.last_drift = started - target.scheduled
+        try:
+            with self.session.get(target.url, timeout=target.timeout, stream=True, headers=headers) as response:
+                # fetch — до заголовков ответа; чтение тела идёт вместе с разбором
+                SCRAPE_STAGE_SECONDS.observe(time.monotonic() - started, target.name, "fetch")
+                if response.status_code == 304:
+                    self.on_response(target, None)
+                else:
+                    response.raise_for_status()
+                    target.etag = response.headers.get("ETag")
+                    target.last_modified = response.headers.get("Last-Modified")
+                    self.on_response(target, response)
+        except Exception as e:
+            self.on_error(target, e)
+        finally:
+            target.last_duration = time.monotonic() - started
+            SCRAPE_SECONDS.observe(target.last_duration, target.name)
+            target.busy = False
+            self._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            for target in self.targets:
+                if not target.busy and target.next_due <= now:
+                    target.busy = True
+                    # next_due == 0 — первый скрейп цели, отсчёт шага от него
+                    target.scheduled = target.next_due or now
+                    # Фиксированный шаг; после долгого скрейпа не догоняем пачкой
+                    target.next_due = max(target.scheduled + target.interval, now)
+                    self.executor.submit(self.scrape, target)
+            idle = [target.next_due for target in self.targets if not target.busy]
+            timeout = min(idle) - time.monotonic() if idle else 1.0
+            self._wakeup.wait(max(0.0, timeout))
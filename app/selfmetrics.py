@@ -0,0 +1,114 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Границы корзин гистограмм длительности (секунды)
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Histogram:
+    """Гистограмма Prometheus с лейблами; observe потокобезопасен."""
+
+    def __init__(self, name, help_text, label_names, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # {значения лейблов: [счётчики корзин..., sum, count]}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {values[-1]}")
+        return lines
+
+class Gauge:
+    """Gauge, значения которого считаются при выдаче /self/metrics.
+
+    collect() возвращает [(label_values, value), ...]; на горячем пути
+    коллектора gauge ничего не стоит.
+    """
+
+    def __init__(self, name, help_text, label_names, collect, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in self.collect():
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, label_values)))} {_format_value(value)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, help_text, label_names=(), buckets=DURATION_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name, help_text, label_names, collect, kind="gauge"):
+        self._metrics[name] = Gauge(name, help_text, label_names, collect, kind)
+        return self._metrics[name]
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Этапы скрейпа: fetch, parse, admit, kpi, rates, lock_wait, history, storage,
+# publish, lock_hold, alerts
+SCRAPE_STAGE_SECONDS = registry.histogram(
+    "amity_dashboard_scrape_stage_seconds", "Duration of each collector stage per scrape.", ("instance", "stage"))
+SCRAPE_SECONDS = registry.histogram(
+    "amity_dashboard_scrape_seconds", "Total duration of a scrape, including fetch.", ("instance",))
+ROUTE_SECONDS = registry.histogram(
+    "amity_dashboard_request_seconds", "Time to build a response per route.", ("route", "method", "status"))
+SERIALIZE_SECONDS = registry.histogram(
+    "amity_dashboard_serialize_seconds", "Time to serialise a snapshot body.", ("body",))
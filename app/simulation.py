@@ -0,0 +1,328 @@
+"""Режим симуляции: настоящий скрейп, разбор и история на синтетических данных.
+
+Вместо METRICS_TARGETS дашборд скрейпит локальный экспортёр, который
+либо генерирует экспозицию узла Amity на заданное число серий (с
+оттоком серий и долей счётчиков), либо проигрывает записанные скрейпы
+в N раз быстрее. Данные идут через обычный update_metrics, так что
+видно, сколько серий и какую частоту скрейпа выдерживает дашборд.
+
+    python -m app.simulation serve --series 100000 --churn 0.01   # отдельный экспортёр
+    python -m app.simulation record http://node:8080/metrics capture.prom --count 600
+"""
+import argparse
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from .selfmetrics import registry
+
+SIMULATION_PORT = 9109
+# Настройки симуляции по умолчанию (DASHBOARD_DEBUG = True без SIMULATION)
+SIMULATION_DEFAULTS = {"series": 2000, "churn": 0.001, "counter_ratio": 0.5}
+# Заголовок записи в файле скрейпов: "# CAPTURE <unix time> <байт тела>"
+CAPTURE_HEADER = "# CAPTURE"
+
+# Строки # TYPE для серий узла (jetty_server_requests_seconds — summary)
+NODE_TYPES = [
+    "# TYPE tx_pool_size gauge",
+    "# TYPE jvm_gc_pause_seconds summary",
+    "# TYPE jetty_server_requests_seconds summary",
+    "# TYPE postgres_rows_inserted_total counter",
+    "# TYPE postgres_blocks_reads_total counter",
+]
+# Серии «узла» — то, на что смотрят KPI и алерты: (серия, тип, уровень, разброс)
+# для gauge уровень — среднее значение, для counter — прирост в секунду
+NODE_SERIES = [
+    ("tx_pool_size", "gauge", 300, 0.5),
+    ("process_cpu_usage", "gauge", 0.4, 0.3),
+    ("system_load_average_1m", "gauge", 1.5, 0.4),
+    ('jvm_memory_used_bytes{area="heap",id="Tenured Gen"}', "gauge", 6e8, 0.2),
+    ('jvm_memory_max_bytes{area="heap",id="Tenured Gen"}', "gauge", 1e9, 0),
+    ('jvm_gc_pause_seconds_sum{action="end of minor GC",cause="G1 Evacuation Pause"}', "counter", 0.02, 0),
+    ('jvm_gc_pause_seconds_sum{action="end of major GC",cause="G1 Compaction Pause"}', "counter", 0.002, 0),
+    ('jetty_server_requests_seconds_count{method="POST",outcome="SUCCESS",status="200",uri="/tx",}', "counter", 50, 0),
+    ('jetty_server_requests_seconds_sum{method="POST",outcome="SUCCESS",status="200",uri="/tx",}', "counter", 10, 0),
+    ('postgres_locks{database="db01"}', "gauge", 5, 0.8),
+    ('postgres_connections{database="db01"}', "gauge", 40, 0.2),
+    ('postgres_rows_inserted_total{database="db01"}', "counter", 200, 0),
+    ('postgres_blocks_reads_total{database="db01"}', "counter", 500, 0),
+    ("jvm_threads_live_threads", "gauge", 120, 0.05),
+    ("jvm_classes_loaded_classes", "gauge", 15000, 0.01),
+]
+# Семейства, которыми добирается нужное число серий: (имя, тип, лейбл серии).
+# Последнее не входит в METRICS_CONFIG — на нём работает фильтр
+COUNTER_FAMILIES = [
+    ("jetty_connections_messages_total", "connector"),
+    ("postgres_rows_fetched_total", "table"),
+    ("jvm_gc_memory_allocated_bytes_total", "pool"),
+    ("node_ignored_events_total", "source"),
+]
+GAUGE_FAMILIES = [
+    ("jvm_memory_used_bytes", "id"),
+    ("jetty_threads_current", "pool"),
+    ("postgres_size", "table"),
+    ("system_cpu_usage", "cpu"),
+]
+
+class SyntheticExporter:
+    """Экспозиция узла Amity примерно на series серий.
+
+    churn — доля «размножающих» серий, которые за скрейп сменяют значение
+    лейбла (новая серия вместо старой, как при выкатке или смене подов);
+    counter_ratio — доля счётчиков среди них. Значения считаются векторно
+    в NumPy, строки серий собираются заново только для сменившихся.
+    """
+
+    def __init__(self, series=10000, churn=0.0, counter_ratio=0.5, seed=1):
+        self.churn = churn
+        self.rng = np.random.default_rng(seed)
+        extra = max(0, series - len(NODE_SERIES))
+        counters = int(extra * counter_ratio)
+        # (семейство, тип, лейбл, число серий) — серии семейства идут подряд
+        self.families = []
+        for families, kind, total in ((COUNTER_FAMILIES, "counter", counters),
+                                      (GAUGE_FAMILIES, "gauge", extra - counters)):
+            for i, (name, label) in enumerate(families):
+                count = total // len(families) + (1 if i < total % len(families) else 0)
+                if count:
+                    self.families.append((name, kind, label, count))
+        n = len(NODE_SERIES) + extra
+        self.is_counter = np.zeros(n, dtype=bool)
+        self.level = np.empty(n)
+        self.spread = np.empty(n)
+        self.generation = np.zeros(n, dtype=np.int64)
+        self.prefixes = []
+        for i, (series_name, kind, level, spread) in enumerate(NODE_SERIES):
+            self.prefixes.append(series_name)
+            self.is_counter[i] = kind == "counter"
+            self.level[i], self.spread[i] = level, spread
+        # Позиции, перед которыми вставляются строки # HELP/# TYPE
+        self.type_lines = {0: NODE_TYPES}
+        slot = len(NODE_SERIES)
+        self.churn_slots = np.arange(slot, n)
+        self.labels = {}
+        for name, kind, label, count in self.families:
+            self.type_lines[slot] = [f"# HELP {name} synthetic", f"# TYPE {name} {kind}"]
+            for i in range(count):
+                self.labels[slot + i] = (name, label, i)
+                self.prefixes.append(self._prefix(slot + i))
+            self.is_counter[slot:slot + count] = kind == "counter"
+            self.level[slot:slot + count] = self.rng.uniform(1, 1000, count)
+            self.spread[slot:slot + count] = 0.3
+            slot += count
+        self.phase = self.rng.uniform(0, 2 * np.pi, n)
+        self.values = np.where(self.is_counter, 0.0, self.level)
+        self.started = self.last = time.time()
+
+    def _prefix(self, slot):
+        name, label, i = self.labels[slot]
+        generation = self.generation[slot]
+        return f'{name}{{{label}="{label}-{i}-{generation}",instance="sim",}}'
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    def advance(self, now=None):
+        """Сдвигает значения на время с прошлого вызова и применяет отток серий."""
+        now = time.time() if now is None else now
+        elapsed = max(now - self.last, 1e-3)
+        self.last = now
+        counters = self.is_counter
+        self.values[counters] += self.rng.poisson(self.level[counters] * elapsed)
+        # gauge колеблются вокруг уровня с периодом ~10 минут плюс шум
+        wave = np.sin((now - self.started) / 100.0 + self.phase[~counters])
+        noise = self.rng.normal(0, 0.05, wave.shape)
+        self.values[~counters] = np.maximum(
+            0, self.level[~counters] * (1 + self.spread[~counters] * (wave + noise)))
+        if self.churn and len(self.churn_slots):
+            replaced = self.churn_slots[self.rng.random(len(self.churn_slots)) < self.churn * elapsed]
+            self.generation[replaced] += 1
+            # Новая серия счётчика начинается с нуля
+            self.values[replaced] = np.where(self.is_counter[replaced], 0.0, self.level[replaced])
+            for slot in replaced.tolist():
+                self.prefixes[slot] = self._prefix(slot)
+
+    def render(self):
+        """Текст экспозиции Prometheus для текущих значений."""
+        lines = []
+        for slot, (prefix, value) in enumerate(zip(self.prefixes, self.values.tolist())):
+            header = self.type_lines.get(slot)
+            if header:
+                lines.extend(header)
+            lines.append(f"{prefix} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+class ReplayExporter:
+    """Проигрывает записанные скрейпы в speed раз быстрее, по кругу."""
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self.captures = read_captures(path)
+        if not self.captures:
+            raise ValueError(f"{path}: no captures")
+        first = self.captures[0][0]
+        self.offsets = [timestamp - first for timestamp, _ in self.captures]
+        # Длина круга: до последнего скрейпа плюс один интервал
+        self.duration = self.offsets[-1] + capture_interval(self.captures)
+        self.started = time.time()
+
+    def __len__(self):
+        return len(self.captures)
+
+    def advance(self, now=None):
+        pass
+
+    def body(self, now=None):
+        now = time.time() if now is None else now
+        offset = ((now - self.started) * self.speed) % self.duration
+        return self.captures[max(0, bisect.bisect_right(self.offsets, offset) - 1)][1]
+
+def read_captures(path):
+    """[(timestamp, тело)] из файла записи."""
+    captures = []
+    with open(path, "rb") as f:
+        while True:
+            header = f.readline()
+            if not header:
+                break
+            parts = header.decode("ascii").split()
+            if header.decode("ascii").startswith(CAPTURE_HEADER) and len(parts) == 4:
+                captures.append((float(parts[2]), f.read(int(parts[3]))))
+            elif header.strip():
+                raise ValueError(f"{path}: bad capture header {header[:60]!r}")
+    return captures
+
+def capture_interval(captures):
+    if len(captures) < 2:
+        return 1.0
+    return float(np.median(np.diff([timestamp for timestamp, _ in captures])))
+
+def record(url, path, count, interval, timeout=10.0):
+    """Записывает count скрейпов url с шагом interval секунд в файл path."""
+    import requests
+    session = requests.Session()
+    with open(path, "ab") as f:
+        for i in range(count):
+            started = time.time()
+            body = session.get(url, timeout=timeout).content
+            f.write(f"{CAPTURE_HEADER} {started:.3f} {len(body)}\n".encode("ascii"))
+            f.write(body)
+            f.flush()
+            time.sleep(max(0.0, interval - (time.time() - started)))
+
+class SimulationServer:
+    """HTTP-экспортёр: /metrics/<i> — i-й экспортёр из списка.
+
+    Тело пересобирается не чаще раза в min_interval секунд и общее для
+    всех запросов за это время.
+    """
+
+    def __init__(self, exporters, host="127.0.0.1", port=SIMULATION_PORT, min_interval=0.1):
+        self.exporters = exporters
+        self.bodies = [(0.0, b"")] * len(exporters)
+        self.lock = threading.Lock()
+        self.render_seconds = 0.0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    index = int(self.path.rstrip("/").rsplit("/", 1)[1]) if self.path != "/metrics" else 0
+                    body = server.body(index, min_interval)
+                except (ValueError, IndexError):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}/metrics"
+
+    def body(self, index, min_interval):
+        exporter = self.exporters[index]
+        with self.lock:
+            rendered_at, body = self.bodies[index]
+            now = time.time()
+            if now - rendered_at >= min_interval:
+                started = time.perf_counter()
+                if isinstance(exporter, ReplayExporter):
+                    body = exporter.body(now)
+                else:
+                    exporter.advance(now)
+                    body = exporter.render().encode("utf-8")
+                self.render_seconds = time.perf_counter() - started
+                self.bodies[index] = (now, body)
+        return body
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+def simulation_targets(simulation, interval):
+    """Цели скрейпа для настроек simulation вместо METRICS_TARGETS (сервер не запускается)."""
+    base = f"http://127.0.0.1:{simulation.get('port', SIMULATION_PORT)}/metrics"
+    if "replay" in simulation:
+        speed = simulation.get("speed", 1.0)
+        return [{"name": "replay", "url": f"{base}/0",
+                 "interval": capture_interval(read_captures(simulation["replay"])) / speed}]
+    count = simulation.get("targets", 1)
+    return [{"name": "sim" if count == 1 else f"sim-{i + 1}", "url": f"{base}/{i}",
+             "interval": simulation.get("interval", interval)} for i in range(count)]
+
+def start_simulation(simulation):
+    """Поднимает локальный экспортёр для simulation_targets; возвращает SimulationServer."""
+    if "replay" in simulation:
+        exporters = [ReplayExporter(simulation["replay"], simulation.get("speed", 1.0))]
+    else:
+        exporters = [SyntheticExporter(simulation.get("series", SIMULATION_DEFAULTS["series"]),
+                                       simulation.get("churn", 0.0), simulation.get("counter_ratio", 0.5), seed=i + 1)
+                     for i in range(simulation.get("targets", 1))]
+    server = SimulationServer(exporters, port=simulation.get("port", SIMULATION_PORT)).start()
+    registry.gauge("amity_dashboard_simulation_series", "Series exposed by the synthetic exporter.", ("exporter",),
+                   lambda: [((str(i),), len(exporter)) for i, exporter in enumerate(exporters)])
+    registry.gauge("amity_dashboard_simulation_render_seconds", "Time the exporter spent on its last body.", (),
+                   lambda: [((), server.render_seconds)])
+    print(f"[SIMULATION] {len(exporters)} exporter(s) at {server.url}")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="amity_dashboard simulation exporter")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="serve synthetic or replayed /metrics")
+    serve.add_argument("--series", type=int, default=10000)
+    serve.add_argument("--churn", type=float, default=0.0, help="share of series replaced per second")
+    serve.add_argument("--counter-ratio", type=float, default=0.5)
+    serve.add_argument("--targets", type=int, default=1)
+    serve.add_argument("--replay", help="capture file recorded with 'record'")
+    serve.add_argument("--speed", type=float, default=1.0)
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=SIMULATION_PORT)
+    capture = commands.add_parser("record", help="record scrapes of a real exporter")
+    capture.add_argument("url")
+    capture.add_argument("path")
+    capture.add_argument("--count", type=int, default=600)
+    capture.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.url, args.path, args.count, args.interval)
+        return
+    if args.replay:
+        exporters = [ReplayExporter(args.replay, args.speed)]
+    else:
+        exporters = [SyntheticExporter(args.series, args.churn, args.counter_ratio, seed=i + 1)
+                     for i in range(args.targets)]
+    server = SimulationServer(exporters, args.host, args.port)
+    print(f"Serving {len(exporters)} exporter(s) at http://{args.host}:{args.port}/metrics/<0..{len(exporters) - 1}>")
+    server.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
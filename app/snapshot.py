@@ -0,0 +1,236 @@
+import gzip
+import json
+import os
+import time
+import numpy as np
+from .stream import encode_event
+from .downsample import to_numpy
+from .selfmetrics import SERIALIZE_SECONDS
+
+# orjson и brotli необязательны: без них — стандартный json и только gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Кодировки ответа в порядке предпочтения сервера
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Тела меньше этого размера не сжимаются: выигрыш меньше заголовков
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+# Поля /data (?fields=...) в порядке вывода
+DATA_FIELDS = ("instance", "metrics", "kpi", "categories", "types", "prominent", "config",
+               "history", "cursor", "kpi_cursor", "last_updated", "error")
+
+# Уникален для процесса: ETag не совпадёт со снапшотом до перезапуска
+BOOT_ID = os.urandom(4).hex()
+
+def encode_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class Snapshot:
+    """Неизменяемое состояние дашборда после одного скрейпа.
+
+    Коллектор собирает снапшот один раз на скрейп и публикует его заменой
+    ссылки; обработчики запросов читают его без lock. Тела ответов
+    сериализуются лениво и не больше одного раза на снапшот.
+    """
+
+    def __init__(self, version, instance, metrics, kpi, categories, history, history_keys, kpi_history,
+                 last_updated, error, prominent, config, types=None):
+        self.version = version
+        # instance — имя цели скрейпа, к которой относится снапшот
+        self.instance = instance
+        self.metrics = metrics
+        self.kpi = kpi
+        self.categories = categories
+        # types — {имя метрики: тип из "# TYPE"}; словарь не меняется после публикации
+        self.types = {} if types is None else types
+        # prominent/config — PROMINENT_METRICS и METRICS_CONFIG для фронта
+        self.prominent = prominent
+        self.config = config
+        # history — HistoryView, history_keys — серии, прошедшие фильтр отображения
+        self.history = history
+        self.history_keys = history_keys
+        # kpi_history — HistoryView отдельного потока KPI (строка на скрейп)
+        self.kpi_history = kpi_history
+        self.last_updated = last_updated
+        self.error = error
+        self.etag = f"{BOOT_ID}-{version}"
+        self._bodies = {}
+        # {(id(body), encoding): (body, сжатое тело)} — только для тел из _bodies
+        self._encoded = {}
+
+    def history_dict(self):
+        return {name: self.history.points(name) for name in self.history_keys}
+
+    def kpi_history_dict(self):
+        return {name: self.kpi_history.points(name) for name in self.kpi_history.columns}
+
+    def history_delta(self, since, kpi=False):
+        """Точки, добавленные после строки since (курсор), и новый курсор.
+
+        Если since уже вытеснен из буфера или больше текущего курсора
+        (например, после перезапуска), отдаётся вся история и reset=True.
+        """
+        history = self.kpi_history if kpi else self.history
+        keys = history.columns if kpi else self.history_keys
+        reset = since < history.first_seq() - 1 or since > history.seq
+        first_seq = 1 if reset else since + 1
+        delta = {}
+        for name in keys:
+            points = history.points(name, first_seq)
+            if points:
+                delta[name] = points
+        return {"cursor": history.seq, "epoch": BOOT_ID, "reset": reset, "history": delta}
+
+    def history_delta_json(self, since, kpi=False):
+        history = self.kpi_history if kpi else self.history
+        # Кэшируем только типичные курсоры клиентов: последний и предпоследний
+        if history.seq - 1 <= since <= history.seq:
+            return self._body(("delta", kpi, since), lambda: encode_json(self.history_delta(since, kpi)))
+        return encode_json(self.history_delta(since, kpi))
+
+    def data_dict(self):
+        return {
+            "instance": self.instance,
+            "metrics": self.metrics,
+            "kpi": self.kpi,
+            "categories": self.categories,
+            "prominent": self.prominent,
+            "config": self.config,
+            "history": self.history_dict(),
+            "last_updated": self.last_updated,
+            "error": self.error
+        }
+
+    def _body(self, name, build):
+        # Гонка двух потоков безвредна: оба получат одинаковое тело
+        body = self._bodies.get(name)
+        if body is None:
+            started = time.perf_counter()
+            body = self._bodies[name] = build()
+            SERIALIZE_SECONDS.observe(time.perf_counter() - started, name if isinstance(name, str) else name[0])
+        return body
+
+    def encoded(self, body, encoding):
+        """body в кодировке encoding (None — как есть).
+
+        Сжатие закэшированного тела делается не больше одного раза на снапшот.
+        """
+        if encoding is None:
+            return body
+        key = (id(body), encoding)
+        entry = self._encoded.get(key)
+        if entry is not None and entry[0] is body:
+            return entry[1]
+        data = compress(body, encoding)
+        if any(cached is body for cached in list(self._bodies.values())):
+            self._encoded[key] = (body, data)
+        return data
+
+    def history_json(self):
+        def build():
+            if orjson is None:
+                return encode_json(self.history_dict())
+            # orjson сериализует массивы NumPy сам — без списка пар на каждую точку
+            return orjson.dumps(
+                {name: np.column_stack(to_numpy(*self.history.arrays(name))) for name in self.history_keys},
+                option=orjson.OPT_SERIALIZE_NUMPY)
+        return self._body("history", build)
+
+    def kpi_history_json(self):
+        return self._body("kpi_history", lambda: encode_json(self.kpi_history_dict()))
+
+    def data_json(self, fields=DATA_FIELDS):
+        """Тело /data из полей fields (подмножество DATA_FIELDS)."""
+        fields = tuple(field for field in DATA_FIELDS if field in fields)
+        def build():
+            values = {
+                "instance": self.instance,
+                "metrics": self.metrics,
+                "kpi": self.kpi,
+                "categories": self.categories,
+                "types": self.types,
+                "prominent": self.prominent,
+                "config": self.config,
+                "cursor": self.history.seq,
+                "kpi_cursor": self.kpi_history.seq,
+                "last_updated": self.last_updated,
+                "error": self.error
+            }
+            rest = encode_json({field: values[field] for field in fields if field != "history"})
+            if "history" not in fields:
+                return rest
+            # history уже сериализована для /history — вклеиваем готовые байты
+            return b'{"history":' + self.history_json() + (b',' + rest[1:] if len(rest) > 2 else b'}')
+        return self._body(("data", fields), build)
+
+    def stream_init_event(self):
+        """Первый кадр SSE для нового клиента: полное состояние без истории."""
+        def build():
+            return encode_event("scrape", encode_json({
+                "full": True,
+                "instance": self.instance,
+                "version": self.version,
+                "epoch": BOOT_ID,
+                "cursor": self.history.seq,
+                "kpi_cursor": self.kpi_history.seq,
+                "metrics": self.metrics,
+                "categories": self.categories,
+                "types": self.types,
+                "kpi": self.kpi,
+                "prominent": self.prominent,
+                "config": self.config,
+                "last_updated": self.last_updated,
+                "error": self.error
+            }), self.version)
+        return self._body("stream_init", build)
+
+    def stream_delta_event(self, previous, row):
+        """Кадр SSE относительно предыдущего снапшота.
+
+        row — строка истории этого скрейпа (None, если скрейп не удался):
+        changed — новые и изменившиеся значения, absent — серии, которых
+        в этом скрейпе не было (для них в историю точка не добавляется),
+        removed — серии, удалённые из состояния (вытеснение по TTL, смена
+        конфигурации): клиент забывает их совсем.
+        """
+        if row is None:
+            changed, absent = {}, []
+        else:
+            changed = {key: value for key, value in row.items() if previous.metrics.get(key) != value}
+            absent = [key for key in self.metrics if key not in row]
+        removed = [key for key in previous.metrics if key not in self.metrics]
+        # Словарь типов заменяется целиком только при появлении новых типов
+        types = {} if self.types is previous.types else {
+            name: kind for name, kind in self.types.items() if previous.types.get(name) != kind}
+        return encode_event("scrape", encode_json({
+            "version": self.version,
+            "prev": previous.version,
+            "epoch": BOOT_ID,
+            "cursor": self.history.seq,
+            "kpi_cursor": self.kpi_history.seq,
+            "changed": changed,
+            "absent": absent,
+            "removed": removed,
+            "categories": {key: category for key, category in self.categories.items()
+                           if previous.categories.get(key) != category},
+            "types": types,
+            "kpi": self.kpi,
+            "last_updated": self.last_updated,
+            "error": self.error
+        }), self.version)
@@ -45,11 +45,93 @@ function toggleSpinner(show) {
     if (spinner) spinner.style.display = show ? 'block' : 'none';
 }
 
-async function fetchHistory() {
-    const resp = await fetch('/history');
-    return await resp.json();
+/**
+ * Глубина клиентской истории (сек), как HISTORY_SECONDS на сервере
+ */
+const HISTORY_SECONDS = 3600;
+
+/**
+ * Цель скрейпа из адреса страницы (?instance=...), null — цель по умолчанию
+ */
+const INSTANCE = new URLSearchParams(window.location.search).get('instance');
+
+/**
+ * URL API с параметром instance текущей цели
+ * @param {string} path
+ */
+function apiUrl(path) {
+    if (!INSTANCE) return path;
+    const sep = path.includes('?') ? '&' : '?';
+    return `${path}${sep}instance=${encodeURIComponent(INSTANCE)}`;
 }
 
+/**
+ * Клиентская кольцевая история: первый запрос забирает всю историю,
+ * дальше /history?since=<cursor> отдаёт только новые точки
+ * @param {string} url
+ */
+function createHistoryBuffer(url) {
+    const buffer = {cursor: 0, epoch: null, series: {}, pending: null};
+    function trim(latest) {
+        // Отрезаем точки старше окна истории
+        const cutoff = latest - HISTORY_SECONDS;
+        for (const series of Object.values(buffer.series)) {
+            let drop = 0;
+            while (drop < series.length && series[drop][0] < cutoff) drop++;
+            if (drop) series.splice(0, drop);
+        }
+    }
+    async function fetchDelta() {
+        const sep = url.includes('?') ? '&' : '?';
+        const resp = await fetch(`${url}${sep}since=${buffer.cursor}`);
+        const delta = await resp.json();
+        // Сервер перезапустился, а курсор случайно оказался валидным — начинаем заново
+        if (buffer.epoch !== null && delta.epoch !== buffer.epoch && !delta.reset) {
+            buffer.cursor = 0;
+            buffer.epoch = null;
+            buffer.series = {};
+            return fetchDelta();
+        }
+        if (delta.reset) buffer.series = {};
+        buffer.epoch = delta.epoch;
+        buffer.cursor = delta.cursor;
+        let latest = 0;
+        for (const [name, points] of Object.entries(delta.history)) {
+            const series = buffer.series[name] || (buffer.series[name] = []);
+            for (const point of points) series.push(point);
+            latest = Math.max(latest, series[series.length - 1][0]);
+        }
+        trim(latest);
+        return buffer.series;
+    }
+    /**
+     * Строка истории из кадра /stream; при пропуске строк её догонит update()
+     */
+    buffer.applyRow = function(cursor, epoch, ts, values) {
+        if (buffer.epoch !== epoch || buffer.cursor !== cursor - 1 || buffer.pending) return;
+        for (const [name, value] of Object.entries(values)) {
+            (buffer.series[name] || (buffer.series[name] = [])).push([ts, value]);
+        }
+        buffer.cursor = cursor;
+        trim(ts);
+    };
+    // Параллельные вызовы делят один запрос, чтобы не применить дельту дважды;
+    // если известный курсор уже не меньше target — запрос не нужен
+    buffer.update = function(target) {
+        if (target !== undefined && buffer.epoch !== null && buffer.cursor >= target) {
+            return Promise.resolve(buffer.series);
+        }
+        if (!buffer.pending) {
+            buffer.pending = fetchDelta().finally(() => { buffer.pending = null; });
+        }
+        return buffer.pending;
+    };
+    return buffer;
+}
+
+const metricsHistory = createHistoryBuffer(apiUrl('/history'));
+const kpiHistory = createHistoryBuffer(apiUrl('/history?kpi=1'));
+
 // Получить список игнорируемых метрик из data.config или локально
 function getIgnoreMetrics(config) {
     // Ищем IGNORE_METRICS в config, если нет — используем дефолт
@@ -104,7 +186,7 @@ async function updateProminentMetrics(data) {
         oldCards[card.getAttribute('data-metric')] = card;
     });
     let insertAfter = container.querySelector('.section-title');
-    const history = await fetchHistory();
+    const history = await kpiHistory.update(data.kpi_cursor);
     // Сортируем KPI по приоритету (desc) из PROMINENT_METRICS
     const prominentConfig = data.prominent || window.PROMINENT_METRICS || {};
     const kpiData = data.kpi || {};
@@ -243,7 +325,8 @@ async function updateMetricsSections(data) {
         if (isIgnoredMetric(metricName, data.config)) continue;
         // Фильтрация: только определённые и числовые метрики
         if (typeof data.metrics[metricName] !== 'number' || isNaN(data.metrics[metricName])) continue;
-        const category = getMetricCategory(metricName, data.config);
+        // Категорию считает сервер; getMetricCategory — запасной вариант
+        const category = (data.categories && data.categories[metricName]) || getMetricCategory(metricName, data.config);
         if (!categories[category]) categories[category] = [];
         categories[category].push(metricName);
     }
@@ -261,7 +344,7 @@ async function updateMetricsSections(data) {
         oldSections[sec.getAttribute('data-category')] = sec;
     });
     // Получаем историю для всех метрик
-    const history = await fetchHistory();
+    const history = await metricsHistory.update(data.cursor);
     for (const category of orderedCategories) {
         if (!Array.isArray(categories[category]) || categories[category].length === 0) continue;
         let section = oldSections[category];
@@ -378,7 +461,7 @@ function logJsError(context, err) {
     while (logDiv.children.length > 20) logDiv.removeChild(logDiv.firstChild);
     // Отправляем ошибку на backend
     try {
-        fetch('/log_js_error', {
+        fetch('/log-js-error', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({context, error: err && err.stack ? err.stack : String(err)})
@@ -386,44 +469,55 @@ function logJsError(context, err) {
     } catch (e) {}
 }
 
+/**
+ * Перерисовывает KPI и секции по данным формата /data
+ * @param {object} data
+ */
+async function renderDashboard(data) {
+    try {
+        toggleSpinner(false);
+        if (!data || typeof data !== 'object' || data.error) {
+            document.getElementById('error').style.display = 'block';
+            document.getElementById('error').textContent = data && data.error ? `Error: ${data.error}` : 'No data received';
+            return;
+        }
+        try {
+            await updateProminentMetrics(data);
+        } catch (err) {
+            const errorEl = document.getElementById('error');
+            errorEl.style.display = 'block';
+            errorEl.textContent = `KPI error: ${err.message}`;
+            logJsError('updateProminentMetrics', err);
+        }
+        try {
+            await updateMetricsSections(data);
+        } catch (err) {
+            const errorEl = document.getElementById('error');
+            errorEl.style.display = 'block';
+            errorEl.textContent = `Section error: ${err.message}`;
+            logJsError('updateMetricsSections', err);
+        }
+        document.getElementById('last-updated').textContent =
+            new Date(data.last_updated * 1000).toLocaleString();
+    } catch (err) {
+        toggleSpinner(false);
+        const errorEl = document.getElementById('error');
+        errorEl.style.display = 'block';
+        errorEl.textContent = `Request failed: ${err.message}`;
+        logJsError('updateDashboard', err);
+    }
+}
+
+/**
+ * Поля /data без history: история приходит через буферы /history?since=
+ */
+const DATA_FIELDS = 'instance,metrics,kpi,categories,prominent,config,cursor,kpi_cursor,last_updated,error';
+
 function updateDashboard() {
     toggleSpinner(true);
-    fetch('/data')
+    fetch(apiUrl(`/data?fields=${DATA_FIELDS}`))
         .then(r => r.json())
-        .then(async data => {
-            try {
-                toggleSpinner(false);
-                if (!data || typeof data !== 'object' || data.error) {
-                    document.getElementById('error').style.display = 'block';
-                    document.getElementById('error').textContent = data && data.error ? `Error: ${data.error}` : 'No data received';
-                    return;
-                }
-                try {
-                    await updateProminentMetrics(data);
-                } catch (err) {
-                    const errorEl = document.getElementById('error');
-                    errorEl.style.display = 'block';
-                    errorEl.textContent = `KPI error: ${err.message}`;
-                    logJsError('updateProminentMetrics', err);
-                }
-                try {
-                    await updateMetricsSections(data);
-                } catch (err) {
-                    const errorEl = document.getElementById('error');
-                    errorEl.style.display = 'block';
-                    errorEl.textContent = `Section error: ${err.message}`;
-                    logJsError('updateMetricsSections', err);
-                }
-                document.getElementById('last-updated').textContent =
-                    new Date(data.last_updated * 1000).toLocaleString();
-            } catch (err) {
-                toggleSpinner(false);
-                const errorEl = document.getElementById('error');
-                errorEl.style.display = 'block';
-                errorEl.textContent = `Request failed: ${err.message}`;
-                logJsError('updateDashboard', err);
-            }
-        })
+        .then(renderDashboard)
         .catch(err => {
             toggleSpinner(false);
             const errorEl = document.getElementById('error');
@@ -433,5 +527,156 @@ function updateDashboard() {
         });
 }
 
-setInterval(updateDashboard, UPDATE_INTERVAL);
-updateDashboard();
\ No newline at end of file
+/**
+ * Пауза перед повторным подключением к /stream (мс)
+ */
+const STREAM_RETRY_INTERVAL = 10000;
+
+let pollTimer = null;
+let streamData = null;
+let renderPending = false;
+
+function startPolling() {
+    if (pollTimer) return;
+    pollTimer = setInterval(updateDashboard, UPDATE_INTERVAL);
+    updateDashboard();
+}
+
+function stopPolling() {
+    clearInterval(pollTimer);
+    pollTimer = null;
+}
+
+function scheduleRender() {
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(async () => {
+        renderPending = false;
+        await renderDashboard(streamData);
+    });
+}
+
+/**
+ * Применяет кадр /stream к локальному состоянию и клиентской истории
+ * @param {object} frame
+ * @returns {boolean} false, если кадры были потеряны и нужна пересинхронизация
+ */
+function applyStreamFrame(frame) {
+    if (frame.full) {
+        streamData = {
+            metrics: frame.metrics,
+            categories: frame.categories,
+            types: frame.types || {},
+            kpi: frame.kpi,
+            prominent: frame.prominent,
+            config: frame.config
+        };
+    } else {
+        if (!streamData || frame.version <= streamData.version) return true;
+        if (frame.prev !== streamData.version) return false;
+        (frame.removed || []).forEach(name => {
+            delete streamData.metrics[name];
+            delete streamData.categories[name];
+        });
+        Object.assign(streamData.metrics, frame.changed);
+        Object.assign(streamData.categories, frame.categories);
+        Object.assign(streamData.types, frame.types);
+        streamData.kpi = frame.kpi;
+        if (frame.cursor !== streamData.cursor) {
+            const absent = new Set(frame.absent);
+            const row = {};
+            for (const [name, value] of Object.entries(streamData.metrics)) {
+                if (!absent.has(name)) row[name] = value;
+            }
+            metricsHistory.applyRow(frame.cursor, frame.epoch, frame.last_updated, row);
+            kpiHistory.applyRow(frame.kpi_cursor, frame.epoch, frame.last_updated, frame.kpi);
+        }
+    }
+    streamData.version = frame.version;
+    streamData.cursor = frame.cursor;
+    streamData.kpi_cursor = frame.kpi_cursor;
+    streamData.last_updated = frame.last_updated;
+    streamData.error = frame.error;
+    return true;
+}
+
+// Активные алерты сервера: {alert: переход}
+let activeAlerts = {};
+
+/**
+ * Рисует pending/firing алерты над KPI
+ */
+function renderAlerts() {
+    const container = document.getElementById('alerts');
+    if (!container) return;
+    container.innerHTML = '';
+    Object.values(activeAlerts).forEach(alert => {
+        const item = document.createElement('div');
+        item.className = `alert-item ${alert.severity} ${alert.state}`;
+        const since = new Date(alert.at * 1000).toLocaleTimeString();
+        item.textContent = `${alert.severity.toUpperCase()} ${alert.alert}: ${Number(alert.value).toFixed(2)} ` +
+            `(порог ${Number(alert.threshold).toFixed(2)}), ${alert.state} с ${since}` +
+            (alert.description ? ` — ${alert.description}` : '');
+        container.appendChild(item);
+    });
+}
+
+/**
+ * Применяет переход алерта из потока
+ */
+function applyAlert(alert) {
+    // resolved снимает и firing, и не дождавшийся for pending (alert.previous)
+    if (alert.state === 'resolved') {
+        delete activeAlerts[alert.alert];
+    } else if (alert.state === 'pending' || !activeAlerts[alert.alert]) {
+        activeAlerts[alert.alert] = alert;
+    } else {
+        activeAlerts[alert.alert].state = alert.state;
+    }
+    renderAlerts();
+}
+
+/**
+ * Подписка на /stream; при ошибке — опрос /data, пока поток не восстановится
+ */
+function connectStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const source = new EventSource(apiUrl('/stream'));
+    source.addEventListener('scrape', event => {
+        stopPolling();
+        try {
+            if (!applyStreamFrame(JSON.parse(event.data))) {
+                // Медленный клиент потерял кадры — переподключаемся за полным состоянием
+                source.close();
+                streamData = null;
+                connectStream();
+                return;
+            }
+            scheduleRender();
+        } catch (err) {
+            logJsError('stream', err);
+        }
+    });
+    source.addEventListener('alerts', event => {
+        activeAlerts = {};
+        JSON.parse(event.data).forEach(alert => { activeAlerts[alert.alert] = alert; });
+        renderAlerts();
+    });
+    source.addEventListener('alert', event => {
+        try {
+            applyAlert(JSON.parse(event.data));
+        } catch (err) {
+            logJsError('alert', err);
+        }
+    });
+    source.onerror = () => {
+        source.close();
+        startPolling();
+        setTimeout(connectStream, STREAM_RETRY_INTERVAL);
+    };
+}
+
+connectStream();
@@ -0,0 +1,342 @@
+import json
+import mmap
+import os
+import threading
+from array import array
+import numpy as np
+
+# Запись журнала сегмента: смещение от начала сегмента (мс), id серии, значение
+RECORD = np.dtype([("offset", "<u4"), ("series", "<u4"), ("value", "<f8")])
+# id серии записи-метки для строки без значений: строк на диске столько же, сколько в памяти
+EMPTY_ROW = 0xFFFFFFFF
+
+def _map(path):
+    """Файл целиком через mmap (только чтение); пустой файл — пустой буфер."""
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _write_json(path, payload):
+    # Через временный файл: читатель видит либо старый индекс, либо новый
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def _read_keys(path):
+    """Ключи серий из индекса журнала и длина его целых строк (байты).
+
+    Недописанная при падении последняя строка не учитывается.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    size = data.rfind(b"\n") + 1
+    return [json.loads(line) for line in data[:size].splitlines()], size
+
+class SegmentStore:
+    """История на диске: сегменты по segment_seconds секунд.
+
+    Открытый сегмент — журнал <start>.log из записей RECORD (16 байт) плюс
+    индекс серий <start>.keys: по ключу в JSON на строку, id серии — номер
+    строки. Новая серия дописывает в индекс одну строку, а не переписывает
+    его целиком. Закрытые сегменты фоновое уплотнение переписывает в колонки
+    <start>.col: колонка timestamps и по колонке float64 на серию. Оба вида
+    читаются через mmap и NumPy без разбора текста.
+
+    Для шагов rollup_steps уплотнение заодно пишет <start>.roll — агрегаты
+    корзин ярусов (см. write_rollup): при старте ярусы собираются из них, а
+    сырые сегменты старше raw_retention (expire) можно не хранить.
+    """
+
+    def __init__(self, path, segment_seconds, rollup_steps=()):
+        self.path = path
+        self.segment_seconds = segment_seconds
+        # Корзины шага должны не пересекать границу сегмента
+        self.rollup_steps = tuple(step for step in rollup_steps if segment_seconds % step == 0)
+        os.makedirs(path, exist_ok=True)
+        # Состояние писателя: пишет только коллектор своей цели
+        self._start = None
+        self._file = None
+        self._index = None
+        self._series = None
+        self._ids = None
+        # Уплотнение и чтение не должны увидеть полузаписанный .col
+        self._compact_lock = threading.Lock()
+
+    def _segment_path(self, start, ext):
+        return os.path.join(self.path, f"{start}.{ext}")
+
+    def segments(self):
+        """Начала сегментов на диске по возрастанию."""
+        starts = set()
+        for name in os.listdir(self.path):
+            start, _, ext = name.partition(".")
+            if ext in ("log", "col", "roll") and start.isdigit():
+                starts.add(int(start))
+        return sorted(starts)
+
+    def _open(self, start):
+        self.close()
+        log_path = self._segment_path(start, "log")
+        index_path = self._segment_path(start, "keys")
+        self._series = []
+        self._index = open(index_path, "ab")
+        if self._index.tell():
+            self._series, size = _read_keys(index_path)
+            # Недописанные при падении хвосты индекса и журнала отрезаем
+            if size != self._index.tell():
+                self._index.truncate(size)
+                self._index.seek(0, os.SEEK_END)
+        self._ids = {key: i for i, key in enumerate(self._series)}
+        self._file = open(log_path, "ab")
+        size = self._file.tell()
+        if size % RECORD.itemsize:
+            self._file.truncate(size - size % RECORD.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        self._start = start
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+    def append(self, timestamp, values):
+        """Дописывает строку скрейпа {key: value} в открытый сегмент."""
+        start = int(timestamp - timestamp % self.segment_seconds)
+        if start != self._start:
+            self._open(start)
+        added = [key for key in values if key not in self._ids]
+        if added:
+            for key in added:
+                self._ids[key] = len(self._series)
+                self._series.append(key)
+            # Индекс дописывается раньше записей: у каждой записи на диске есть серия
+            self._index.write("".join(json.dumps(key) + "\n" for key in added).encode("utf-8"))
+            self._index.flush()
+        records = np.empty(len(values) or 1, dtype=RECORD)
+        records["offset"] = int((timestamp - start) * 1000)
+        if values:
+            records["series"] = [self._ids[key] for key in values]
+            records["value"] = list(values.values())
+        else:
+            records["series"] = EMPTY_ROW
+            records["value"] = np.nan
+        self._file.write(records.tobytes())
+        self._file.flush()
+
+    def read_segment(self, start):
+        """(timestamps, keys, matrix[строка, серия]) сегмента или None.
+
+        Колоночный сегмент отдаётся представлениями поверх mmap без копирования.
+        """
+        with self._compact_lock:
+            col_path = self._segment_path(start, "col")
+            if os.path.exists(col_path):
+                with open(self._segment_path(start, "col.json"), encoding="utf-8") as f:
+                    index = json.load(f)
+                data = np.frombuffer(_map(col_path), dtype="<f8")
+                data = data.reshape(len(index["series"]) + 1, index["rows"])
+                return data[0], index["series"], data[1:].T
+            log_path = self._segment_path(start, "log")
+            index_path = self._segment_path(start, "keys")
+            if not os.path.exists(log_path) or not os.path.exists(index_path):
+                return None
+            keys, _ = _read_keys(index_path)
+            buffer = _map(log_path)
+        records = np.frombuffer(buffer, dtype=RECORD, count=len(buffer) // RECORD.itemsize)
+        valid = records["series"] < len(keys)
+        records = records[valid | (records["series"] == EMPTY_ROW)]
+        offsets, rows = np.unique(records["offset"], return_inverse=True)
+        matrix = np.full((len(offsets), len(keys)), np.nan)
+        valid = records["series"] < len(keys)
+        matrix[rows[valid], records["series"][valid]] = records["value"][valid]
+        return start + offsets / 1000.0, keys, matrix
+
+    def read(self, since, until=None):
+        """Строки с since по until со всех сегментов: (timestamps, {key: ndarray})."""
+        parts = []
+        for start in self.segments():
+            if start + self.segment_seconds <= since or (until is not None and start > until):
+                continue
+            segment = self.read_segment(start)
+            if segment is None:
+                continue
+            timestamps, keys, matrix = segment
+            keep = timestamps >= since
+            if until is not None:
+                keep &= timestamps <= until
+            if keep.any():
+                parts.append((timestamps[keep], keys, matrix[keep]))
+        total = sum(len(part[0]) for part in parts)
+        all_keys = list(dict.fromkeys(key for part in parts for key in part[1]))
+        positions = {key: i for i, key in enumerate(all_keys)}
+        result = np.full((total, len(all_keys)), np.nan)
+        timestamps = np.empty(total)
+        row = 0
+        for part_ts, keys, matrix in parts:
+            timestamps[row:row + len(part_ts)] = part_ts
+            result[row:row + len(part_ts), [positions[key] for key in keys]] = matrix
+            row += len(part_ts)
+        return timestamps, {key: result[:, i] for key, i in positions.items()}
+
+    def load_history(self, store, since, until=None, seq=None):
+        """Заполняет HistoryStore строками с since по until (seq — см. HistoryStore.load)."""
+        timestamps, columns = self.read(since, until)
+        store.load(array("d", timestamps.tobytes()),
+                   {key: array("d", np.ascontiguousarray(values).tobytes()) for key, values in columns.items()},
+                   seq, until)
+
+    def write_rollup(self, start, timestamps, keys, matrix):
+        """Пишет агрегаты корзин сегмента для всех rollup_steps.
+
+        <start>.roll — float64 подряд по ярусам: метки корзин, затем матрицы
+        (корзина, серия) min, max, sum, count, last; <start>.roll.json —
+        {"series": keys, "tiers": [[шаг, число корзин], ...]}.
+        """
+        tiers, parts = [], []
+        for step in self.rollup_steps:
+            aggregates = _bucket_aggregates(step, timestamps, matrix)
+            tiers.append([step, len(aggregates[0])])
+            parts.extend(np.ascontiguousarray(part, dtype="<f8").ravel() for part in aggregates)
+        roll_path = self._segment_path(start, "roll")
+        with open(roll_path + ".tmp", "wb") as f:
+            for part in parts:
+                f.write(part.tobytes())
+        _write_json(self._segment_path(start, "roll.json"), {"series": keys, "tiers": tiers})
+        with self._compact_lock:
+            os.replace(roll_path + ".tmp", roll_path)
+
+    def read_rollup(self, start):
+        """(keys, {шаг: агрегаты корзин}) из <start>.roll или None."""
+        with self._compact_lock:
+            roll_path = self._segment_path(start, "roll")
+            if not os.path.exists(roll_path):
+                return None
+            with open(self._segment_path(start, "roll.json"), encoding="utf-8") as f:
+                index = json.load(f)
+            data = np.frombuffer(_map(roll_path), dtype="<f8")
+        keys = index["series"]
+        tiers = {}
+        offset = 0
+        for step, buckets in index["tiers"]:
+            aggregates = [data[offset:offset + buckets]]
+            offset += buckets
+            for _ in range(5):
+                aggregates.append(data[offset:offset + buckets * len(keys)].reshape(buckets, len(keys)))
+                offset += buckets * len(keys)
+            tiers[step] = aggregates
+        return keys, tiers
+
+    def load_rollups(self, rollups, until):
+        """Заполняет пустые ярусы rollups агрегатами строк до until включительно.
+
+        Каждый сегмент читается один раз на все ярусы: готовые корзины из
+        .roll, а для ещё не уплотнённых — агрегация сырых строк.
+        """
+        since = {tier.step: until - tier.step * tier.capacity for tier in rollups.tiers}
+        horizon = min(since.values(), default=until)
+        for start in self.segments():
+            if start + self.segment_seconds <= horizon or start > until:
+                continue
+            rolled = self.read_rollup(start)
+            segment = None
+            for tier in rollups.tiers:
+                if start + self.segment_seconds <= since[tier.step]:
+                    continue
+                if rolled is not None and tier.step in rolled[1]:
+                    keys, aggregates = rolled[0], rolled[1][tier.step]
+                    keep = (aggregates[0] + tier.step > since[tier.step]) & (aggregates[0] <= until)
+                else:
+                    if segment is None:
+                        segment = self.read_segment(start)
+                        if segment is None:
+                            break
+                    timestamps, keys, matrix = segment
+                    rows = (timestamps >= since[tier.step]) & (timestamps <= until)
+                    if not rows.any():
+                        continue
+                    aggregates = _bucket_aggregates(tier.step, timestamps[rows], matrix[rows])
+                    keep = np.ones(len(aggregates[0]), dtype=bool)
+                _merge_aggregates(tier, keys, aggregates, keep)
+
+    def compact(self, now):
+        """Переписывает закрытые журналы в колоночный вид и пишет агрегаты ярусов."""
+        current = now - now % self.segment_seconds
+        for start in self.segments():
+            if start >= current or start == self._start:
+                continue
+            segment = None
+            if os.path.exists(self._segment_path(start, "col")):
+                # Падение между заменой и удалением журнала: журнал уже лишний
+                self._remove(start, ("log", "keys"))
+            else:
+                segment = self.read_segment(start)
+                if segment is None:
+                    continue
+                timestamps, keys, matrix = segment
+                data = np.vstack([timestamps, matrix.T]).astype("<f8")
+                col_path = self._segment_path(start, "col")
+                with open(col_path + ".tmp", "wb") as f:
+                    f.write(data.tobytes())
+                _write_json(self._segment_path(start, "col.json"), {"series": keys, "rows": len(timestamps)})
+                with self._compact_lock:
+                    os.replace(col_path + ".tmp", col_path)
+                self._remove(start, ("log", "keys"))
+            if self.rollup_steps and not os.path.exists(self._segment_path(start, "roll")):
+                segment = segment or self.read_segment(start)
+                if segment is not None:
+                    self.write_rollup(start, *segment)
+
+    def expire(self, now, retention, raw_retention=None):
+        """Удаляет сегменты, целиком вышедшие за retention секунд.
+
+        Сырые строки уже свёрнутых сегментов удаляются раньше — после
+        raw_retention секунд; агрегаты ярусов живут retention.
+        """
+        raw_retention = retention if raw_retention is None else min(raw_retention, retention)
+        for start in self.segments():
+            end = start + self.segment_seconds
+            if start == self._start or end > now - raw_retention:
+                continue
+            if end <= now - retention:
+                self._remove(start, ("log", "keys", "col", "col.json", "roll", "roll.json"))
+            elif not self.rollup_steps or os.path.exists(self._segment_path(start, "roll")):
+                self._remove(start, ("log", "keys", "col", "col.json"))
+
+    def _remove(self, start, extensions):
+        with self._compact_lock:
+            for ext in extensions:
+                try:
+                    os.remove(self._segment_path(start, ext))
+                except FileNotFoundError:
+                    pass
+
+def _bucket_aggregates(step, timestamps, matrix):
+    """Агрегаты строк по корзинам шага step (векторно).
+
+    Возвращает (метки корзин, min, max, sum, count, last) — матрицы
+    (корзина, серия); count и last учитывают только присутствующие значения.
+    """
+    bucket_ts = timestamps - timestamps % step
+    starts = np.flatnonzero(np.r_[True, bucket_ts[1:] != bucket_ts[:-1]])
+    ends = np.r_[starts[1:], len(bucket_ts)] - 1
+    present = ~np.isnan(matrix)
+    minimum = np.fmin.reduceat(matrix, starts, axis=0)
+    maximum = np.fmax.reduceat(matrix, starts, axis=0)
+    total = np.add.reduceat(np.where(present, matrix, 0.0), starts, axis=0)
+    count = np.add.reduceat(present.astype(np.float64), starts, axis=0)
+    # last — значение из последней строки корзины, где серия присутствовала
+    last_row = np.maximum.accumulate(np.where(present, np.arange(len(matrix))[:, None], 0), axis=0)[ends]
+    last = matrix[last_row, np.arange(matrix.shape[1])]
+    return bucket_ts[starts], minimum, maximum, total, count, last
+
+def _merge_aggregates(tier, keys, aggregates, keep):
+    """Вливает в tier корзины aggregates (см. _bucket_aggregates), отмеченные keep."""
+    bucket_ts, minimum, maximum, total, count, last = aggregates
+    for b in np.flatnonzero(keep).tolist():
+        merged = {}
+        for j in np.flatnonzero(count[b]).tolist():
+            merged[keys[j]] = (minimum[b, j], maximum[b, j], total[b, j], int(count[b, j]), last[b, j])
+        tier.merge(float(bucket_ts[b]), merged)
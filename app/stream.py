@@ -0,0 +1,67 @@
+import threading
+from collections import deque
+
+# Сколько кадров держится в очереди клиента; при переполнении старые выбрасываются
+CLIENT_QUEUE_SIZE = 8
+# Пауза, после которой клиенту отправляется комментарий keep-alive
+KEEPALIVE_SECONDS = 15.0
+
+def encode_event(event, data, event_id=None):
+    """Кадр Server-Sent Events; data — уже сериализованный JSON (bytes)."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\n".encode('utf-8') + b"data: " + data + b"\n\n"
+
+class _Client:
+    __slots__ = ("queue", "ready")
+
+    def __init__(self, queue_size):
+        self.queue = deque(maxlen=queue_size)
+        self.ready = threading.Event()
+
+class Broadcaster:
+    """Раздаёт один раз сериализованные кадры всем SSE-клиентам.
+
+    У каждого клиента своя ограниченная очередь: медленный клиент теряет
+    самые старые кадры и не тормозит коллектор и остальных клиентов.
+    """
+
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        client = _Client(self.queue_size)
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def publish(self, frame):
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if len(client.queue) == self.queue_size:
+                self.dropped += 1
+            client.queue.append(frame)
+            client.ready.set()
+
+    def frames(self, client, keepalive=KEEPALIVE_SECONDS):
+        """Генератор кадров клиента; отписывает клиента при закрытии."""
+        try:
+            while True:
+                if not client.ready.wait(keepalive):
+                    yield b": keepalive\n\n"
+                    continue
+                client.ready.clear()
+                while client.queue:
+                    yield client.queue.popleft()
+        finally:
+            self.unsubscribe(client)
@@ -0,0 +1,85 @@
+import logging
+import tempfile
+import threading
+import time
+import requests
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_load(base_url, paths=("/data", "/history"), clients=8, duration=10.0):
+    """N клиентов по кругу запрашивают paths в течение duration секунд.
+
+    Клиент шлёт If-None-Match с последним ETag, как браузер, поэтому в
+    результатах видна и доля ответов 304.
+    """
+    stats = {path: {"latencies": [], "errors": 0, "not_modified": 0} for path in paths}
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        etags = {}
+        while time.monotonic() < deadline:
+            for path in paths:
+                headers = {"If-None-Match": etags[path]} if path in etags else {}
+                started = time.perf_counter()
+                try:
+                    response = session.get(base_url + path, headers=headers, timeout=10)
+                    response.content
+                    elapsed = time.perf_counter() - started
+                except requests.RequestException:
+                    with lock:
+                        stats[path]["errors"] += 1
+                    continue
+                if "ETag" in response.headers:
+                    etags[path] = response.headers["ETag"]
+                with lock:
+                    if response.status_code >= 400:
+                        stats[path]["errors"] += 1
+                    else:
+                        stats[path]["latencies"].append(elapsed)
+                        if response.status_code == 304:
+                            stats[path]["not_modified"] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for path, path_stats in stats.items():
+        latencies = path_stats["latencies"]
+        results[f"load{path}"] = {
+            "requests": len(latencies),
+            "rps": len(latencies) / duration,
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "not_modified": path_stats["not_modified"],
+            "errors": path_stats["errors"]
+        }
+    return {"params": {"clients": clients, "duration": duration, "paths": list(paths)}, "results": results}
+
+def start_app(metrics_url, interval=1.0):
+    """Поднимает дашборд в этом процессе, скрейпящий metrics_url; возвращает base URL.
+
+    Конфиг подменяется до импорта app.metrics, история пишется во временный каталог.
+    """
+    from werkzeug.serving import make_server
+    # Лог каждого запроса werkzeug сам становится узким местом под нагрузкой
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    import app.config as config
+    config.DASHBOARD_DEBUG = False
+    config.METRICS_TARGETS = [{"name": "bench", "url": metrics_url, "interval": interval}]
+    config.HISTORY_DIR = tempfile.mkdtemp(prefix="amity-bench-")
+    from app import create_app
+    from app.metrics import start_metrics_thread
+    start_metrics_thread()
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,88 @@
+import statistics
+import time
+from app.config import METRICS_CONFIG, PROMINENT_METRICS, IGNORE_METRICS
+from app.parser import iter_samples, parse_metrics, MetricFilter
+from app.kpi import KpiPlan
+from app.rates import RateEngine
+from app.history import HistoryStore
+from app.snapshot import Snapshot
+from .payload import generate_payload, generate_sized_payload
+
+def measure(func, repeat=5, number=1):
+    """Секунды на вызов func: медиана и минимум по repeat замерам."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return {"median": statistics.median(timings), "min": min(timings), "repeat": repeat, "number": number}
+
+def _history(samples, rows):
+    store = HistoryStore(rows)
+    for step in range(rows):
+        store.append(float(step), {sample.key: sample.value + step for sample in samples})
+    return store
+
+def _snapshot(store):
+    return Snapshot(version=1, instance="bench", metrics={}, kpi={}, categories={},
+                    history=store.snapshot(), history_keys=list(store.columns),
+                    kpi_history=HistoryStore(1).snapshot(), last_updated=0, error=None,
+                    prominent=PROMINENT_METRICS, config=METRICS_CONFIG)
+
+def run_micro(series=1000, label_cardinality=100, history_rows=600, repeat=5, payload_bytes=None):
+    """Замеры горячих путей коллектора и отдачи истории; результат — dict для JSON.
+
+    payload_bytes — размер экспозиции в байтах вместо числа серий series.
+    """
+    if payload_bytes:
+        payload = generate_sized_payload(payload_bytes, label_cardinality)
+    else:
+        payload = generate_payload(series, label_cardinality)
+    lines = payload.splitlines()
+    samples = list(iter_samples(lines))
+    names = [sample.name for sample in samples]
+    metric_filter = MetricFilter(METRICS_CONFIG, IGNORE_METRICS)
+    kpi_plan = KpiPlan(PROMINENT_METRICS)
+    shown = [sample for sample in samples if metric_filter(sample.name)]
+    store = _history(shown, history_rows)
+    results = {}
+
+    results["parse.iter_samples"] = measure(lambda: list(iter_samples(lines)), repeat)
+    results["parse.iter_samples_filtered"] = measure(
+        lambda: list(iter_samples(lines, metric_filter)), repeat)
+    results["parse.parse_metrics"] = measure(lambda: parse_metrics(payload), repeat)
+    results["filter.cold"] = measure(
+        lambda: [MetricFilter(METRICS_CONFIG, IGNORE_METRICS)(name) for name in names], repeat)
+    results["filter.warm"] = measure(lambda: [metric_filter(name) for name in names], repeat)
+    results["kpi.compute"] = measure(lambda: kpi_plan.compute(samples), repeat, 10)
+    engine = RateEngine(60)
+    clock = [0.0]
+    def rates():
+        clock[0] += 1.0
+        engine.update(clock[0], shown)
+    results["rates.update"] = measure(rates, repeat, 10)
+    row = {sample.key: sample.value for sample in shown}
+    append_store = HistoryStore(history_rows)
+    def append():
+        clock[0] += 1.0
+        append_store.append(clock[0], row)
+    results["history.append"] = measure(append, repeat, 100)
+    results["history.snapshot"] = measure(store.snapshot, repeat, 10)
+    results["history.json"] = measure(lambda: _snapshot(store).history_json(), repeat)
+    results["history.delta_json"] = measure(
+        lambda: _snapshot(store).history_delta_json(store.seq - 1), repeat, 10)
+
+    for result in results.values():
+        result["series"] = len(samples)
+    return {
+        "params": {
+            "series": None if payload_bytes else series,
+            "label_cardinality": label_cardinality,
+            "history_rows": history_rows,
+            "payload_bytes": len(payload.encode("utf-8")),
+            "samples": len(samples),
+            "shown_samples": len(shown)
+        },
+        "results": results
+    }
@@ -0,0 +1,42 @@
+import random
+
+# Семейства синтетической экспозиции: (имя, тип, лейбл с кардинальностью)
+FAMILIES = [
+    ("jetty_server_requests_seconds", "summary", "uri"),
+    ("jvm_memory_used_bytes", "gauge", "id"),
+    ("postgres_rows_inserted_total", "counter", "database"),
+    ("jvm_gc_pause_seconds", "summary", "action"),
+    ("system_load_average_1m", "gauge", None),
+    ("ignored_noise_total", "counter", "shard"),
+]
+
+def generate_payload(series=1000, label_cardinality=100, step=0, seed=1):
+    """Текст экспозиции Prometheus примерно на series серий.
+
+    label_cardinality — число значений «размножающего» лейбла в семействе;
+    step — номер скрейпа: счётчики растут, gauge меняются.
+    """
+    rng = random.Random(seed * 1000003 + step)
+    lines = []
+    per_family = max(1, series // len(FAMILIES))
+    for name, kind, label in FAMILIES:
+        lines.append(f"# HELP {name} synthetic")
+        lines.append(f"# TYPE {name} {kind}")
+        count = 1 if label is None else per_family
+        for i in range(count):
+            labels = "" if label is None else (
+                f'{{{label}="v{i % label_cardinality}",method="POST",status="{200 + i // label_cardinality}",}}')
+            if kind == "summary":
+                lines.append(f"{name}_count{labels} {(i + 1) * (step + 1)}")
+                lines.append(f"{name}_sum{labels} {(i + 1) * (step + 1) * 0.05:.6f}")
+            elif kind == "counter":
+                lines.append(f"{name}{labels} {(i + 1) * (step + 1)}")
+            else:
+                lines.append(f"{name}{labels} {rng.random() * 1e6:.3f}")
+    return "\n".join(lines) + "\n"
+
+def generate_sized_payload(size_bytes, label_cardinality=100, step=0, seed=1):
+    """Экспозиция размером не меньше size_bytes (подбирается число серий)."""
+    sample = generate_payload(1000, label_cardinality, step, seed)
+    series = max(1, int(1000 * size_bytes / len(sample)) + 1)
+    return generate_payload(series, label_cardinality, step, seed)
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from .micro import run_micro
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Для каких полей результата меньше — лучше, а для каких — больше
+LOWER_IS_BETTER = ("median", "p95")
+HIGHER_IS_BETTER = ("rps",)
+
+def compare(results, baseline, threshold):
+    """Регрессии относительно baseline: [(бенчмарк, поле, было, стало, отношение)]."""
+    regressions = []
+    for name, result in results["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for field in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = base.get(field), result.get(field)
+            if not old or new is None:
+                continue
+            ratio = new / old if field in LOWER_IS_BETTER else old / max(new, 1e-12)
+            if ratio > 1 + threshold:
+                regressions.append((name, field, old, new, ratio))
+    return regressions
+
+def run_sized(sizes, label_cardinality, history_rows, repeat):
+    """run_micro для каждого размера экспозиции; бенчмарки — "<имя>@<байт>"."""
+    report = {"params": {"label_cardinality": label_cardinality, "history_rows": history_rows,
+                         "payload_bytes": sizes, "series": None, "sizes": {}}, "results": {}}
+    for size in sizes:
+        sized = run_micro(label_cardinality=label_cardinality, history_rows=history_rows, repeat=repeat,
+                          payload_bytes=size)
+        report["params"]["sizes"][str(size)] = sized["params"]
+        for name, result in sized["results"].items():
+            report["results"][f"{name}@{size}"] = result
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="amity_dashboard benchmarks")
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--label-cardinality", type=int, default=100)
+    parser.add_argument("--payload-bytes", type=int, nargs="+",
+                        help="exposition sizes to benchmark instead of --series (e.g. 100000 1000000)")
+    parser.add_argument("--history-rows", type=int, default=600)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--load", action="store_true", help="also run the HTTP load driver")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown before a result counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    if args.payload_bytes:
+        report = run_sized(args.payload_bytes, args.label_cardinality, args.history_rows, args.repeat)
+    else:
+        report = run_micro(args.series, args.label_cardinality, args.history_rows, args.repeat)
+    if args.load:
+        from .stub_server import StubServer
+        from .load import run_load, start_app
+        # Та же экспозиция, что у микробенчмарков: с --payload-bytes нагрузка
+        # гоняется на каждом размере, результаты — "<имя>@<байт>"
+        sizes = args.payload_bytes or [None]
+        stub = StubServer(args.series, args.label_cardinality, payload_bytes=sizes[0]).start()
+        base_url = start_app(stub.url)
+        for size in sizes:
+            if size != sizes[0]:
+                stub.generate(args.series, size)
+            # Даём коллектору накопить историю перед замером
+            time.sleep(3)
+            load = run_load(base_url, clients=args.clients, duration=args.duration)
+            report["params"].update(load["params"])
+            for name, result in load["results"].items():
+                report["results"][name if size is None else f"{name}@{size}"] = result
+        stub.stop()
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time()
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name, result in sorted(report["results"].items()):
+        if "median" in result:
+            print(f"{name:32} {result['median'] * 1000:10.3f} ms")
+        else:
+            print(f"{name:32} {result['rps']:10.1f} rps  p95 {(result['p95'] or 0) * 1000:.1f} ms  errors {result['errors']}")
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    params = baseline.get("params", {})
+    if (params.get("series"), params.get("payload_bytes")) != (report["params"]["series"],
+                                                               report["params"]["payload_bytes"]):
+        print("Warning: baseline was recorded with different parameters")
+    regressions = compare(report, baseline, args.threshold)
+    for name, field, old, new, ratio in regressions:
+        print(f"REGRESSION {name}.{field}: {old:.6g} -> {new:.6g} ({ratio:.2f}x)")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
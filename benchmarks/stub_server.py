@@ -0,0 +1,75 @@
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .payload import generate_payload, generate_sized_payload
+
+class StubServer:
+    """Локальный /metrics с синтетической экспозицией.
+
+    Тела на pregenerate скрейпов готовятся заранее и отдаются по кругу,
+    чтобы генерация не искажала замеры коллектора. payload_bytes задаёт
+    размер тела вместо числа серий (как generate_sized_payload в
+    микробенчмарках); generate меняет экспозицию на ходу.
+    """
+
+    def __init__(self, series=1000, label_cardinality=100, host="127.0.0.1", port=0, pregenerate=10,
+                 payload_bytes=None):
+        self.label_cardinality = label_cardinality
+        self.pregenerate = pregenerate
+        self.generate(series, payload_bytes)
+        stub = self
+        counter = [0]
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                bodies = stub.bodies
+                body = bodies[counter[0] % len(bodies)]
+                counter[0] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}/metrics"
+
+    def generate(self, series, payload_bytes=None):
+        """Готовит тела скрейпов: series серий или payload_bytes байт."""
+        if payload_bytes:
+            bodies = [generate_sized_payload(payload_bytes, self.label_cardinality, step)
+                      for step in range(self.pregenerate)]
+        else:
+            bodies = [generate_payload(series, self.label_cardinality, step) for step in range(self.pregenerate)]
+        self.bodies = [body.encode("utf-8") for body in bodies]
+        self.payload_bytes = len(self.bodies[0])
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Prometheus /metrics endpoint")
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--label-cardinality", type=int, default=100)
+    parser.add_argument("--payload-bytes", type=int, help="exposition size instead of --series")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    server = StubServer(args.series, args.label_cardinality, host="0.0.0.0", port=args.port,
+                        payload_bytes=args.payload_bytes)
+    print(f"Serving {server.payload_bytes} bytes at {server.url}")
+    server.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Настройки gunicorn для wsgi:app (подхватываются из текущего каталога).
+
+Каждая открытая вкладка держит ответ /stream (SSE) всё время, пока открыта,
+поэтому воркеры — потоковые: sync-воркер занимался бы одним потоком целиком
+и убивался бы по timeout посреди потока. Потоков на воркер — столько,
+сколько вкладок он должен держать плюс запас на обычные запросы.
+
+Каждый воркер держит свою копию истории: кольцо HISTORY_SECONDS сырых строк
+(8 байт на строку и серию) плюс ярусы HISTORY_TIERS (~100 КБ на серию при
+настройках по умолчанию) и при старте поднимает их с диска. Память и время
+старта растут с числом воркеров, поэтому воркеров по умолчанию мало, а
+параллельность — потоками; фактический объём на воркер —
+amity_dashboard_history_bytes на /self/metrics.
+"""
+
+bind = "0.0.0.0:5000"
+workers = 2
+worker_class = "gthread"
+threads = 64
+# В gthread timeout следит за живостью воркера, а не за длиной запроса
+timeout = 30
+# Без preload: каждый воркер сам подписывается на фид коллектора
+preload_app = False
@@ -3,4 +3,7 @@ from app import create_app
 app = create_app()
 
 if __name__ == "__main__":
+    # Dev-сервер: скрейп в этом же процессе. Production — app/collector.py и wsgi.py
+    from app.metrics import start_metrics_thread
+    start_metrics_thread()
     app.run(host="0.0.0.0", port=5000, threaded=True)
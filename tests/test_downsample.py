@@ -0,0 +1,59 @@
+from array import array
+import numpy as np
+import pytest
+from app.downsample import bucket_aggregate, check_max_points, downsample, lttb
+
+def _series(n):
+    timestamps = np.arange(n, dtype=np.float64)
+    values = np.sin(timestamps / 7.0) * 10 + timestamps / 50.0
+    return timestamps, values
+
+def test_lttb_keeps_endpoints_and_point_count():
+    timestamps, values = _series(1000)
+    ts, vals = lttb(timestamps, values, 50)
+    assert len(ts) == len(vals) == 50
+    assert ts[0] == timestamps[0] and ts[-1] == timestamps[-1]
+    assert np.all(np.diff(ts) > 0)
+    # Выбранные точки — точки исходного ряда
+    assert np.array_equal(vals, values[ts.astype(int)])
+
+def test_lttb_returns_short_series_unchanged():
+    timestamps, values = _series(10)
+    ts, vals = lttb(timestamps, values, 10)
+    assert ts is timestamps and vals is values
+
+@pytest.mark.parametrize("agg", ["avg", "min", "max", "minmax"])
+@pytest.mark.parametrize("max_points", [2, 3, 7, 100])
+def test_bucket_aggregate_stays_within_max_points(agg, max_points):
+    timestamps, values = _series(1001)
+    ts, vals = bucket_aggregate(timestamps, values, max_points, agg)
+    assert 0 < len(ts) <= max_points
+    assert len(ts) == len(vals)
+    assert np.all(np.diff(ts) > 0)
+
+def test_minmax_keeps_extremes():
+    timestamps, values = _series(1000)
+    _, vals = bucket_aggregate(timestamps, values, 20, "minmax")
+    assert vals.min() == values.min() and vals.max() == values.max()
+
+def test_downsample_drops_gaps():
+    timestamps = array('d', [1.0, 2.0, 3.0, 4.0])
+    values = array('d', [1.0, float("nan"), 3.0, 4.0])
+    assert downsample(timestamps, values, None) == [[1.0, 1.0], [3.0, 3.0], [4.0, 4.0]]
+
+@pytest.mark.parametrize("agg, max_points", [("lttb", 1), ("lttb", 2), ("minmax", 1)])
+def test_unreachable_max_points_is_rejected(agg, max_points):
+    assert check_max_points(max_points, agg) is not None
+    timestamps, values = _series(100)
+    with pytest.raises(ValueError):
+        downsample(array('d', timestamps), array('d', values), max_points, agg)
+
+@pytest.mark.parametrize("agg", ["lttb", "avg", "minmax"])
+def test_zero_max_points_disables_downsampling(agg):
+    assert check_max_points(0, agg) is None
+    timestamps, values = _series(100)
+    assert len(downsample(array('d', timestamps), array('d', values), 0, agg)) == 100
+
+def test_unknown_agg_is_rejected():
+    with pytest.raises(ValueError):
+        downsample(array('d'), array('d'), 10, "median")
@@ -0,0 +1,94 @@
+from array import array
+from app.history import HistoryStore, Rollups
+from app.snapshot import Snapshot
+
+def _store(capacity, rows):
+    store = HistoryStore(capacity)
+    for i in range(1, rows + 1):
+        store.append(float(i), {"a": i * 10.0})
+    return store
+
+def test_ring_keeps_last_capacity_rows():
+    store = _store(4, 6)
+    assert store.seq == 6
+    assert store.first_seq() == 3
+    assert store.points("a") == [[3.0, 30.0], [4.0, 40.0], [5.0, 50.0], [6.0, 60.0]]
+    timestamps, values = store.arrays("a", 5)
+    assert list(timestamps) == [5.0, 6.0] and list(values) == [50.0, 60.0]
+    assert [timestamp for timestamp, _ in store.rows()] == [3.0, 4.0, 5.0, 6.0]
+
+def test_new_series_is_aligned_with_older_rows():
+    store = _store(4, 2)
+    store.append(3.0, {"b": 1.0})
+    timestamps, values = store.arrays("b")
+    assert list(timestamps) == [1.0, 2.0, 3.0]
+    assert values[2] == 1.0 and values[0] != values[0] and values[1] != values[1]
+
+def test_seq_at_across_wrap():
+    store = _store(4, 6)
+    assert store.seq_at(0.0) == 3
+    assert store.seq_at(4.0) == 4
+    assert store.seq_at(5.5) == 6
+    assert store.seq_at(7.0) == 7
+
+def test_load_places_rows_by_seq():
+    store = HistoryStore(4)
+    store.load(array('d', [7.0, 8.0, 9.0]), {"a": array('d', [70.0, 80.0, 90.0])}, seq=9)
+    assert store.seq == 9
+    assert store.first_seq() == 6
+    assert store.seq_at(8.0) == 8
+    assert store.points("a") == [[7.0, 70.0], [8.0, 80.0], [9.0, 90.0]]
+    # Следующая строка продолжает нумерацию
+    store.append(10.0, {"a": 100.0})
+    assert store.points("a", 10) == [[10.0, 100.0]]
+
+def test_view_drops_rows_the_writer_may_overwrite():
+    store = _store(4, 6)
+    view = store.snapshot()
+    # Самая старая строка — слот, который следующий append пишет прямо сейчас
+    assert [ts for ts, _ in view.points("a")] == [4.0, 5.0, 6.0]
+    store.append(7.0, {"a": 70.0})
+    store.append(8.0, {"a": 80.0})
+    timestamps, values = view.arrays("a")
+    assert list(timestamps) == [6.0]
+    assert list(values) == [60.0]
+    assert view.points("a") == [[6.0, 60.0]]
+
+def _snapshot(history):
+    return Snapshot(1, "test", {}, {}, {}, history.snapshot(), ["a"], HistoryStore(1).snapshot(),
+                    None, None, {}, [])
+
+def test_history_delta_returns_rows_after_cursor():
+    store = _store(8, 5)
+    delta = _snapshot(store).history_delta(3)
+    assert delta["cursor"] == 5 and not delta["reset"]
+    assert delta["history"] == {"a": [[4.0, 40.0], [5.0, 50.0]]}
+    assert _snapshot(store).history_delta(5)["history"] == {}
+
+def test_history_delta_resets_stale_cursor():
+    store = _store(4, 10)
+    for since in (2, 11):
+        delta = _snapshot(store).history_delta(since)
+        assert delta["reset"]
+        assert [ts for ts, _ in delta["history"]["a"]] == [8.0, 9.0, 10.0]
+
+def test_rollup_tier_aggregates_buckets():
+    rollups = Rollups([(10, 100)])
+    for i in range(25):
+        rollups.add(float(i), {"a": float(i)})
+    tier = rollups.tiers[0]
+    timestamps, averages = tier.arrays("a")
+    assert list(timestamps) == [0.0, 10.0, 20.0]
+    assert list(averages) == [4.5, 14.5, 22.0]
+    assert list(tier.arrays("a", field="max")[1]) == [9.0, 19.0, 24.0]
+
+def test_choose_picks_source_covering_window():
+    rollups = Rollups([(10, 6 * 3600), (60, 24 * 3600), (600, 7 * 86400)])
+    steps = lambda window, max_points=None: getattr(rollups.choose(window, max_points, 1, 3600), "step", None)
+    assert steps(3600) is None
+    # Окно чуть длиннее сырой истории (часы клиента) — допуск в один шаг
+    assert steps(3600.4) is None
+    assert steps(6 * 3600) == 10
+    assert steps(86400) == 60
+    assert steps(7 * 86400) == 600
+    assert steps(6 * 3600, max_points=100) == 60
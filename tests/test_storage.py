@@ -0,0 +1,108 @@
+import os
+import numpy as np
+from app.history import HistoryStore, Rollups
+from app.storage import SegmentStore
+
+SEGMENT = 3600
+
+def _rows():
+    # Две серии через границу сегмента, вторая появляется позже; одна строка пустая
+    rows = []
+    for i in range(40):
+        timestamp = SEGMENT - 200 + i * 10.0
+        values = {"a": float(i)}
+        if i >= 15:
+            values['b{x="1"}'] = i * 2.0
+        rows.append((timestamp, {} if i == 30 else values))
+    return rows
+
+def _write(path, rows, rollup_steps=()):
+    storage = SegmentStore(str(path), SEGMENT, rollup_steps)
+    for timestamp, values in rows:
+        storage.append(timestamp, values)
+    return storage
+
+def _expected(rows, key):
+    return [(timestamp, values[key]) for timestamp, values in rows if key in values]
+
+def _present(timestamps, values):
+    keep = ~np.isnan(values)
+    return list(zip(timestamps[keep].tolist(), values[keep].tolist()))
+
+def test_round_trip(tmp_path):
+    rows = _rows()
+    storage = _write(tmp_path, rows)
+    assert storage.segments() == [0, SEGMENT]
+    timestamps, columns = storage.read(0)
+    assert timestamps.tolist() == [timestamp for timestamp, _ in rows]
+    for key in ("a", 'b{x="1"}'):
+        assert _present(timestamps, columns[key]) == _expected(rows, key)
+
+def test_round_trip_after_reopen(tmp_path):
+    rows = _rows()
+    _write(tmp_path, rows[:20]).close()
+    # Новый писатель дописывает тот же сегмент и продолжает нумерацию серий
+    _write(tmp_path, rows[20:]).close()
+    timestamps, columns = SegmentStore(str(tmp_path), SEGMENT).read(0)
+    assert timestamps.tolist() == [timestamp for timestamp, _ in rows]
+    assert _present(timestamps, columns['b{x="1"}']) == _expected(rows, 'b{x="1"}')
+
+def test_torn_tail_is_ignored(tmp_path):
+    rows = _rows()
+    _write(tmp_path, rows).close()
+    with open(os.path.join(str(tmp_path), f"{SEGMENT}.keys"), "ab") as f:
+        f.write(b'"c')
+    with open(os.path.join(str(tmp_path), f"{SEGMENT}.log"), "ab") as f:
+        f.write(b"\0" * 5)
+    timestamps, columns = SegmentStore(str(tmp_path), SEGMENT).read(0)
+    assert len(timestamps) == len(rows)
+    assert set(columns) == {"a", 'b{x="1"}'}
+
+def test_load_history_keeps_row_count(tmp_path):
+    rows = _rows()
+    storage = _write(tmp_path, rows)
+    store = HistoryStore(100)
+    storage.load_history(store, 0)
+    assert store.seq == len(rows)
+    assert [timestamp for timestamp, _ in store.rows()] == [timestamp for timestamp, _ in rows]
+    assert store.points("a") == [[timestamp, value] for timestamp, value in _expected(rows, "a")]
+
+def test_compact_preserves_rows(tmp_path):
+    rows = _rows()
+    storage = _write(tmp_path, rows, rollup_steps=(10, 60))
+    before = storage.read(0)
+    storage.close()
+    storage = SegmentStore(str(tmp_path), SEGMENT, (10, 60))
+    storage.compact(3 * SEGMENT)
+    names = set(os.listdir(str(tmp_path)))
+    assert {"0.col", "0.roll", f"{SEGMENT}.col", f"{SEGMENT}.roll"} <= names
+    assert "0.log" not in names and "0.keys" not in names
+    after = storage.read(0)
+    assert after[0].tolist() == before[0].tolist()
+    for key, values in before[1].items():
+        assert np.array_equal(after[1][key], values, equal_nan=True)
+
+def _assert_same_tiers(left, right, key):
+    for left_tier, right_tier in zip(left.tiers, right.tiers):
+        for field in left_tier.FIELDS:
+            for left_part, right_part in zip(left_tier.arrays(key, field=field), right_tier.arrays(key, field=field)):
+                assert np.array_equal(np.array(left_part), np.array(right_part), equal_nan=True)
+
+def test_rollups_from_disk_match_raw_rebuild(tmp_path):
+    rows = _rows()
+    storage = _write(tmp_path, rows, rollup_steps=(10, 60))
+    storage.close()
+    until = rows[-1][0]
+    raw = Rollups([(10, 3600), (60, 7200)])
+    SegmentStore(str(tmp_path), SEGMENT, (10, 60)).load_rollups(raw, until)
+    timestamps, _ = raw.tiers[1].arrays("a")
+    assert list(timestamps) == sorted({timestamp - timestamp % 60 for timestamp, _ in rows})
+    storage = SegmentStore(str(tmp_path), SEGMENT, (10, 60))
+    storage.compact(3 * SEGMENT)
+    # После уплотнения сырые сегменты можно удалить: ярусы читаются из .roll
+    storage.expire(3 * SEGMENT, retention=10 * SEGMENT, raw_retention=SEGMENT)
+    assert not any(name.endswith((".col", ".log")) for name in os.listdir(str(tmp_path)))
+    rolled = Rollups([(10, 3600), (60, 7200)])
+    storage.load_rollups(rolled, until)
+    for key in ("a", 'b{x="1"}'):
+        _assert_same_tiers(rolled, raw, key)
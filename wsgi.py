@@ -0,0 +1,11 @@
+"""Веб-воркер production-режима: gunicorn wsgi:app (настройки — gunicorn.conf.py).
+
+Скрейпа здесь нет: состояние приходит от коллектора (python -m app.collector),
+поэтому воркеров можно запускать по числу ядер.
+"""
+from app import create_app
+from app.config import COLLECTOR_SOCKET
+from app.metrics import start_replica
+
+app = create_app()
+start_replica(COLLECTOR_SOCKET)